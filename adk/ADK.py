@@ -1,36 +1,85 @@
 import inspect
 import json
+import math
 import os
 import sys
-import Algorithmia
-import os
-import subprocess
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from queue import Empty
 
-from adk.io import create_exception, format_data, format_response
+# asyncio, multiprocessing, the Algorithmia client and the mlops agent's dependencies are imported when they're
+# first used, as importing them takes longer than the rest of the ADK put together
+from adk.client import LazyClient
+from adk.deadline import DeadlineRunner
+from adk.io import create_exception, get_error_type, DeadlineExceeded, format_data, encode_response, loads, BinaryResponse, StreamingResponse, \
+    AsyncStreamingResponse, RenderedStream, Overloaded, ErrorResponse, add_metadata
 from adk.modeldata import ModelData
-from adk.mlops import MLOps
+from adk.pipe import PipeWriter
+from adk.reader import StdinReader, EOF, SHED, BLOCK, OVERLOAD_POLICIES
+from adk.startup import StartupTimes
 
 
 class ADK(object):
-    def __init__(self, apply_func, load_func=None, client=None):
+    def __init__(self, apply_func=None, load_func=None, client=None, apply_batch_func=None, max_batch_size=32,
+                 max_wait_ms=10, model_cache=None, metrics=None, snapshot=None,
+                 response_cache=None, timeout=None, profiling=None, max_queued=None, overload_policy=BLOCK):
         """
         Creates the adk object
-        :param apply_func: A required function that can have an arity of 1-2, depending on if loading occurs
+        :param apply_func: A required function that can have an arity of 1-2, depending on if loading occurs;
+        it may be defined with `async def`, in which case requests are served from an event loop.
+        A generator (or async generator) apply function streams every value it yields back as a separate chunk.
         :param load_func: An optional supplier function used if load time events are required, if a model manifest is provided;
         the function may have a single `manifest` parameter to interact with the model manifest, otherwise must have no parameters.
+        It may also be defined with `async def`, and runs on the same event loop as an async apply function.
         :param client: A Algorithmia Client instance that might be user defined,
          and is used for interacting with a model manifest file; if defined.
+        :param apply_batch_func: An optional function with an arity of 1-2 that receives a list of request inputs
+        and returns a list of results in the same order; an element that is an Exception fails only that request.
+        When provided, requests read from stdin are grouped into batches and apply_func becomes optional.
+        :param max_batch_size: The largest number of requests passed to apply_batch_func at once
+        :param max_wait_ms: How long to wait for more requests to fill a batch once the first one has arrived
+        :param model_cache: An optional ModelCache, used to keep model manifest files on local disk between starts
+        :param metrics: An optional Metrics instance, which times every phase of loading and of each request
+        :param snapshot: An optional Snapshot, the loaded state is saved to it after a successful load, and later starts
+        restore from it instead of loading, for as long as the model manifest is unchanged
+        :param response_cache: An optional ResponseCache, for deterministic apply functions; a request is answered from
+        it without calling apply, unless the request sets `"cache": false`
+        :param timeout: An optional default number of seconds each request may take, a request may set its own with
+        a `"timeout"` (seconds) or `"deadline"` (unix time) field. A request past its deadline gets a TimeoutError
+        response, and one that's already past its deadline when it's read is never applied.
+        :param profiling: An optional Profiling instance, which profiles selected requests and attaches a summary of
+        each profile to the request's response metadata; when None it's configured from the `ADK_PROFILE` environment
+        variable, if that's set
+        :param max_queued: An optional limit on the number of requests read ahead of the ones being processed; when
+        set, requests are read into a queue of that size by a background thread
+        :param overload_policy: What happens to a request read while that queue is full: "block" stops reading stdin
+        until there's room, "reject_newest" answers that request with an Overloaded error, and "shed_oldest" answers
+        the longest waiting request with an Overloaded error to make room; neither is applied
         """
+        construct_start = time.perf_counter()
+        self.startup_times = StartupTimes(IMPORTED)
         self.mlops = None
-        self.FIFO_PATH = "/tmp/algoout"
+        self.mlops_reporter = None
+        self.FIFO_PATH = os.environ.get("ADK_FIFO_PATH", "/tmp/algoout")
 
         if client:
             self.client = client
         else:
-            self.client = Algorithmia.client()
+            # the client is only created once it's used, eg: when a model manifest file is downloaded
+            self.client = LazyClient()
 
-        apply_args, _, _, _, _, _, _ = inspect.getfullargspec(apply_func)
-        self.apply_arity = len(apply_args)
+        if apply_func is None and apply_batch_func is None:
+            raise Exception("an apply function or a batch apply function must be provided")
+        if apply_func:
+            apply_args, _, _, _, _, _, _ = inspect.getfullargspec(apply_func)
+            self.apply_arity = len(apply_args)
+        if apply_batch_func:
+            apply_batch_args, _, _, _, _, _, _ = inspect.getfullargspec(apply_batch_func)
+            self.apply_batch_arity = len(apply_batch_args)
+        self.apply_batch_func = apply_batch_func
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
         if load_func:
             load_args, _, _, _, _, _, _ = inspect.getfullargspec(load_func)
             self.load_arity = len(load_args)
@@ -40,53 +89,303 @@ class ADK(object):
         else:
             self.load_func = None
         self.apply_func = apply_func
+        self.apply_is_async = inspect.iscoroutinefunction(apply_func) or inspect.isasyncgenfunction(apply_func)
+        self.load_is_async = inspect.iscoroutinefunction(load_func)
+        self.event_loop = None
         self.is_local = not os.path.exists(self.FIFO_PATH)
+        self.pipe = PipeWriter(self.FIFO_PATH)
         self.load_result = None
         self.loading_exception = None
         self.manifest_path = "model_manifest.json"
         self.mlops_path = "mlops.json"
-        self.model_data = ModelData(self.client, self.manifest_path)
+        # None for the MLOps defaults
+        self.mlops_agent_dir = None
+        self.mlops_spool_dir = None
+        self.model_cache = model_cache
+        self.metrics = metrics
+        self.snapshot = snapshot
+        self.response_cache = response_cache
+        self.timeout = timeout
+        if profiling is None and os.environ.get("ADK_PROFILE", None):
+            from adk.profiling import from_environment
+            profiling = from_environment()
+        self.profiling = profiling
+        if overload_policy not in OVERLOAD_POLICIES:
+            raise Exception("overload_policy must be one of {}, got '{}'"
+                            .format(", ".join(OVERLOAD_POLICIES), overload_policy))
+        self.max_queued = max_queued
+        self.overload_policy = overload_policy
+        # runs sync apply calls that have a deadline, so that one which overruns can be abandoned
+        self.deadline_runner = DeadlineRunner()
+        self.model_data = ModelData(self.client, self.manifest_path, cache=self.model_cache, metrics=self.metrics)
+        self.startup_times.record("construct", time.perf_counter() - construct_start)
 
     def load(self):
+        load_start = time.perf_counter()
         try:
+            if self.snapshot and self.restore_snapshot():
+                self.record_startup("snapshot_restore", time.perf_counter() - load_start)
+                return
             if self.model_data.available():
                 self.model_data.initialize()
+                self.record_startup("model_data", time.perf_counter() - load_start)
+            load_func_start = time.perf_counter()
             if self.load_func and self.load_arity == 1:
                 self.load_result = self.load_func(self.model_data)
             elif self.load_func:
                 self.load_result = self.load_func()
+            if self.load_is_async:
+                self.load_result = self.run_coroutine(self.load_result)
+            if self.load_func:
+                self.record_startup("load_func", time.perf_counter() - load_func_start)
+            if self.snapshot:
+                self.save_snapshot()
         except Exception as e:
             self.loading_exception = e
+            if self.metrics:
+                self.metrics.count_error(get_error_type(e, loading_exception=True))
         finally:
+            self.record_startup("load", time.perf_counter() - load_start)
+            startup_times = self.startup_times.finish()
+            if os.environ.get("ADK_STARTUP_PROFILE"):
+                sys.stderr.write("adk startup seconds: {}\n".format(json.dumps(startup_times, sort_keys=True)))
+            if self.metrics:
+                self.metrics.record_load("total", time.perf_counter() - load_start)
+                self.metrics.flush()
             if self.is_local:
                 print("loading complete")
             else:
                 print("PIPE_INIT_COMPLETE")
                 sys.stdout.flush()
 
+    def record_startup(self, phase, seconds):
+        self.startup_times.record(phase, seconds)
+        if self.metrics:
+            self.metrics.record_load(phase, seconds)
+
+    def snapshot_key(self):
+        return self.snapshot.key(self.model_data.manifest_paths(), self.load_func)
+
+    def restore_snapshot(self):
+        try:
+            state = self.snapshot.restore(self.snapshot_key())
+        except Exception as e:
+            sys.stderr.write("unable to restore snapshot {}, loading instead: {}\n".format(self.snapshot.path, e))
+            return False
+        if state is None:
+            return False
+        self.model_data.restore_state(state["model_data"])
+        if state["load_result_is_model_data"]:
+            self.load_result = self.model_data
+        else:
+            self.load_result = state["load_result"]
+        return True
+
+    def save_snapshot(self):
+        # load functions often return the model data they were given, which is snapshot separately
+        load_result_is_model_data = self.load_result is self.model_data
+        state = {
+            "load_result": None if load_result_is_model_data else self.load_result,
+            "load_result_is_model_data": load_result_is_model_data,
+            "model_data": self.model_data.snapshot_state(),
+        }
+        try:
+            self.snapshot.save(self.snapshot_key(), state)
+        except Exception as e:
+            sys.stderr.write("unable to save snapshot {}: {}\n".format(self.snapshot.path, e))
+
+    def run_coroutine(self, coroutine):
+        if self.event_loop is None:
+            import asyncio
+            self.event_loop = asyncio.new_event_loop()
+        return self.event_loop.run_until_complete(coroutine)
+
+    def call_apply(self, payload):
+        if self.load_result and self.apply_arity == 2:
+            return self.apply_func(payload, self.load_result)
+        else:
+            return self.apply_func(payload)
+
     def apply(self, payload):
+        if self.apply_func is None:
+            return self.apply_batch([payload])[0]
+        if self.apply_is_async:
+            response_obj = self.run_coroutine(self.apply_async(payload))
+            if isinstance(response_obj, AsyncStreamingResponse):
+                response_obj = self.run_coroutine(response_obj.render())
+            return response_obj
+        metrics = self.metrics
+        reporter = self.mlops_reporter
+        if metrics or reporter:
+            apply_start = time.perf_counter()
+            format_start = None
         try:
-            if self.load_result and self.apply_arity == 2:
-                apply_result = self.apply_func(payload, self.load_result)
+            apply_result = self.call_apply(payload)
+            if inspect.isgenerator(apply_result):
+                return StreamingResponse(apply_result, self.stream_reporter(payload, apply_start) if reporter else None)
+            if metrics or reporter:
+                format_start = time.perf_counter()
+                if metrics:
+                    metrics.observe("apply", format_start - apply_start)
+                if reporter:
+                    reporter.record(payload, apply_result, format_start - apply_start)
+            response_obj = encode_response(apply_result)
+            if metrics:
+                metrics.observe("format_response", time.perf_counter() - format_start)
+            return response_obj
+        except Exception as e:
+            if metrics:
+                if format_start is None:
+                    metrics.observe("apply", time.perf_counter() - apply_start)
+                metrics.count_error(get_error_type(e))
+            response_obj = create_exception(e)
+            return response_obj
+
+    def stream_reporter(self, payload, apply_start):
+        # a stream is reported once it has been produced; its chunks aren't a single prediction, so it's only counted
+        def report():
+            self.mlops_reporter.record(payload, None, time.perf_counter() - apply_start)
+        return report
+
+    def report_when_done(self, payload):
+        """
+        Reports a prediction made in a worker process once its future completes, from its encoded response; the
+        latency is measured from when the request was submitted to the pool
+        """
+        submitted = time.perf_counter()
+
+        def report(future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            response = future.result()
+            if isinstance(response, ErrorResponse):
+                return
+            if isinstance(response, str):
+                prediction = loads(response).get("result")
             else:
-                apply_result = self.apply_func(payload)
-            response_obj = format_response(apply_result)
+                # streamed and binary responses are only counted
+                prediction = None
+            self.mlops_reporter.record(payload, prediction, time.perf_counter() - submitted)
+        return report
+
+    def apply_profiled(self, payload):
+        response, report = self.profiling.profile(self.apply, payload)
+        if report is None:
+            # another request was being profiled
+            return response
+        return add_metadata(response, {"profile": report})
+
+    async def apply_async(self, payload):
+        metrics = self.metrics
+        reporter = self.mlops_reporter
+        if metrics or reporter:
+            apply_start = time.perf_counter()
+            format_start = None
+        try:
+            apply_result = self.call_apply(payload)
+            if inspect.isasyncgen(apply_result):
+                return AsyncStreamingResponse(apply_result,
+                                              self.stream_reporter(payload, apply_start) if reporter else None)
+            apply_result = await apply_result
+            if metrics or reporter:
+                format_start = time.perf_counter()
+                if metrics:
+                    metrics.observe("apply", format_start - apply_start)
+                if reporter:
+                    reporter.record(payload, apply_result, format_start - apply_start)
+            response_obj = encode_response(apply_result)
+            if metrics:
+                metrics.observe("format_response", time.perf_counter() - format_start)
             return response_obj
         except Exception as e:
+            if metrics:
+                if format_start is None:
+                    metrics.observe("apply", time.perf_counter() - apply_start)
+                metrics.count_error(get_error_type(e))
             response_obj = create_exception(e)
             return response_obj
 
+    async def apply_async_profiled(self, payload):
+        # other coroutines that run while this one awaits are part of its profile too
+        session = self.profiling.start()
+        if session is None:
+            return await self.apply_async(payload)
+        try:
+            response = await self.apply_async(payload)
+        finally:
+            report = self.profiling.finish(session)
+        if report is None:
+            return response
+        return add_metadata(response, {"profile": report})
+
+    async def apply_async_before_deadline(self, payload, deadline, apply_async=None):
+        import asyncio
+        apply_async = apply_async or self.apply_async
+        try:
+            response = await asyncio.wait_for(apply_async(payload), max(deadline - time.monotonic(), 0))
+            return self.limit_stream(response, deadline)
+        except asyncio.TimeoutError:
+            # wait_for has cancelled the apply coroutine
+            return self.timeout_response()
+
+    def apply_batch(self, payloads):
+        metrics = self.metrics
+        reporter = self.mlops_reporter
+        try:
+            if metrics or reporter:
+                apply_start = time.perf_counter()
+            if self.load_result and self.apply_batch_arity == 2:
+                apply_results = self.apply_batch_func(payloads, self.load_result)
+            else:
+                apply_results = self.apply_batch_func(payloads)
+            apply_results = list(apply_results)
+            if len(apply_results) != len(payloads):
+                raise Exception("batch apply function returned {} results for {} requests"
+                                .format(len(apply_results), len(payloads)))
+        except Exception as e:
+            if metrics:
+                metrics.count_error(get_error_type(e))
+            return [create_exception(e)] * len(payloads)
+        if metrics or reporter:
+            format_start = time.perf_counter()
+            if metrics:
+                metrics.observe("apply_batch", format_start - apply_start)
+                metrics.increment("batches")
+        responses = []
+        for payload, apply_result in zip(payloads, apply_results):
+            if isinstance(apply_result, Exception):
+                if metrics:
+                    metrics.count_error(get_error_type(apply_result))
+                responses.append(create_exception(apply_result))
+                continue
+            if reporter:
+                # every request in the batch waited for the whole batch
+                reporter.record(payload, apply_result, format_start - apply_start)
+            try:
+                responses.append(encode_response(apply_result))
+            except Exception as e:
+                if metrics:
+                    metrics.count_error(get_error_type(e))
+                responses.append(create_exception(e))
+        if metrics:
+            metrics.observe("format_response", time.perf_counter() - format_start)
+        return responses
+
     def write_to_pipe(self, payload, pprint=print):
+        if isinstance(payload, (StreamingResponse, RenderedStream)):
+            for record in payload.records():
+                self.write_to_pipe(record, pprint=pprint)
+            return
         if self.is_local:
             if isinstance(payload, dict):
                 raise Exception(payload)
+            elif isinstance(payload, BinaryResponse):
+                pprint(str(payload))
             else:
                 pprint(payload)
         else:
             if os.name == "posix":
-                with open(self.FIFO_PATH, "w") as f:
-                    f.write(payload)
-                    f.write("\n")
+                self.pipe.write(payload)
                 sys.stdout.flush()
             if os.name == "nt":
                 sys.stdin = payload
@@ -98,14 +397,420 @@ class ADK(object):
     def mlops_init(self):
         mlops_token = os.environ.get("DATAROBOT_MLOPS_API_TOKEN", None)
         if mlops_token:
-            self.mlops = MLOps(mlops_token, self.mlops_path)
-            self.mlops.init()
+            from adk.mlops import MLOps
+            self.mlops = MLOps(mlops_token, self.mlops_path, self.mlops_agent_dir, self.mlops_spool_dir)
+            # the agent starts up while the algorithm loads, predictions are buffered until it's running
+            self.mlops.start_in_background()
+            self.mlops_reporter = self.mlops.reporter()
         else:
             raise Exception("'DATAROBOT_MLOPS_API_TOKEN' was not found, please set to use mlops.")
 
-    def init(self, local_payload=None, pprint=print, mlops=False):
+    def process_line(self, line, received=None):
+        if received is None:
+            received = time.monotonic()
+        metrics = self.metrics
+        if metrics:
+            loads_start = time.perf_counter()
+            request = loads(line)
+            format_start = time.perf_counter()
+            formatted_input = format_data(request)
+            metrics.observe("json_loads", format_start - loads_start)
+            metrics.observe("format_data", time.perf_counter() - format_start)
+        else:
+            request = loads(line)
+            formatted_input = format_data(request)
+        if self.loading_exception:
+            return create_exception(self.loading_exception, loading_exception=True)
+        deadline, response = self.checked_deadline(request, received)
+        if response is not None:
+            return response
+        if self.response_cache is None and deadline is None and self.profiling is None:
+            return self.apply(formatted_input)
+        key, response = self.immediate_response(line, request, formatted_input, deadline)
+        if response is None:
+            apply = self.apply
+            if self.profiling and self.profiling.selected(request):
+                # a response carrying its profile isn't cached
+                apply, key = self.apply_profiled, None
+            if deadline is None:
+                response = apply(formatted_input)
+            else:
+                response = self.limit_stream(self.apply_before_deadline(formatted_input, deadline, apply), deadline)
+            if key is not None:
+                response = self.response_cache.put(key, response)
+        return response
+
+    def request_deadline(self, request, received):
+        """
+        :param received: When the request was read, from time.monotonic, None for now
+        :return: The time.monotonic time the request must be answered by, or None when it has no deadline
+        """
+        if received is None:
+            received = time.monotonic()
+        for field in ("deadline", "timeout"):
+            value = request.get(field, None)
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))
+                                      or not math.isfinite(value)):
+                raise Exception("the request's {} must be a number, got {}".format(field, json.dumps(value)))
+        if request.get("deadline", None) is not None:
+            return received + (request["deadline"] - time.time())
+        timeout = request.get("timeout", self.timeout)
+        if timeout is None:
+            return None
+        return received + timeout
+
+    def checked_deadline(self, request, received):
+        """
+        :return: A tuple of the request's deadline and None, or of None and an error response when its deadline or
+        timeout isn't valid
+        """
+        try:
+            return self.request_deadline(request, received), None
+        except Exception as e:
+            if self.metrics:
+                self.metrics.count_error(get_error_type(e))
+            return None, create_exception(e)
+
+    def timeout_response(self):
+        if self.metrics:
+            self.metrics.count_error(DeadlineExceeded.error_type)
+        return create_exception(DeadlineExceeded("the request did not complete before its deadline"))
+
+    def limit_stream(self, response, deadline):
+        # a stream is produced as it's written, after apply has returned, so its deadline is checked between chunks
+        if isinstance(response, (StreamingResponse, AsyncStreamingResponse)):
+            response.limit(deadline, self.timeout_response)
+        return response
+
+    def runners_exhausted_response(self):
+        if self.metrics:
+            self.metrics.count_error(Overloaded.error_type)
+        return create_exception(Overloaded("the request was refused as {} apply calls that overran their deadline "
+                                           "are still running".format(self.deadline_runner.max_abandoned)))
+
+    def overloaded_response(self):
+        if self.metrics:
+            self.metrics.count_error(Overloaded.error_type)
+        return create_exception(Overloaded("the request was shed as the algorithm's request queue was full"))
+
+    def stdin_reader(self):
+        return StdinReader(sys.stdin, self.max_queued, self.overload_policy, self.metrics)
+
+    def read_requests(self):
+        """
+        :return: An iterator of tuples of each request line and when it was read, from time.monotonic, or None when
+        it's read as it's needed; with SHED in place of the line of a request that was shed from the read-ahead queue
+        """
+        if self.max_queued is None:
+            for line in sys.stdin:
+                yield line, None
+            return
+        reader = self.stdin_reader()
+        while True:
+            line, received = reader.get_entry()
+            if line is EOF:
+                return
+            yield line, received
+
+    def process_queued(self, pprint=print):
+        for line, received in self.read_requests():
+            if line is SHED:
+                response = self.overloaded_response()
+            else:
+                response = self.process_line(line, received)
+            self.write_to_pipe(response, pprint=pprint)
+            self.response_written()
+
+    def immediate_response(self, line, request, formatted_input, deadline):
+        """
+        Finds the response to a request that doesn't need to be applied: a loading error, a request that's already
+        past its deadline, or a cached response
+        :return: A tuple of the request's response cache key and its immediate response, if it has one
+        """
+        if self.loading_exception:
+            return None, create_exception(self.loading_exception, loading_exception=True)
+        if deadline is not None and time.monotonic() >= deadline:
+            if self.metrics:
+                self.metrics.increment("requests_expired")
+            return None, self.timeout_response()
+        return self.cached_response(line, request, formatted_input)
+
+    def apply_before_deadline(self, formatted_input, deadline, apply=None):
+        future = self.deadline_runner.submit(apply or self.apply, formatted_input)
+        if future is None:
+            return self.runners_exhausted_response()
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            # a running thread can't be interrupted, so it's left to finish and later requests run on a new one
+            self.deadline_runner.abandon()
+            return self.timeout_response()
+
+    def cached_response(self, line, request, formatted_input):
+        """
+        :return: A tuple of the request's response cache key, None when the request bypasses the cache,
+        and its cached response, if there is one
+        """
+        if self.response_cache is None or request.get("cache", True) is False:
+            return None, None
+        key = self.response_cache.key(line, formatted_input)
+        response = self.response_cache.get(key)
+        if self.metrics:
+            self.metrics.increment("response_cache_hits" if response is not None else "response_cache_misses")
+        return key, response
+
+    def cache_when_done(self, key):
+        def cache(future):
+            if not future.cancelled() and future.exception() is None:
+                self.response_cache.put(key, future.result())
+        return cache
+
+    def process_instrumented(self, pprint=print):
+        metrics = self.metrics
+        lines = iter(sys.stdin)
+        while True:
+            read_start = time.perf_counter()
+            line = next(lines, None)
+            if line is None:
+                break
+            request_start = time.perf_counter()
+            metrics.observe("stdin_read", request_start - read_start)
+            response = self.process_line(line)
+            write_start = time.perf_counter()
+            self.write_to_pipe(response, pprint=pprint)
+            request_end = time.perf_counter()
+            metrics.observe("write", request_end - write_start)
+            metrics.observe("request", request_end - request_start)
+            metrics.increment("requests")
+            metrics.maybe_flush()
+
+    def response_written(self):
+        if self.metrics:
+            self.metrics.increment("requests")
+            self.metrics.maybe_flush()
+
+    def process_concurrent(self, concurrency, executor, pprint=print):
+        from adk.concurrency import create_executor
+        pool, apply_func, apply_profiled_func = create_executor(self, concurrency, executor)
+        in_flight = deque()
+        try:
+            for line, received in self.read_requests():
+                # Backpressure, stop reading stdin until the oldest request has completed
+                if len(in_flight) >= concurrency:
+                    self.write_to_pipe(self.future_response(*in_flight.popleft(), pool=pool), pprint=pprint)
+                if line is SHED:
+                    future = Future()
+                    future.set_result(self.overloaded_response())
+                    in_flight.append((future, None))
+                    continue
+                request = loads(line)
+                formatted_input = format_data(request)
+                deadline, response = self.checked_deadline(request, received)
+                key = None
+                if response is None:
+                    key, response = self.immediate_response(line, request, formatted_input, deadline)
+                if response is not None:
+                    future = Future()
+                    future.set_result(response)
+                elif self.profiling and self.profiling.selected(request):
+                    future = pool.submit(apply_profiled_func, formatted_input)
+                else:
+                    future = pool.submit(apply_func, formatted_input)
+                    if key is not None:
+                        future.add_done_callback(self.cache_when_done(key))
+                if response is None and executor == "process" and self.mlops_reporter:
+                    # workers don't report, their reporter belongs to the parent
+                    future.add_done_callback(self.report_when_done(formatted_input))
+                in_flight.append((future, deadline))
+                while in_flight and in_flight[0][0].done():
+                    self.write_to_pipe(self.future_response(*in_flight.popleft(), pool=pool), pprint=pprint)
+            while in_flight:
+                self.write_to_pipe(self.future_response(*in_flight.popleft(), pool=pool), pprint=pprint)
+        finally:
+            pool.shutdown()
+
+    async def process_async(self, concurrency, pprint=print):
+        import asyncio
+        from adk.aio import read_queued_lines, read_stdin_lines
+        loop = asyncio.get_running_loop()
+        # A single writer thread keeps responses ordered without blocking the event loop on the FIFO
+        writer = ThreadPoolExecutor(max_workers=1)
+        in_flight = deque()
+
+        async def write(task):
+            response = await task
+            self.response_written()
+            if isinstance(response, AsyncStreamingResponse):
+                async for record in response.records():
+                    await loop.run_in_executor(writer, self.write_to_pipe, record, pprint)
+            else:
+                await loop.run_in_executor(writer, self.write_to_pipe, response, pprint)
+
+        try:
+            if self.max_queued is None:
+                lines = read_stdin_lines()
+            else:
+                lines = read_queued_lines(self.stdin_reader())
+            async for line, received in lines:
+                if len(in_flight) >= concurrency:
+                    await write(in_flight.popleft())
+                if line is SHED:
+                    task = loop.create_future()
+                    task.set_result(self.overloaded_response())
+                    in_flight.append(task)
+                    continue
+                request = loads(line)
+                formatted_input = format_data(request)
+                deadline, response = self.checked_deadline(request, received)
+                key = None
+                if response is None:
+                    key, response = self.immediate_response(line, request, formatted_input, deadline)
+                if response is not None:
+                    task = loop.create_future()
+                    task.set_result(response)
+                else:
+                    apply_async = self.apply_async
+                    if self.profiling and self.profiling.selected(request):
+                        apply_async, key = self.apply_async_profiled, None
+                    if deadline is not None:
+                        task = loop.create_task(self.apply_async_before_deadline(formatted_input, deadline, apply_async))
+                    else:
+                        task = loop.create_task(apply_async(formatted_input))
+                    if key is not None:
+                        task.add_done_callback(self.cache_when_done(key))
+                in_flight.append(task)
+                while in_flight and in_flight[0].done():
+                    await write(in_flight.popleft())
+            while in_flight:
+                await write(in_flight.popleft())
+        finally:
+            writer.shutdown()
+
+    def process_batches(self, pprint=print):
+        reader = self.stdin_reader()
+        max_wait = self.max_wait_ms / 1000.0
+        closed = False
+        while not closed:
+            line, received_at = reader.get_entry()
+            if line is EOF:
+                break
+            lines = [line]
+            received = [received_at]
+            # Once the first request has arrived, wait at most max_wait for the rest of the batch
+            batch_deadline = time.monotonic() + max_wait
+            while len(lines) < self.max_batch_size:
+                try:
+                    line, received_at = reader.get_entry(timeout=batch_deadline - time.monotonic())
+                except Empty:
+                    break
+                if line is EOF:
+                    closed = True
+                    break
+                lines.append(line)
+                received.append(received_at)
+            requests, formatted_inputs, errors = self.decode_batch(lines)
+            responses = self.apply_batch_pending(lines, requests, formatted_inputs, received, errors)
+            for response in responses:
+                self.write_to_pipe(response, pprint=pprint)
+                self.response_written()
+
+    def decode_batch(self, lines):
+        """
+        Decodes and formats each request of a batch on its own, so that a malformed request is answered with an
+        error in its own slot rather than failing the whole batch
+        :return: A tuple of the requests, their formatted inputs, and a dict of the error responses by batch index
+        """
+        requests = []
+        formatted_inputs = []
+        errors = {}
+        for i, line in enumerate(lines):
+            request = formatted_input = None
+            if line is not SHED:
+                try:
+                    request = loads(line)
+                    formatted_input = format_data(request)
+                except Exception as e:
+                    if self.metrics:
+                        self.metrics.count_error(get_error_type(e))
+                    errors[i] = create_exception(e)
+            requests.append(request)
+            formatted_inputs.append(formatted_input)
+        return requests, formatted_inputs, errors
+
+    def apply_batch_pending(self, lines, requests, formatted_inputs, received, errors=None):
+        # only the requests without an immediate response (a cached one, or an expired deadline) are applied
+        keys = []
+        responses = []
+        for i, (line, request, formatted_input, received_at) in enumerate(zip(lines, requests, formatted_inputs,
+                                                                              received)):
+            if line is SHED:
+                keys.append(None)
+                responses.append(self.overloaded_response())
+                continue
+            if errors and i in errors:
+                keys.append(None)
+                responses.append(errors[i])
+                continue
+            deadline, response = self.checked_deadline(request, received_at)
+            key = None
+            if response is None:
+                key, response = self.immediate_response(line, request, formatted_input, deadline)
+            keys.append(key)
+            responses.append(response)
+        pending = [i for i, response in enumerate(responses) if response is None]
+        if pending:
+            # the whole batch is profiled when any of its requests is selected, its profile goes to just those
+            profiled = set(i for i in pending if self.profiling and self.profiling.selected(requests[i]))
+            report = None
+            if profiled:
+                applied, report = self.profiling.profile(self.apply_batch, [formatted_inputs[i] for i in pending])
+            else:
+                applied = self.apply_batch([formatted_inputs[i] for i in pending])
+            for i, response in zip(pending, applied):
+                if i in profiled:
+                    if report is not None:
+                        response = add_metadata(response, {"profile": report})
+                elif keys[i] is not None:
+                    response = self.response_cache.put(keys[i], response)
+                responses[i] = response
+        return responses
+
+    def future_response(self, future, deadline=None, pool=None):
+        self.response_written()
+        # a process pool waits from this thread, so that it can replace workers that die in the meantime
+        result = pool.result if hasattr(pool, "result") else lambda future, timeout: future.result(timeout)
+        try:
+            if deadline is None:
+                return result(future, None)
+            return self.limit_stream(result(future, max(deadline - time.monotonic(), 0)), deadline)
+        except FutureTimeoutError:
+            # a request that hasn't started yet is dropped, one running in a worker process stops with it
+            if not future.cancel() and hasattr(pool, "kill"):
+                pool.kill(future)
+            return self.timeout_response()
+        except Exception as e:
+            # The worker itself failed (eg: a crashed process), rather than the apply function
+            if self.metrics:
+                self.metrics.count_error(get_error_type(e))
+            return create_exception(e)
+
+    def init(self, local_payload=None, pprint=print, mlops=False, concurrency=1, executor="thread"):
+        """
+        Starts the algorithm, loading it and then serving requests until stdin is closed
+        :param local_payload: An optional payload, when provided and running locally it is passed directly to apply
+        :param pprint: The function used to print responses when running locally
+        :param mlops: Enables the DataRobot MLOps agent, the latency and result of every apply call is then reported
+        to the agent's spool in the background
+        :param concurrency: The number of requests that may be processed at once, responses are always
+        written in the order the requests arrived. For an async apply function, this is the number of in-flight coroutines.
+        :param executor: The kind of worker pool used when concurrency is greater than 1, either "thread" or "process";
+        unused for async apply functions. A "process" pool is used even with a concurrency of 1, so that the apply
+        function runs isolated from the parent
+        """
         if mlops and not self.is_local:
+            mlops_start = time.perf_counter()
             self.mlops_init()
+            self.record_startup("mlops_start", time.perf_counter() - mlops_start)
         self.load()
         if self.is_local and local_payload is not None:
             if self.loading_exception:
@@ -113,12 +818,27 @@ class ADK(object):
                 self.write_to_pipe(load_error, pprint=pprint)
             self.process_local(local_payload, pprint)
         else:
-            for line in sys.stdin:
-                request = json.loads(line)
-                formatted_input = format_data(request)
-                if self.loading_exception:
-                    load_error = create_exception(self.loading_exception, loading_exception=True)
-                    self.write_to_pipe(load_error, pprint=pprint)
-                else:
-                    result = self.apply(formatted_input)
-                    self.write_to_pipe(result)
+            if not self.is_local and os.name == "posix":
+                self.pipe.open()
+            if self.apply_batch_func:
+                self.process_batches(pprint)
+            elif self.apply_is_async:
+                self.run_coroutine(self.process_async(concurrency, pprint))
+            elif concurrency > 1 or executor == "process":
+                self.process_concurrent(concurrency, executor, pprint)
+            elif self.max_queued is not None:
+                self.process_queued(pprint)
+            elif self.metrics:
+                self.process_instrumented(pprint)
+            else:
+                for line in sys.stdin:
+                    self.write_to_pipe(self.process_line(line), pprint=pprint)
+            self.pipe.close()
+        if self.mlops_reporter:
+            self.mlops_reporter.close()
+        if self.metrics:
+            self.metrics.flush()
+
+
+# When this module finished being imported, for the startup time breakdown
+IMPORTED = time.perf_counter()
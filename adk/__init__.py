@@ -1 +1,2 @@
-from .ADK import ADK
\ No newline at end of file
+from adk import startup
+from .ADK import ADK
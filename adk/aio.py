@@ -0,0 +1,56 @@
+import asyncio
+import io
+import os
+import stat
+import sys
+from adk.reader import EOF
+
+# asyncio stream readers refuse lines longer than their limit, requests carrying large binary payloads can be big
+STDIN_LINE_LIMIT = 2 ** 28
+
+
+def is_pipe(stream):
+    try:
+        mode = os.fstat(stream.fileno()).st_mode
+    except (AttributeError, ValueError, OSError, io.UnsupportedOperation):
+        return False
+    return stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode) or stat.S_ISCHR(mode)
+
+
+async def read_stdin_lines():
+    """
+    Reads newline delimited requests from stdin without blocking the running event loop, yielding tuples of each
+    line and None, as it's read just as it's needed, like ADK.read_requests.
+    Real pipes are read through an asyncio stream reader, anything else (files, test doubles) is read on a thread.
+    """
+    loop = asyncio.get_running_loop()
+    if not is_pipe(sys.stdin):
+        lines = iter(sys.stdin)
+        while True:
+            line = await loop.run_in_executor(None, next, lines, None)
+            if line is None:
+                break
+            yield line, None
+        return
+    reader = asyncio.StreamReader(limit=STDIN_LINE_LIMIT)
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            yield line, None
+    finally:
+        transport.close()
+
+
+async def read_queued_lines(reader):
+    """
+    Like read_stdin_lines, for requests read ahead into a StdinReader's queue
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        line, received = await loop.run_in_executor(None, reader.get_entry)
+        if line is EOF:
+            return
+        yield line, received
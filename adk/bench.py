@@ -0,0 +1,257 @@
+"""
+Runs an algorithm the way the platform does, as a subprocess fed request envelopes on stdin that writes its
+responses to a FIFO, and reports its cold start time, throughput, latency percentiles and memory use as JSON.
+
+usage: python -m adk.bench path/to/src/Algorithm.py [--requests traffic.jsonl] [--count N] [--rate R]
+                           [--in-flight N] [--warmup N] [--fifo /tmp/algoout] [--output report.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+DEFAULT_REQUEST = {"content_type": "json", "data": "Algorithmia"}
+PERCENTILES = (50, 90, 95, 99)
+
+
+def read_requests(path):
+    """
+    :param path: A file with one request envelope per line, eg: `{"content_type": "json", "data": "Algorithmia"}`
+    """
+    with open(path) as f:
+        requests = [line.strip() for line in f if line.strip()]
+    if not requests:
+        raise Exception("no requests found in {}".format(path))
+    return requests
+
+
+def percentile(ordered, percent):
+    if not ordered:
+        return None
+    return ordered[min(int(len(ordered) * percent / 100.0), len(ordered) - 1)]
+
+
+def rss_kb(pid, field):
+    """
+    :param field: "VmRSS" for the current resident set size, or "VmHWM" for its peak
+    """
+    try:
+        with open("/proc/{}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def default_working_directory(algorithm_path):
+    # algorithms run from their repository root, the parent of `src/`
+    source_dir = os.path.dirname(os.path.abspath(algorithm_path))
+    if os.path.basename(source_dir) == "src":
+        return os.path.dirname(source_dir)
+    return source_dir
+
+
+class Bench(object):
+    def __init__(self, algorithm_path, requests, count, rate=None, in_flight=1, warmup=0, fifo_path=None,
+                 cwd=None, startup_timeout=600.0, python=sys.executable):
+        """
+        :param algorithm_path: The algorithm's entrypoint, eg: src/Algorithm.py
+        :param requests: Request lines, sent in turn and repeated until `count` requests have been sent
+        :param count: The number of requests to send, after the warmup requests
+        :param rate: Requests per second to send at, regardless of how quickly they're answered (an open loop);
+        when None each request is sent as soon as there are fewer than `in_flight` unanswered requests
+        :param in_flight: The most requests waiting on a response at once, when no `rate` is set
+        :param warmup: The number of requests sent first, and left out of the report
+        :param fifo_path: The output FIFO, a temporary one by default
+        :param cwd: The directory the algorithm runs in, its repository root by default
+        :param startup_timeout: The longest time in seconds to wait for the algorithm to load
+        """
+        self.algorithm_path = algorithm_path
+        self.requests = requests
+        self.count = count
+        self.rate = rate
+        self.in_flight = in_flight
+        self.warmup = warmup
+        self.fifo_path = fifo_path
+        self.cwd = cwd or default_working_directory(algorithm_path)
+        self.startup_timeout = startup_timeout
+        self.python = python
+        self.sent = deque()
+        self.latencies = []
+        self.errors = 0
+        self.received = 0
+        self.done = threading.Event()
+        self.initialized = threading.Event()
+        self.window = threading.Semaphore(in_flight)
+        self.reader_error = None
+
+    def run(self):
+        temp_dir = None
+        fifo_path = self.fifo_path
+        if fifo_path is None:
+            temp_dir = tempfile.mkdtemp()
+            fifo_path = os.path.join(temp_dir, "algoout")
+        if not os.path.exists(fifo_path):
+            os.mkfifo(fifo_path)
+        environment = dict(os.environ, ADK_FIFO_PATH=fifo_path, PYTHONUNBUFFERED="1")
+        start = time.monotonic()
+        process = subprocess.Popen([self.python, os.path.abspath(self.algorithm_path)], cwd=self.cwd, env=environment,
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        output = deque(maxlen=50)
+        threading.Thread(target=self.watch_stdout, args=(process.stdout, output), daemon=True).start()
+        threading.Thread(target=self.drain, args=(process.stderr, output), daemon=True).start()
+        reader = threading.Thread(target=self.read_responses, args=(fifo_path,), daemon=True)
+        reader.start()
+        try:
+            if not self.initialized.wait(self.startup_timeout) or process.poll() is not None:
+                raise Exception("the algorithm did not load, its last output was:\n" + "".join(output))
+            cold_start = time.monotonic() - start
+            rss_after_load = rss_kb(process.pid, "VmRSS")
+            total = self.warmup + self.count
+            try:
+                measure_start = self.send(process, total)
+            except BrokenPipeError:
+                process.wait()
+                raise Exception("the algorithm exited with code {} while requests were being sent, its last "
+                                "output was:\n{}".format(process.returncode, "".join(output)))
+            while not self.done.wait(1.0):
+                if process.poll() is not None:
+                    raise Exception("the algorithm exited with code {} before every response was read, its last "
+                                    "output was:\n{}".format(process.returncode, "".join(output)))
+            if self.reader_error:
+                raise self.reader_error
+            duration = time.monotonic() - measure_start
+            peak_rss = rss_kb(process.pid, "VmHWM")
+            process.stdin.close()
+            exit_code = process.wait()
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            if temp_dir:
+                os.remove(fifo_path)
+                os.rmdir(temp_dir)
+        return self.report(cold_start, duration, rss_after_load, peak_rss, exit_code)
+
+    def watch_stdout(self, stdout, output):
+        for line in iter(stdout.readline, b""):
+            decoded = line.decode("utf-8", "replace")
+            output.append(decoded)
+            if decoded.strip() == "PIPE_INIT_COMPLETE":
+                self.initialized.set()
+
+    def drain(self, stream, output):
+        for line in iter(stream.readline, b""):
+            output.append(line.decode("utf-8", "replace"))
+
+    def send(self, process, total):
+        measure_start = time.monotonic()
+        send_start = time.monotonic()
+        for i in range(total):
+            if i == self.warmup:
+                measure_start = time.monotonic()
+            if self.rate:
+                delay = send_start + i / self.rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                while not self.window.acquire(timeout=1.0):
+                    if process.poll() is not None:
+                        raise BrokenPipeError("the algorithm exited")
+            line = self.requests[i % len(self.requests)]
+            self.sent.append(time.monotonic())
+            process.stdin.write(line.encode("utf-8") + b"\n")
+            process.stdin.flush()
+        return measure_start
+
+    def read_responses(self, fifo_path):
+        """
+        Times each response against the oldest request still waiting on one. Responses carry no request id, so this
+        relies on the ADK writing responses in the order their requests arrived, which it does for every executor
+        and concurrency; an algorithm that answered out of order would have its latencies misattributed.
+        """
+        total = self.warmup + self.count
+        try:
+            with open(fifo_path, "rb") as f:
+                for line in f:
+                    record = json.loads(line)
+                    if "chunk" in record:
+                        # part of a streamed response, which is complete once its final record arrives
+                        continue
+                    latency = time.monotonic() - self.sent.popleft()
+                    if self.received >= self.warmup:
+                        self.latencies.append(latency)
+                        if "error" in record:
+                            self.errors += 1
+                    self.received += 1
+                    self.window.release()
+                    if self.received == total:
+                        break
+        except Exception as e:
+            self.reader_error = e
+        self.done.set()
+
+    def report(self, cold_start, duration, rss_after_load, peak_rss, exit_code):
+        ordered = sorted(self.latencies)
+        latency_ms = {"p{}".format(percent): percentile(ordered, percent) * 1000 for percent in PERCENTILES}
+        latency_ms["mean"] = sum(ordered) / len(ordered) * 1000
+        latency_ms["max"] = ordered[-1] * 1000
+        return {
+            "algorithm": self.algorithm_path,
+            "python": platform.python_version(),
+            "requests": len(self.latencies),
+            "warmup_requests": self.warmup,
+            "errors": self.errors,
+            "rate": self.rate,
+            "in_flight": None if self.rate else self.in_flight,
+            "cold_start_seconds": cold_start,
+            "duration_seconds": duration,
+            "throughput_rps": len(self.latencies) / duration if duration > 0 else None,
+            "latency_ms": latency_ms,
+            "rss_mb": {
+                "after_load": rss_after_load / 1024.0 if rss_after_load is not None else None,
+                "peak": peak_rss / 1024.0 if peak_rss is not None else None,
+            },
+            "exit_code": exit_code,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m adk.bench", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("algorithm", help="the algorithm's entrypoint, eg: src/Algorithm.py")
+    parser.add_argument("--requests", help="a file of request envelopes, one JSON object per line, sent in turn "
+                                           "(a single json 'Algorithmia' request by default)")
+    parser.add_argument("--count", type=int, default=1000, help="the number of requests to measure")
+    parser.add_argument("--rate", type=float, help="requests per second, sent regardless of responses")
+    parser.add_argument("--in-flight", type=int, default=1,
+                        help="without --rate, the number of requests sent ahead of their responses")
+    parser.add_argument("--warmup", type=int, default=0, help="requests sent first and left out of the report")
+    parser.add_argument("--fifo", help="the output FIFO path, a temporary one by default")
+    parser.add_argument("--cwd", help="the directory the algorithm runs in, the parent of src/ by default")
+    parser.add_argument("--startup-timeout", type=float, default=600.0)
+    parser.add_argument("--output", help="where to write the JSON report, stdout by default")
+    args = parser.parse_args(argv)
+    if args.requests:
+        requests = read_requests(args.requests)
+    else:
+        requests = [json.dumps(DEFAULT_REQUEST)]
+    bench = Bench(args.algorithm, requests, args.count, rate=args.rate, in_flight=args.in_flight, warmup=args.warmup,
+                  fifo_path=args.fifo, cwd=args.cwd, startup_timeout=args.startup_timeout)
+    report = json.dumps(bench.run(), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 
 class FileData(object):
-    def __init__(self, md5_checksum, file_path):
+    def __init__(self, md5_checksum, file_path, algorithm="md5"):
         self.md5_checksum = md5_checksum
         self.file_path = file_path
+        self.algorithm = algorithm
 
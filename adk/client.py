@@ -0,0 +1,16 @@
+class LazyClient(object):
+    """
+    Stands in for the default Algorithmia client, which is only imported and created when it's first used
+    """
+
+    def __init__(self):
+        self.client = None
+
+    def get(self):
+        if self.client is None:
+            import Algorithmia
+            self.client = Algorithmia.client()
+        return self.client
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
@@ -0,0 +1,59 @@
+from concurrent.futures import ThreadPoolExecutor
+from adk.io import StreamingResponse
+from adk.prefork import PreforkPool
+
+# The algorithm served by forked pool workers, set in the parent before any worker is started
+_worker_algorithm = None
+
+
+def _apply_in_worker(payload):
+    return _rendered(_worker_algorithm.apply(payload))
+
+
+def _apply_profiled_in_worker(payload):
+    return _rendered(_worker_algorithm.apply_profiled(payload))
+
+
+def _rendered(response):
+    if isinstance(response, StreamingResponse):
+        # generators can't be sent back to the parent process, so the stream is produced in the worker
+        response = response.render()
+    return response
+
+
+def _release_parent_state():
+    # the output pipe, metrics and mlops reporting belong to the parent; their locks may have been held when forking
+    _worker_algorithm.pipe.abandon()
+    _worker_algorithm.metrics = None
+    _worker_algorithm.mlops_reporter = None
+
+
+def _finish_downloads():
+    # a forked worker has none of the parent's threads, so a model file still downloading in the background would
+    # never be ready in it; a failed download stays pending, and is raised by get_model as it would be in the parent
+    try:
+        _worker_algorithm.model_data.wait()
+    except Exception:
+        pass
+
+
+def create_executor(algorithm, concurrency, executor):
+    """
+    Creates the worker pool used to run apply calls concurrently
+    :param algorithm: The ADK instance whose `apply` function is executed by the pool
+    :param concurrency: The number of workers in the pool
+    :param executor: Either "thread" or "process"; process workers are forked after loading,
+    so they share the loaded algorithm state copy-on-write. A process that dies is replaced, failing only the
+    request it was processing
+    :return: A tuple of the executor, the function to submit payloads to, and the one to submit payloads of
+    requests selected for profiling to
+    """
+    global _worker_algorithm
+    if executor == "thread":
+        return ThreadPoolExecutor(max_workers=concurrency), algorithm.apply, algorithm.apply_profiled
+    elif executor == "process":
+        _worker_algorithm = algorithm
+        pool = PreforkPool(concurrency, _release_parent_state, before_fork=_finish_downloads)
+        return pool, _apply_in_worker, _apply_profiled_in_worker
+    else:
+        raise Exception("executor must be either 'thread' or 'process', got '{}'".format(executor))
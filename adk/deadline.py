@@ -0,0 +1,57 @@
+import threading
+from concurrent.futures import Future
+from queue import Queue
+
+# How many apply calls that overran their deadline may still be running before requests with a deadline are refused
+MAX_ABANDONED_CALLS = 4
+
+
+def _run_calls(calls):
+    while True:
+        call = calls.get()
+        if call is None:
+            return
+        func, payload, future = call
+        try:
+            future.set_result(func(payload))
+        except Exception as e:
+            future.set_exception(e)
+
+
+class DeadlineRunner(object):
+    def __init__(self, max_abandoned=MAX_ABANDONED_CALLS):
+        """
+        Runs sync apply calls that have a deadline on a daemon thread, so that a call which overruns can be abandoned
+        without keeping the process from exiting. A running thread can't be interrupted, so an abandoned call keeps
+        its thread until it returns; once `max_abandoned` of them are still running, no more calls are accepted.
+        :param max_abandoned: The number of abandoned calls that may still be running at once
+        """
+        self.max_abandoned = max_abandoned
+        self.calls = None
+        self.thread = None
+        self.abandoned = []
+
+    def submit(self, func, payload):
+        """
+        :return: A Future for the call's result, or None when too many abandoned calls are still running
+        """
+        self.abandoned = [thread for thread in self.abandoned if thread.is_alive()]
+        if len(self.abandoned) >= self.max_abandoned:
+            return None
+        if self.thread is None:
+            self.calls = Queue()
+            self.thread = threading.Thread(target=_run_calls, args=(self.calls,), name="adk-deadline-runner",
+                                           daemon=True)
+            self.thread.start()
+        future = Future()
+        self.calls.put((func, payload, future))
+        return future
+
+    def abandon(self):
+        """
+        Leaves the running call to finish on its own, later calls run on a new thread
+        """
+        self.calls.put(None)
+        self.abandoned.append(self.thread)
+        self.calls = None
+        self.thread = None
@@ -0,0 +1,39 @@
+import hashlib
+import mmap
+
+# Digests that may be declared per file in a model manifest as `<name>_checksum`, in order of preference
+SUPPORTED_DIGESTS = ("sha256", "blake2b", "md5")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def expected_digest(file_info):
+    """
+    Finds the digest a model manifest entry should be verified with
+    :param file_info: A `required_files` or `optional_files` manifest entry
+    :return: A tuple of the digest name and the expected hex digest, which is None if no checksum was declared
+    """
+    for algorithm in SUPPORTED_DIGESTS:
+        checksum = file_info.get(algorithm + "_checksum", None)
+        if checksum:
+            return algorithm, checksum
+    return "md5", None
+
+
+def hash_buffer(buffer, algorithm="md5"):
+    hasher = hashlib.new(algorithm)
+    hasher.update(buffer)
+    return str(hasher.hexdigest())
+
+
+def hash_file(path, algorithm="md5"):
+    hasher = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        try:
+            # hashing a memory mapped file is a single call without copying the data through python objects
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                hasher.update(mapped)
+        except (ValueError, OSError):
+            # empty files and special files can't be mapped
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+    return str(hasher.hexdigest())
@@ -1,19 +1,142 @@
 import traceback
 import six
 import base64
+import binascii
 import json
+import math
+import os
+import re
+import time
+
+# A multiple of 3, so that every chunk of a binary response base64 encodes without padding
+BINARY_CHUNK_SIZE = 3 * 256 * 1024
+
+
+def encode_default(obj):
+    # NumPy arrays and scalars, detected without importing numpy
+    if type(obj).__module__ == "numpy" and hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError("Object of type {} is not JSON serializable".format(type(obj).__name__))
+
+
+class JsonCodec(object):
+    name = "json"
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps(self, obj):
+        return json.dumps(obj, default=encode_default)
+
+
+class OrjsonCodec(JsonCodec):
+    """
+    Faster than the standard library, falling back to it for what orjson handles differently: integers outside of
+    64 bits (which orjson decodes as floats), NaN and infinite numbers (which it rejects, and encodes as null)
+    """
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+        self.options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def loads(self, data):
+        if LONG_INTEGER.search(data if isinstance(data, str) else data.decode("utf-8", "replace")):
+            # possibly an integer orjson would lose precision on, or a long string of digits
+            return JsonCodec.loads(self, data)
+        try:
+            return self.orjson.loads(data)
+        except self.orjson.JSONDecodeError:
+            # NaN, Infinity and numbers too large for a double, or invalid JSON, which is then reported by json
+            return JsonCodec.loads(self, data)
+
+    def dumps(self, obj):
+        try:
+            encoded = self.orjson.dumps(obj, default=encode_default, option=self.options)
+        except TypeError:
+            # values orjson can't represent, like integers wider than 64 bits
+            return JsonCodec.dumps(self, obj)
+        if b"null" in encoded and contains_non_finite(obj):
+            return JsonCodec.dumps(self, obj)
+        return encoded.decode("utf-8")
+
+
+class UjsonCodec(JsonCodec):
+    name = "ujson"
+
+    def __init__(self):
+        import ujson
+        self.ujson = ujson
+
+    def loads(self, data):
+        return self.ujson.loads(data)
+
+    def dumps(self, obj):
+        try:
+            return self.ujson.dumps(obj, default=encode_default, escape_forward_slashes=False)
+        except (TypeError, OverflowError):
+            return JsonCodec.dumps(self, obj)
+
+
+# Runs of digits that may be an integer outside of the 64 bit range
+LONG_INTEGER = re.compile(r"\d{19}")
+CODECS = (JsonCodec, OrjsonCodec, UjsonCodec)
+
+
+def contains_non_finite(obj):
+    if isinstance(obj, float):
+        return not math.isfinite(obj)
+    if isinstance(obj, dict):
+        return any(contains_non_finite(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return any(contains_non_finite(value) for value in obj)
+    if type(obj).__module__ == "numpy" and getattr(obj, "dtype", None) is not None and obj.dtype.kind in "fc":
+        import numpy
+        return not numpy.isfinite(obj).all()
+    return False
+
+
+def select_codec(name=None):
+    """
+    Selects the JSON codec used for requests and responses
+    :param name: The name of a codec ("json", "orjson" or "ujson"), by default the `ADK_JSON_CODEC` environment variable
+    is used, or else the standard library's json
+    """
+    global codec
+    name = name or os.environ.get("ADK_JSON_CODEC", None) or JsonCodec.name
+    for codec_class in CODECS:
+        if codec_class.name == name:
+            codec = codec_class()
+            return codec
+    raise Exception("Unknown JSON codec: {}".format(name))
+
+
+def loads(data):
+    return codec.loads(data)
+
+
+def dumps(obj):
+    return codec.dumps(obj)
 
 
 def format_data(request):
     if request["content_type"] in ["text", "json"]:
         data = request["data"]
     elif request["content_type"] == "binary":
-        data = wrap_binary_data(base64.b64decode(request["data"]))
+        data = wrap_binary_data(decode_base64(request["data"]))
     else:
         raise Exception("Invalid content_type: {}".format(request["content_type"]))
     return data
 
 
+def decode_base64(data):
+    if six.PY3:
+        # a2b_base64 accepts ascii strings directly, b64decode would first copy the whole string into bytes
+        return binascii.a2b_base64(data)
+    return base64.b64decode(data)
+
+
 def is_binary(arg):
     if six.PY3:
         return isinstance(arg, base64.bytes_types)
@@ -28,7 +151,7 @@ def wrap_binary_data(data):
         return bytearray(data)
 
 
-def format_response(response):
+def format_result(response):
     if is_binary(response):
         content_type = "binary"
         response = str(base64.b64encode(response), "utf-8")
@@ -36,7 +159,12 @@ def format_response(response):
         content_type = "text"
     else:
         content_type = "json"
-    response_string = json.dumps(
+    return response, content_type
+
+
+def format_response(response):
+    response, content_type = format_result(response)
+    response_string = dumps(
         {
             "result": response,
             "metadata": {
@@ -47,18 +175,196 @@ def format_response(response):
     return response_string
 
 
-def create_exception(exception, loading_exception=False):
+class BinaryResponse(object):
+    prefix = b'{"result": "'
+    suffix = b'", "metadata": {"content_type": "binary"}}'
+
+    def __init__(self, data, metadata=None):
+        """
+        A binary apply result, which is base64 encoded in chunks as it's written rather than as one JSON string
+        :param data: The bytes, bytearray or memoryview returned by the apply function
+        :param metadata: Optional response metadata, alongside the content type
+        """
+        self.data = data
+        if metadata:
+            metadata = dict(metadata, content_type="binary")
+            self.suffix = '", "metadata": {}}}'.format(dumps(metadata)).encode("utf-8")
+
+    def chunks(self):
+        yield self.prefix
+        view = memoryview(self.data).cast("B")
+        for i in range(0, len(view), BINARY_CHUNK_SIZE):
+            yield binascii.b2a_base64(view[i:i + BINARY_CHUNK_SIZE], newline=False)
+        yield self.suffix
+
+    def __str__(self):
+        return b"".join(self.chunks()).decode("ascii")
+
+
+def encode_response(response):
+    """
+    Like format_response, but binary results are left to be encoded as they're written to the output pipe
+    """
+    if six.PY3 and isinstance(response, (bytes, bytearray, memoryview)):
+        return BinaryResponse(response)
+    return format_response(response)
+
+
+def add_metadata(response, metadata):
+    """
+    Adds fields to the metadata of an encoded response; streamed responses are returned unchanged
+    """
+    if isinstance(response, BinaryResponse):
+        return BinaryResponse(response.data, metadata)
+    if not isinstance(response, str):
+        return response
+    # orjson only decodes exact str instances, not ErrorResponse
+    record = loads(str(response))
+    record["metadata"] = dict(record.get("metadata", {}), **metadata)
+    if isinstance(response, ErrorResponse):
+        return ErrorResponse(dumps(record))
+    return dumps(record)
+
+
+def format_chunk(chunk, sequence):
+    chunk, content_type = format_result(chunk)
+    return dumps({"chunk": chunk, "metadata": {"content_type": content_type, "stream": {"sequence": sequence}}})
+
+
+def format_stream_end(chunks):
+    return dumps({"result": None, "metadata": {"content_type": "json", "stream": {"chunks": chunks, "complete": True}}})
+
+
+class StreamingResponse(object):
+    def __init__(self, results, on_complete=None):
+        """
+        The response of a generator apply function; every value it yields is written as its own chunk record,
+        followed by a terminating record, or an error record if the generator raises part way through
+        :param results: The generator returned by the apply function
+        :param on_complete: Called once the generator has been exhausted without raising
+        """
+        self.results = results
+        self.on_complete = on_complete
+        # set by `limit`, checked between chunks as the stream is produced while it's written
+        self.deadline = None
+        self.expired = None
+
+    def limit(self, deadline, expired):
+        """
+        Ends the stream with the response returned by `expired` once a chunk is produced after the deadline
+        :param deadline: A time.monotonic time
+        """
+        self.deadline = deadline
+        self.expired = expired
+
+    def past_deadline(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def records(self):
+        sequence = 0
+        try:
+            for result in self.results:
+                if self.past_deadline():
+                    self.results.close()
+                    yield self.expired()
+                    return
+                yield format_chunk(result, sequence)
+                sequence += 1
+        except Exception as e:
+            yield create_exception(e)
+            return
+        if self.past_deadline():
+            yield self.expired()
+            return
+        if self.on_complete:
+            self.on_complete()
+        yield format_stream_end(sequence)
+
+    def render(self):
+        return RenderedStream(list(self.records()))
+
+
+class AsyncStreamingResponse(object):
+    def __init__(self, results, on_complete=None):
+        """
+        The response of an async generator apply function, see StreamingResponse
+        :param results: The async generator returned by the apply function
+        :param on_complete: Called once the generator has been exhausted without raising
+        """
+        self.results = results
+        self.on_complete = on_complete
+        self.deadline = None
+        self.expired = None
+
+    limit = StreamingResponse.limit
+    past_deadline = StreamingResponse.past_deadline
+
+    async def records(self):
+        sequence = 0
+        try:
+            async for result in self.results:
+                if self.past_deadline():
+                    await self.results.aclose()
+                    yield self.expired()
+                    return
+                yield format_chunk(result, sequence)
+                sequence += 1
+        except Exception as e:
+            yield create_exception(e)
+            return
+        if self.past_deadline():
+            yield self.expired()
+            return
+        if self.on_complete:
+            self.on_complete()
+        yield format_stream_end(sequence)
+
+    async def render(self):
+        return RenderedStream([record async for record in self.records()])
+
+
+class RenderedStream(object):
+    def __init__(self, rendered):
+        """
+        A stream whose records have already been produced, for when a generator can't be consumed as it's written
+        """
+        self.rendered = rendered
+
+    def records(self):
+        return iter(self.rendered)
+
+
+class DeadlineExceeded(TimeoutError):
+    error_type = "TimeoutError"
+
+
+class Overloaded(Exception):
+    error_type = "Overloaded"
+
+
+def get_error_type(exception, loading_exception=False):
     if hasattr(exception, "error_type"):
-        error_type = exception.error_type
+        return exception.error_type
     elif loading_exception:
-        error_type = "LoadingError"
+        return "LoadingError"
     else:
-        error_type = "AlgorithmError"
-    response = json.dumps({
+        return "AlgorithmError"
+
+
+class ErrorResponse(str):
+    """A serialized error response, distinguishable from a successful one without parsing it"""
+
+
+def create_exception(exception, loading_exception=False):
+    error_type = get_error_type(exception, loading_exception)
+    response = ErrorResponse(dumps({
         "error": {
             "message": str(exception),
-            "stacktrace": " ".join(traceback.format_exception(etype=type(exception), value=exception, tb=exception.__traceback__)),
+            "stacktrace": " ".join(traceback.format_exception(type(exception), exception, exception.__traceback__)),
             "error_type": error_type,
         }
-    })
+    }))
     return response
+
+
+codec = select_codec()
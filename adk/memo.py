@@ -0,0 +1,98 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from time import monotonic
+from adk.io import BinaryResponse, ErrorResponse, encode_default
+
+
+class ResponseCache(object):
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 ** 2, ttl=None, key="line", max_entry_bytes=1024 ** 2):
+        """
+        An in memory cache of serialized responses, for deterministic apply functions that see the same requests
+        over and over. Error responses and streams are never cached.
+        :param max_entries: The number of responses kept before the least recently used ones are evicted
+        :param max_bytes: The total size of responses kept before the least recently used ones are evicted
+        :param ttl: An optional number of seconds after which a cached response is no longer used
+        :param key: What requests are keyed by; "line" for the raw request line, or "input" for the formatted input,
+        so that requests differing only in their envelope share a response
+        :param max_entry_bytes: Binary responses larger than this are not cached, they're written in chunks instead
+        """
+        if key not in ("line", "input"):
+            raise Exception("key must be either 'line' or 'input', got '{}'".format(key))
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.key_by = key
+        self.max_entry_bytes = max_entry_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, line, formatted_input):
+        hasher = hashlib.blake2b(digest_size=16)
+        if self.key_by == "line":
+            hasher.update(line.encode("utf-8") if isinstance(line, str) else line)
+        elif isinstance(formatted_input, (bytes, bytearray, memoryview)):
+            hasher.update(b"b")
+            hasher.update(formatted_input)
+        else:
+            hasher.update(b"j")
+            hasher.update(json.dumps(formatted_input, sort_keys=True, default=encode_default).encode("utf-8"))
+        return hasher.digest()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is not None and self.ttl is not None and monotonic() > entry[1]:
+                self.remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, response):
+        """
+        Caches a response, if it can be; error responses, streams and large binary responses are skipped
+        :return: The response to write, a binary response is serialized once here so that it's cached as written
+        """
+        if isinstance(response, BinaryResponse):
+            if memoryview(response.data).nbytes > self.max_entry_bytes:
+                return response
+            response = str(response)
+        if not isinstance(response, str) or isinstance(response, ErrorResponse):
+            return response
+        size = len(response)
+        if size > self.max_bytes:
+            return response
+        expires_at = monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (response, expires_at, size)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+        return response
+
+    def remove(self, key):
+        # called with the lock held
+        _, _, size = self.entries.pop(key)
+        self.size -= size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.size, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions}
@@ -0,0 +1,168 @@
+import json
+import os
+import re
+import threading
+from collections import deque
+from time import monotonic
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram(object):
+    def __init__(self, window):
+        """
+        Keeps the most recent samples of a timing, for rolling percentiles, along with all time totals
+        :param window: The number of recent samples percentiles are computed over
+        """
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def summary(self):
+        ordered = sorted(self.samples)
+        summary = {"count": self.count, "sum": self.sum}
+        for quantile in QUANTILES:
+            key = "p{}".format(int(quantile * 100))
+            summary[key] = ordered[min(int(quantile * len(ordered)), len(ordered) - 1)] if ordered else None
+        return summary
+
+
+class Metrics(object):
+    def __init__(self, sinks=(), window=1024, flush_interval=10.0):
+        """
+        Collects per request phase timings, error counts and load time breakdowns, and periodically emits them
+        :param sinks: Where snapshots are emitted, eg: a FileSink, PrometheusSink or CallbackSink
+        :param window: The number of recent samples each phase's percentiles are computed over
+        :param flush_interval: The minimum number of seconds between snapshots emitted while serving requests
+        """
+        self.sinks = list(sinks)
+        self.window = window
+        self.flush_interval = flush_interval
+        self.histograms = {}
+        self.errors = {}
+        self.counters = {}
+        self.gauges = {}
+        self.load = {}
+        self.lock = threading.Lock()
+        self.last_flush = monotonic()
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name, None)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.window)
+            histogram.observe(seconds)
+
+    def count_error(self, error_type):
+        with self.lock:
+            self.errors[error_type] = self.errors.get(error_type, 0) + 1
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def record_load(self, phase, seconds):
+        with self.lock:
+            self.load[phase] = seconds
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "phases": {name: histogram.summary() for name, histogram in self.histograms.items()},
+                "errors": dict(self.errors),
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "load": dict(self.load),
+            }
+
+    def maybe_flush(self):
+        if monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = monotonic()
+        if not self.sinks:
+            return
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            sink.emit(snapshot)
+
+
+def write_atomically(path, content):
+    temp_path = "{}.tmp{}".format(path, os.getpid())
+    with open(temp_path, "w") as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+
+class FileSink(object):
+    def __init__(self, path):
+        """Writes each snapshot to a local file as JSON"""
+        self.path = path
+
+    def emit(self, snapshot):
+        write_atomically(self.path, json.dumps(snapshot))
+
+
+class CallbackSink(object):
+    def __init__(self, callback):
+        """Passes each snapshot to a function"""
+        self.callback = callback
+
+    def emit(self, snapshot):
+        self.callback(snapshot)
+
+
+class PrometheusSink(object):
+    def __init__(self, path, prefix="adk"):
+        """Writes each snapshot in the Prometheus text format, eg: for the node exporter's textfile collector"""
+        self.path = path
+        self.prefix = prefix
+
+    def emit(self, snapshot):
+        write_atomically(self.path, self.render(snapshot))
+
+    def render(self, snapshot):
+        lines = []
+        name = self.metric_name("phase_seconds")
+        lines.append("# TYPE {} summary".format(name))
+        for phase, summary in sorted(snapshot["phases"].items()):
+            for quantile in QUANTILES:
+                value = summary["p{}".format(int(quantile * 100))]
+                if value is not None:
+                    lines.append('{}{{phase="{}",quantile="{}"}} {}'.format(name, escape(phase), quantile, value))
+            lines.append('{}_sum{{phase="{}"}} {}'.format(name, escape(phase), summary["sum"]))
+            lines.append('{}_count{{phase="{}"}} {}'.format(name, escape(phase), summary["count"]))
+        name = self.metric_name("errors_total")
+        lines.append("# TYPE {} counter".format(name))
+        for error_type, count in sorted(snapshot["errors"].items()):
+            lines.append('{}{{error_type="{}"}} {}'.format(name, escape(error_type), count))
+        for counter, value in sorted(snapshot["counters"].items()):
+            name = self.metric_name(counter + "_total")
+            lines.append("# TYPE {} counter".format(name))
+            lines.append("{} {}".format(name, value))
+        for gauge, value in sorted(snapshot["gauges"].items()):
+            name = self.metric_name(gauge)
+            lines.append("# TYPE {} gauge".format(name))
+            lines.append("{} {}".format(name, value))
+        name = self.metric_name("load_seconds")
+        lines.append("# TYPE {} gauge".format(name))
+        for phase, seconds in sorted(snapshot["load"].items()):
+            lines.append('{}{{phase="{}"}} {}'.format(name, escape(phase), seconds))
+        return "\n".join(lines) + "\n"
+
+    def metric_name(self, name):
+        return re.sub(r"[^a-zA-Z0-9_]", "_", "{}_{}".format(self.prefix, name))
+
+
+def escape(label_value):
+    return str(label_value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
@@ -2,6 +2,11 @@ import yaml
 import json
 import os
 import subprocess
+import threading
+import sys
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty
 
 
 class MLOps(object):
@@ -9,9 +14,15 @@ class MLOps(object):
     agent_dir = "/opt/mlops-agent"
     mlops_dir_name = "datarobot_mlops_package-8.1.2"
     total_dir_path = agent_dir + "/" + mlops_dir_name
+    ready = None
 
-    def __init__(self, api_token, path):
+    def __init__(self, api_token, path, agent_dir=None, spool_dir=None):
         self.token = api_token
+        if agent_dir:
+            self.agent_dir = agent_dir
+            self.total_dir_path = agent_dir + "/" + self.mlops_dir_name
+        if spool_dir:
+            self.spool_dir = spool_dir
         if os.path.exists(path):
             with open(path) as f:
                 mlops_config = json.load(f)
@@ -39,23 +50,223 @@ class MLOps(object):
                             "mlops.json file")
 
     def init(self):
+        """Configures and starts the agent, blocking until it's running"""
+        self.configure()
+        self.start()
+        return self.wait_until_ready()
+
+    def start_in_background(self, timeout=120.0):
+        """
+        Configures the agent, then starts it from a background thread so that it can come up while the algorithm loads
+        :param timeout: The longest time in seconds to wait for the agent to report that it's running
+        :return: A Future that resolves once the agent is running, or fails with the reason it didn't start
+        """
+        self.configure()
+        ready = Future()
+
+        def start():
+            try:
+                self.start()
+                ready.set_result(self.wait_until_ready(timeout))
+            except Exception as e:
+                ready.set_exception(e)
+
+        threading.Thread(target=start, name="adk-mlops-agent", daemon=True).start()
+        self.ready = ready
+        return ready
+
+    def configure(self):
         os.environ['MLOPS_DEPLOYMENT_ID'] = self.deployment_id
         os.environ['MLOPS_MODEL_ID'] = self.model_id
         os.environ['MLOPS_SPOOLER_TYPE'] = "FILESYSTEM"
         os.environ['MLOPS_FILESYSTEM_DIRECTORY'] = self.spool_dir
 
-        with open(self.total_dir_path + '/conf/mlops.agent.conf.yaml') as f:
+        config_path = self.total_dir_path + '/conf/mlops.agent.conf.yaml'
+        with open(config_path) as f:
             documents = yaml.load(f, Loader=yaml.FullLoader)
+        if documents.get('mlopsUrl') == self.endpoint and documents.get('apiToken') == self.token:
+            # the agent is already configured, leave the file (and its mtime) alone
+            return
         documents['mlopsUrl'] = self.endpoint
         documents['apiToken'] = self.token
-        with open(self.total_dir_path + '/conf/mlops.agent.conf.yaml', 'w') as f:
+        with open(config_path, 'w') as f:
             yaml.dump(documents, f)
 
+    def start(self):
         subprocess.call(self.total_dir_path + '/bin/start-agent.sh')
-        check = subprocess.Popen([self.total_dir_path + '/bin/status-agent.sh'], stdout=subprocess.PIPE)
-        output = check.stdout.readlines()[0]
-        check.terminate()
-        if b"DataRobot MLOps-Agent is running as a service." in output:
+
+    def status(self):
+        check = subprocess.run([self.total_dir_path + '/bin/status-agent.sh'], stdout=subprocess.PIPE)
+        return check.stdout
+
+    def wait_until_ready(self, timeout=120.0, initial_delay=0.1, max_delay=2.0):
+        """
+        Polls the agent's status, backing off exponentially between checks, until it reports that it's running
+        :param timeout: The longest time in seconds to wait for the agent
+        :param initial_delay: The time in seconds before the second check, doubled after every check
+        :param max_delay: The longest time in seconds between checks
+        """
+        deadline = time.monotonic() + timeout
+        delay = initial_delay
+        while True:
+            output = self.status()
+            if b"DataRobot MLOps-Agent is running as a service." in output:
+                return True
+            if time.monotonic() + delay > deadline:
+                raise Exception(output)
+            time.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+    def reporter(self, batch_size=100, flush_interval=1.0):
+        """
+        Creates a reporter that reports deployment stats and predictions to the agent's spool in the background
+        :param batch_size: The number of buffered predictions that triggers a report
+        :param flush_interval: The longest time in seconds a prediction stays buffered before it's reported
+        """
+        return MLOpsReporter(self.spool_dir, self.deployment_id, self.model_id, batch_size, flush_interval, self.ready)
+
+
+# Placed on the reporter's queue to stop its thread once everything before it has been reported
+_STOP = object()
+
+
+class MLOpsReporter(object):
+    def __init__(self, spool_dir, deployment_id, model_id, batch_size=100, flush_interval=1.0, ready=None):
+        """
+        Buffers prediction records in memory, and reports them through the datarobot-mlops library's filesystem
+        spooler from a background thread, so that reporting never adds latency to a request
+        :param spool_dir: The directory the MLOps agent reads spooled records from
+        :param deployment_id: The deployment the predictions are reported against
+        :param model_id: The model the predictions are reported against
+        :param batch_size: The number of buffered predictions that triggers a report
+        :param flush_interval: The longest time in seconds a prediction stays buffered before it's reported
+        :param ready: An optional Future that resolves once the agent is running, predictions stay buffered until then
+        """
+        self.spool_dir = spool_dir
+        self.ready = ready
+        self.deployment_id = deployment_id
+        self.model_id = model_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # the datarobot-mlops client, created by the background thread when it first reports
+        self.client = None
+        # set once the agent has failed to start, so that the failure is only logged once
+        self.failed = False
+        # the kinds of reporting failures that have been logged, each is only logged once
+        self.logged = set()
+        self.queue = Queue()
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.thread = threading.Thread(target=self.run, name="adk-mlops-reporter", daemon=True)
+        self.thread.start()
+
+    def record(self, features, prediction, seconds):
+        """
+        Records a single prediction, only appending it to the in memory buffer
+        :param features: The request input the prediction was made from
+        :param prediction: The apply function's result
+        :param seconds: How long the apply function took
+        """
+        self.queue.put((time.time(), features, prediction, seconds))
+
+    def run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except Empty:
+                item = None
+            if item is _STOP:
+                if self.agent_started(wait=True):
+                    self.spool(batch)
+                if self.client is not None:
+                    self.client.shutdown()
+                return
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+                if self.ready is not None and not self.ready.done():
+                    # the agent is still starting, keep buffering
+                    continue
+                if self.agent_started():
+                    self.spool(batch)
+                batch = []
+
+    def agent_started(self, wait=False):
+        if self.ready is None:
+            return True
+        if not wait and not self.ready.done():
+            return False
+        error = self.ready.exception()
+        if error is None:
             return True
-        else:
-            raise Exception(output)
+        if not self.failed:
+            self.failed = True
+            sys.stderr.write("MLOps agent failed to start, predictions are not being reported: {}\n".format(error))
+        return False
+
+    def create_client(self):
+        from datarobot.mlops.mlops import MLOps as DataRobotMLOps
+        return DataRobotMLOps().set_deployment_id(self.deployment_id).set_model_id(self.model_id) \
+            .set_filesystem_spooler(self.spool_dir).init()
+
+    def spool(self, batch):
+        if not batch:
+            return
+        try:
+            if self.client is None:
+                self.client = self.create_client()
+            self.client.report_deployment_stats(len(batch), sum(seconds for _, _, _, seconds in batch) * 1000)
+        except Exception as e:
+            self.log_once("deployment stats", e)
+            return
+        reportable = [(features, prediction) for _, features, prediction, _ in batch if is_reportable(prediction)]
+        if not reportable:
+            return
+        predictions = [prediction for _, prediction in reportable]
+        features_df = features_frame([features for features, _ in reportable])
+        if features_df is not None:
+            try:
+                self.client.report_predictions_data(features_df=features_df, predictions=predictions)
+                return
+            except Exception as e:
+                # the predictions are still worth reporting without their features
+                self.log_once("features", e)
+        try:
+            self.client.report_predictions_data(predictions=predictions)
+        except Exception as e:
+            self.log_once("predictions", e)
+
+    def log_once(self, kind, error):
+        if kind not in self.logged:
+            self.logged.add(kind)
+            sys.stderr.write("unable to report {} to MLOps: {}\n".format(kind, error))
+
+    def close(self):
+        """Reports any buffered predictions, and stops the background thread"""
+        self.queue.put(_STOP)
+        self.thread.join()
+
+
+def is_reportable(prediction):
+    """
+    MLOps accepts a number for regression deployments, or a list of class probabilities for classification ones
+    """
+    if isinstance(prediction, (list, tuple)):
+        return len(prediction) > 0 and all(is_number(probability) for probability in prediction)
+    return is_number(prediction)
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def features_frame(inputs):
+    """
+    :return: A DataFrame of the request inputs, when every input is a dict of feature values, otherwise None
+    """
+    if not all(isinstance(features, dict) for features in inputs):
+        return None
+    import pandas
+    return pandas.DataFrame(inputs)
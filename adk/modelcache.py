@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from adk.classes import FileData
+from adk.digest import expected_digest, hash_file
+
+
+class ModelCache(object):
+    def __init__(self, path, max_bytes=None, full_verify=False):
+        """
+        A content addressed, on disk cache of model files that survives between algorithm starts on the same node
+        :param path: The directory that cached model files are stored in
+        :param max_bytes: An optional size cap, the least recently used files are evicted once it's exceeded
+        :param full_verify: When True a cache hit re-hashes the whole file, rather than checking its size and
+        the digest recorded when it was stored
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.full_verify = full_verify
+        self.lock = threading.Lock()
+        # files used by this process are never evicted, as their paths have been handed out
+        self.pinned = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.path, exist_ok=True)
+
+    def key(self, file_info):
+        _, checksum = expected_digest(file_info)
+        if checksum:
+            return checksum
+        else:
+            return hashlib.md5(file_info['source_uri'].encode()).hexdigest()
+
+    def get(self, file_info):
+        key = self.key(file_info)
+        data_path = os.path.join(self.path, key)
+        entry = self.read_entry(data_path)
+        algorithm, expected_hash = expected_digest(file_info)
+        valid = entry is not None and entry['algorithm'] == algorithm and \
+            (expected_hash is None or entry['checksum'] == expected_hash)
+        if valid and self.full_verify:
+            valid = hash_file(data_path, algorithm) == entry['checksum']
+        with self.lock:
+            if not valid:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.pinned.add(key)
+        # the modification time tracks recency of use, for LRU eviction
+        try:
+            os.utime(data_path)
+        except FileNotFoundError:
+            # evicted by another process sharing the cache since its entry was read
+            with self.lock:
+                self.hits -= 1
+                self.misses += 1
+                self.pinned.discard(key)
+            return None
+        return FileData(entry['checksum'], data_path, algorithm)
+
+    def pin(self, data_path):
+        """Keeps a cached file that's in use from being evicted, eg: one restored from a snapshot"""
+        if os.path.dirname(os.path.abspath(data_path)) == os.path.abspath(self.path):
+            with self.lock:
+                self.pinned.add(os.path.basename(data_path))
+
+    def read_entry(self, data_path):
+        try:
+            with open(data_path + ".json") as f:
+                entry = json.load(f)
+            if os.path.getsize(data_path) != entry['size']:
+                return None
+            return entry
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, file_info, local_path, real_hash, temporary=True):
+        """
+        Moves a downloaded and verified model file into the cache
+        :param temporary: Whether the file is a temporary download that can be moved, rather than a file that's
+        copied and left in place, eg: a `file://` source
+        :return: The path of the file within the cache
+        """
+        key = self.key(file_info)
+        data_path = os.path.join(self.path, key)
+        temp_suffix = ".tmp{}".format(threading.get_ident())
+        if temporary:
+            shutil.move(local_path, data_path + temp_suffix)
+        else:
+            shutil.copyfile(local_path, data_path + temp_suffix)
+        os.replace(data_path + temp_suffix, data_path)
+        algorithm, _ = expected_digest(file_info)
+        entry = {"source_uri": file_info['source_uri'], "algorithm": algorithm, "checksum": real_hash,
+                 "size": os.path.getsize(data_path)}
+        with open(data_path + ".json" + temp_suffix, "w") as f:
+            json.dump(entry, f)
+        os.replace(data_path + ".json" + temp_suffix, data_path + ".json")
+        with self.lock:
+            self.pinned.add(key)
+            self.evict()
+        return data_path
+
+    def evict(self):
+        if self.max_bytes is None:
+            return
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith(".json") or ".tmp" in name:
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name in self.pinned:
+                continue
+            for path in (os.path.join(self.path, name + ".json"), os.path.join(self.path, name)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
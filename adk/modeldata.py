@@ -1,33 +1,87 @@
 import os
 import json
 import hashlib
+import mmap
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from adk.classes import FileData
+from adk.digest import expected_digest, hash_buffer, hash_file
+from adk.residency import ModelResidency
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Sources read from local disk by the client rather than downloaded from the data API
+LOCAL_FILE_PREFIX = "file://"
 
 
 class ModelData(object):
-    def __init__(self, client, model_manifest_path):
+    def __init__(self, client, model_manifest_path, download_workers=8, download_retries=2, cache=None,
+                 memory_budget=None, metrics=None):
+        """
+        Holds the model manifest, along with any model files and user state defined during loading
+        :param client: The Algorithmia client used to download model files
+        :param model_manifest_path: The path to the model manifest, a `.freeze` variant takes precedence if it exists
+        :param download_workers: The number of model files that may be downloaded and verified at the same time
+        :param download_retries: How many times a failed download is retried before it's reported
+        :param cache: An optional ModelCache, model files found in it are not downloaded again
+        :param memory_budget: The number of bytes that models loaded through `acquire` may use before the least
+        recently used ones are evicted, None for no limit
+        :param metrics: An optional Metrics instance, the time spent fetching each model file is recorded to it
+        """
+        self.cache = cache
+        self.metrics = metrics
+        self.download_workers = download_workers
+        self.download_retries = download_retries
         self.manifest_reg_path = model_manifest_path
         self.manifest_frozen_path = "{}.freeze".format(self.manifest_reg_path)
-        self.manifest_data = self.get_manifest()
+        # the manifest is read and verified when it's first needed, rather than while the algorithm is constructed
+        self.manifest = None
         self.client = client
         self.models = {}
-        self.usr_key = "__user__"
-        self.using_frozen = True
+        # model files that are still being downloaded in the background, by name
+        self.pending = {}
+        self.download_pool = None
+        # read only memory maps of model files by name, shared by every caller (and every forked worker)
+        self.mapped = {}
+        # model files whose mapped content has been checked against the manifest's digest
+        self.verified = set()
+        self.map_lock = threading.Lock()
+        self.user_data = {}
+        self.residency = ModelResidency(self.get_model, memory_budget)
+
+    def load_manifest(self):
+        if self.manifest is None:
+            manifest_data = self.get_manifest()
+            # manifest entries by name, built once so lookups don't scan the manifest
+            required_files = {}
+            optional_files = {}
+            if manifest_data:
+                required_files = index_by_name(manifest_data.get('required_files', []))
+                optional_files = index_by_name(manifest_data.get('optional_files', []))
+            self.manifest = (manifest_data, required_files, optional_files)
+        return self.manifest
+
+    @property
+    def manifest_data(self):
+        return self.load_manifest()[0]
+
+    @property
+    def required_files(self):
+        return self.load_manifest()[1]
+
+    @property
+    def optional_files(self):
+        return self.load_manifest()[2]
 
     def __getitem__(self, key):
-        return getattr(self, self.usr_key + key)
+        return self.user_data[key]
 
     def __setitem__(self, key, value):
-        setattr(self, self.usr_key + key, value)
+        self.user_data[key] = value
 
     def data(self):
-        __dict = self.__dict__
-        output = {}
-        for key in __dict.keys():
-            if self.usr_key in key:
-                without_usr_key = key.split(self.usr_key)[1]
-                output[without_usr_key] = __dict[key]
-        return output
+        return dict(self.user_data)
 
     def available(self):
         if self.manifest_data:
@@ -36,31 +90,142 @@ class ModelData(object):
             return False
 
     def initialize(self):
+        """
+        Fetches the required model files. Files marked with `"prefetch": "background"` (or every file, when the
+        manifest itself sets it) are downloaded in the background instead, along with any optional files marked
+        the same way; `get_model` waits for just the file it's asked for.
+        """
         if self.client is None:
             raise Exception("Client was not defined, please define a Client when using Model Manifests.")
-        for required_file in self.manifest_data['required_files']:
+        required_files = self.manifest_data['required_files']
+        names = set()
+        for required_file in required_files:
             name = required_file['name']
-            source_uri = required_file['source_uri']
-            fail_on_tamper = required_file.get('fail_on_tamper', False)
-            expected_hash = required_file.get('md5_checksum', None)
-            if name in self.models:
+            if name in names:
                 raise Exception("Duplicate 'name' detected. \n"
                                 + name + " was found to be used by more than one data file, please rename.")
-            with self.client.file(source_uri).getFile() as f:
-                local_data_path = f.name
-            real_hash = md5_for_file(local_data_path)
-            if real_hash != expected_hash and fail_on_tamper:
-                raise Exception("Model File Mismatch for " + name +
-                                "\nexpected hash:  " + expected_hash + "\nreal hash: " + real_hash)
-            else:
-                self.models[name] = FileData(real_hash, local_data_path)
+            names.add(name)
+        # Files that were fetched by a previous, partially failed, initialization are not downloaded again
+        pending = [required_file for required_file in required_files
+                   if required_file['name'] not in self.models and required_file['name'] not in self.pending]
+        # files needed before loading completes are queued ahead of any background downloads
+        futures = [(required_file['name'], self.submit_download(required_file, True))
+                   for required_file in pending if not self.prefetch_in_background(required_file)]
+        for required_file in pending:
+            if self.prefetch_in_background(required_file):
+                self.pending[required_file['name']] = self.submit_download(required_file, True)
+        for name, optional_file in self.optional_files.items():
+            if self.prefetch_in_background(optional_file) and name not in self.models and name not in self.pending:
+                self.pending[name] = self.submit_download(optional_file, True)
+        errors = []
+        for name, future in futures:
+            try:
+                self.models[name] = future.result()
+            except Exception as e:
+                errors.append(e)
+        raise_errors(errors)
+
+    def prefetch_in_background(self, file_info):
+        return file_info.get('prefetch', self.manifest_data.get('prefetch', None)) == "background"
+
+    def submit_download(self, file_info, check_hash):
+        if self.download_pool is None:
+            self.download_pool = ThreadPoolExecutor(max_workers=self.download_workers)
+        return self.download_pool.submit(self.fetch_file, file_info, check_hash)
+
+    def wait_for(self, model_name):
+        """
+        Blocks until a model file that's being downloaded in the background is ready
+        """
+        future = self.pending.get(model_name, None)
+        if future is not None:
+            file_data = future.result()
+            self.models[model_name] = file_data
+            self.pending.pop(model_name, None)
+
+    def wait(self):
+        """
+        Blocks until every background download has completed, raising if any of them failed
+        """
+        errors = []
+        for name in list(self.pending.keys()):
+            try:
+                self.wait_for(name)
+            except Exception as e:
+                errors.append(e)
+        raise_errors(errors)
+
+    def fetch_file(self, file_info, check_hash):
+        name = file_info['name']
+        source_uri = file_info['source_uri']
+        fail_on_tamper = file_info.get('fail_on_tamper', False)
+        algorithm, expected_hash = expected_digest(file_info)
+        fetch_start = time.perf_counter()
+        if self.cache:
+            cached = self.cache.get(file_info)
+            if cached:
+                if self.metrics:
+                    self.metrics.increment("model_cache_hits")
+                    self.metrics.record_load("file:" + name, time.perf_counter() - fetch_start)
+                return cached
+        local_data_path, real_hash = self.download(source_uri, algorithm)
+        if self.metrics:
+            self.metrics.record_load("file:" + name, time.perf_counter() - fetch_start)
+        if check_hash and real_hash != expected_hash and fail_on_tamper:
+            raise Exception("Model File Mismatch for " + name +
+                            "\nexpected hash:  " + expected_hash + "\nreal hash: " + real_hash)
+        if real_hash == expected_hash:
+            # hashed as it was downloaded, so mapping it with `verify` doesn't hash it again
+            self.verified.add(name)
+        if self.cache:
+            local_data_path = self.cache.put(file_info, local_data_path, real_hash,
+                                             temporary=not source_uri.startswith(LOCAL_FILE_PREFIX))
+        return FileData(real_hash, local_data_path, algorithm)
+
+    def download(self, source_uri, algorithm="md5"):
+        """
+        Downloads a model file to local disk, hashing it as it's downloaded when the client can stream the file;
+        `file://` sources are already local, so they're read in place
+        :return: A tuple of the local file path and its hex digest
+        """
+        attempt = 0
+        while True:
+            try:
+                data_file = self.client.file(source_uri)
+                if hasattr(self.client, "getStreamHelper") and hasattr(data_file, "url") and \
+                        not source_uri.startswith(LOCAL_FILE_PREFIX):
+                    return self.stream_to_file(source_uri, data_file.url, algorithm)
+                with data_file.getFile() as f:
+                    local_data_path = f.name
+                return local_data_path, hash_file(local_data_path, algorithm)
+            except Exception:
+                if attempt >= self.download_retries:
+                    raise
+                attempt += 1
+                time.sleep(0.5 * attempt)
+
+    def stream_to_file(self, source_uri, url, algorithm):
+        hasher = hashlib.new(algorithm)
+        response = self.client.getStreamHelper(url)
+        if response.status_code != 200:
+            raise Exception("unable to get file {} - status code {}".format(source_uri, response.status_code))
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            for block in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                f.write(block)
+                hasher.update(block)
+        return f.name, str(hasher.hexdigest())
 
     def get_model(self, model_name):
         if self.available():
+            if model_name in self.pending:
+                self.wait_for(model_name)
             if model_name in self.models:
                 return self.models[model_name].file_path
-            elif len([optional for optional in self.manifest_data['optional_files'] if
-                      optional['name'] == model_name]) > 0:
+            elif model_name in self.required_files:
+                # not fetched by initialize, eg: it was skipped as state was restored from a snapshot
+                self.models[model_name] = self.fetch_file(self.required_files[model_name], True)
+                return self.models[model_name].file_path
+            elif model_name in self.optional_files:
                 self.find_optional_model(model_name)
                 return self.models[model_name].file_path
             else:
@@ -68,30 +233,127 @@ class ModelData(object):
         else:
             raise Exception("unable to get model {}, model_manifest.json not found.".format(model_name))
 
+    def get_model_mmap(self, model_name, verify=False):
+        """
+        Memory maps a model file read only, so that it's paged in as it's used and shared through the page cache
+        with every other process that maps it, rather than read into each process's own memory
+        :param model_name: The name of a required or optional file in the model manifest
+        :param verify: When True the mapped file is hashed and checked against the digest declared in the manifest,
+        which also pages it in; for files that weren't verified when they were fetched, eg: cache hits without
+        `full_verify` or files restored from a snapshot. Files already verified as they were downloaded aren't
+        hashed again.
+        :return: An mmap.mmap, which stays open for the life of the process
+        """
+        file_path = self.get_model(model_name)
+        with self.map_lock:
+            mapped = self.mapped.get(model_name, None)
+            if mapped is None:
+                if os.path.getsize(file_path) == 0:
+                    raise Exception("unable to memory map model {}, the file is empty".format(model_name))
+                with open(file_path, "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.mapped[model_name] = mapped
+            if verify and model_name not in self.verified:
+                self.verify_mapped(model_name, mapped)
+                self.verified.add(model_name)
+        return mapped
+
+    def get_model_buffer(self, model_name, verify=False):
+        """
+        :return: A read only memoryview of a memory mapped model file, see `get_model_mmap`
+        """
+        return memoryview(self.get_model_mmap(model_name, verify))
+
+    def get_model_array(self, model_name, dtype="uint8", offset=0, count=-1, shape=None, verify=False):
+        """
+        A read only numpy array over a memory mapped model file, eg: raw float32 weights or embeddings
+        :param dtype: The array's numpy data type
+        :param offset: The number of bytes to skip from the start of the file, eg: a header
+        :param count: The number of items to read, -1 for the rest of the file
+        :param shape: An optional shape to reshape the array to
+        """
+        import numpy as np
+
+        array = np.frombuffer(self.get_model_mmap(model_name, verify), dtype=dtype, count=count, offset=offset)
+        if shape is not None:
+            array = array.reshape(shape)
+        return array
+
+    def get_model_memmap(self, model_name, dtype="uint8", offset=0, shape=None, verify=False):
+        """
+        A read only `np.memmap` of a model file, for code that expects one; `get_model_array` shares a single
+        mapping between every call, this creates a new mapping on each call
+        """
+        import numpy as np
+
+        if verify:
+            self.get_model_mmap(model_name, verify)
+        return np.memmap(self.get_model(model_name), dtype=dtype, mode="r", offset=offset, shape=shape)
+
+    def verify_mapped(self, model_name, mapped):
+        file_info = self.required_files.get(model_name, None) or self.optional_files[model_name]
+        algorithm, expected_hash = expected_digest(file_info)
+        if expected_hash is None:
+            return
+        real_hash = hash_buffer(mapped, algorithm)
+        if real_hash != expected_hash:
+            raise Exception("Model File Mismatch for " + model_name +
+                            "\nexpected hash:  " + expected_hash + "\nreal hash: " + real_hash)
+
     def find_optional_model(self, file_name):
         if self.available():
-            found_models = [optional for optional in self.manifest_data['optional_files'] if
-                            optional['name'] == file_name]
-            if len(found_models) == 0:
+            if file_name not in self.optional_files:
                 raise Exception("file with name '" + file_name + "' not found in model manifest.")
-            model_info = found_models[0]
-            self.models[file_name] = {}
-            source_uri = model_info['source_uri']
-            fail_on_tamper = model_info.get("fail_on_tamper", False)
-            expected_hash = model_info.get('md5_checksum', None)
-            with self.client.file(source_uri).getFile() as f:
-                local_data_path = f.name
-            real_hash = md5_for_file(local_data_path)
-            if self.using_frozen:
-                if real_hash != expected_hash and fail_on_tamper:
-                    raise Exception("Model File Mismatch for " + file_name +
-                                    "\nexpected hash:  " + expected_hash + "\nreal hash: " + real_hash)
-                else:
-                    self.models[file_name] = FileData(real_hash, local_data_path)
-            else:
-                self.models[file_name] = FileData(real_hash, local_data_path)
+            self.models[file_name] = self.fetch_file(self.optional_files[file_name], True)
         else:
-            raise Exception("unable to get model {}, model_manifest.json not found.".format(model_name))
+            raise Exception("unable to get model {}, model_manifest.json not found.".format(file_name))
+
+    def register_loader(self, model_name, load, size=None, unload=None):
+        """
+        Registers a function that loads a model manifest file into memory, for use with `acquire`
+        :param model_name: The name of a required or optional file in the model manifest
+        :param load: A function that receives the model file's local path and returns the loaded model
+        :param size: An optional function returning a loaded model's size in bytes, the file size is used otherwise
+        :param unload: An optional function called with a model when it's evicted
+        """
+        if model_name not in self.required_files and model_name not in self.optional_files:
+            raise Exception("model name " + model_name + " not found in manifest")
+        self.residency.register(model_name, load, size, unload)
+
+    def acquire(self, model_name):
+        """
+        Gets a loaded model, loading it with its registered loader if it isn't resident. Concurrent requests for a
+        model that's still loading wait for that load to complete.
+        """
+        return self.residency.acquire(model_name)
+
+    def residency_stats(self):
+        return self.residency.stats()
+
+    def manifest_paths(self):
+        return [self.manifest_reg_path, self.manifest_frozen_path]
+
+    def snapshot_state(self):
+        """
+        :return: The user state and fetched model files, for a warm start snapshot
+        """
+        models = {}
+        for name, file_data in self.models.items():
+            models[name] = {"checksum": file_data.md5_checksum, "path": file_data.file_path,
+                            "algorithm": file_data.algorithm, "size": os.path.getsize(file_data.file_path)}
+        return {"user_data": self.user_data, "models": models}
+
+    def restore_state(self, state):
+        """
+        Restores the user state from a snapshot, along with any model files that are still on local disk;
+        the others are fetched again by `get_model` if they're asked for
+        """
+        self.user_data = state["user_data"]
+        for name, model in state["models"].items():
+            if os.path.exists(model["path"]) and os.path.getsize(model["path"]) == model["size"]:
+                self.models[name] = FileData(model["checksum"], model["path"], model["algorithm"])
+                if self.cache:
+                    self.cache.pin(model["path"])
 
     def get_manifest(self):
         if os.path.exists(self.manifest_frozen_path):
@@ -106,12 +368,27 @@ class ModelData(object):
         elif os.path.exists(self.manifest_reg_path):
             with open(self.manifest_reg_path) as f:
                 manifest_data = json.load(f)
-            self.using_frozen = False
             return manifest_data
         else:
             return None
 
 
+def index_by_name(file_infos):
+    index = {}
+    for file_info in file_infos:
+        # the first entry wins, duplicate required names are reported by initialize
+        index.setdefault(file_info['name'], file_info)
+    return index
+
+
+def raise_errors(errors):
+    if len(errors) == 1:
+        raise errors[0]
+    elif errors:
+        raise Exception("{} model files failed to initialize:\n{}"
+                        .format(len(errors), "\n".join(str(error) for error in errors)))
+
+
 def check_lock(manifest_data):
     expected_lock_checksum = manifest_data.get('lock_checksum')
     del manifest_data['lock_checksum']
@@ -123,11 +400,7 @@ def check_lock(manifest_data):
 
 
 def md5_for_file(fname):
-    hash_md5 = hashlib.md5()
-    with open(fname, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_md5.update(chunk)
-    return str(hash_md5.hexdigest())
+    return hash_file(fname, "md5")
 
 
 def md5_for_str(content):
@@ -0,0 +1,63 @@
+import os
+
+# Writers abandoned by forked children; kept referenced so that they're never finalized, which would flush them
+_abandoned = []
+
+
+class PipeWriter(object):
+    def __init__(self, path):
+        """
+        A long lived writer for the algorithm output FIFO, responses are written as newline delimited bytes.
+        :param path: The path to the FIFO that langserver reads responses from
+        """
+        self.path = path
+        self.pipe = None
+
+    def open(self):
+        if self.pipe is None:
+            # Opening a FIFO for writing blocks until a reader is attached
+            self.pipe = open(self.path, "wb")
+        return self.pipe
+
+    def write(self, payload):
+        """
+        Writes a response to the pipe
+        :param payload: A response string, bytes, or an object with a `chunks()` method yielding bytes to write in turn
+        """
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        try:
+            self._write(payload)
+        except BrokenPipeError:
+            # The reader went away, drop our end of the pipe and wait for a new reader to attach
+            self.close()
+            self._write(payload)
+
+    def _write(self, payload):
+        pipe = self.open()
+        if isinstance(payload, bytes):
+            pipe.write(payload)
+        else:
+            for chunk in payload.chunks():
+                pipe.write(chunk)
+        pipe.write(b"\n")
+        pipe.flush()
+
+    def close(self):
+        if self.pipe is not None:
+            pipe = self.pipe
+            self.pipe = None
+            try:
+                pipe.close()
+            except (BrokenPipeError, OSError):
+                pass
+
+    def abandon(self):
+        """
+        Closes an inherited pipe in a forked child process without flushing it; its buffer, and the lock guarding it,
+        are copies of the parent's, so flushing would write the parent's pending bytes twice, or block forever
+        """
+        if self.pipe is not None:
+            os.close(self.pipe.fileno())
+            _abandoned.append(self.pipe)
+            self.pipe = None
@@ -0,0 +1,244 @@
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+
+# How often the collector thread checks whether the pool has been shut down, while no worker has anything to report
+POLL_INTERVAL = 0.5
+
+
+def _serve(connection, close_inherited):
+    close_inherited()
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        request_id, func, payload = message
+        try:
+            connection.send((request_id, func(payload), None))
+        except Exception as e:
+            connection.send((request_id, None, e))
+
+
+class Worker(object):
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+        self.request_id = None
+        self.future = None
+
+
+class PreforkPool(object):
+    def __init__(self, workers, close_inherited=lambda: None, before_fork=lambda: None):
+        """
+        A pool of worker processes forked from the current process, after loading, so that every worker shares the
+        loaded models copy-on-write. A worker that dies while processing a request fails only that request's future,
+        and is replaced by a newly forked worker. Workers are only ever forked from the thread that created the pool,
+        in `submit` and `result`, as forking from another thread could copy locks that thread's holding.
+        :param workers: The number of worker processes
+        :param close_inherited: Called in each worker once it's forked, to release anything that only the parent
+        should hold, eg: the output pipe
+        :param before_fork: Called in the parent before workers are forked, including replacements, to settle
+        anything that a worker can't finish on its own, eg: background downloads
+        """
+        self.close_inherited = close_inherited
+        self.before_fork = before_fork
+        self.context = multiprocessing.get_context("fork")
+        self.lock = threading.Lock()
+        self.queued = deque()
+        self.idle = deque()
+        self.workers = []
+        self.next_request_id = 0
+        self.closed = False
+        self.respawns = 0
+        # workers that have died and not been replaced yet
+        self.dead = 0
+        # notified when a worker dies or a future that `result` is waiting on completes
+        self.events = threading.Condition()
+        self.before_fork()
+        for _ in range(workers):
+            self.idle.append(self.spawn())
+        self.collector = threading.Thread(target=self.collect, name="adk-prefork-collector", daemon=True)
+        self.collector.start()
+
+    def spawn(self):
+        parent_connection, child_connection = self.context.Pipe()
+        process = self.context.Process(target=_serve, args=(child_connection, self.close_inherited),
+                                       daemon=True)
+        process.start()
+        child_connection.close()
+        worker = Worker(process, parent_connection)
+        self.workers.append(worker)
+        return worker
+
+    def submit(self, func, payload):
+        """
+        Calls a function with a payload in the next available worker
+        :param func: A module level function, its result must be picklable
+        :return: A Future for the function's result
+        """
+        self.respawn()
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise Exception("cannot submit requests to a pool that has been shut down")
+            self.queued.append((func, payload, future))
+            self.dispatch()
+        return future
+
+    def dispatch(self):
+        # called with the lock held
+        while self.queued and self.idle:
+            worker = self.idle.popleft()
+            func, payload, future = self.queued.popleft()
+            if not future.set_running_or_notify_cancel():
+                # cancelled while it was queued
+                self.idle.appendleft(worker)
+                continue
+            self.next_request_id += 1
+            worker.request_id = self.next_request_id
+            worker.future = future
+            try:
+                worker.connection.send((worker.request_id, func, payload))
+            except (BrokenPipeError, OSError):
+                # the worker already died, the collector fails the request and replaces the worker
+                pass
+            except Exception as e:
+                # the payload couldn't be pickled
+                worker.future = None
+                self.idle.appendleft(worker)
+                future.set_exception(e)
+
+    def collect(self):
+        while True:
+            with self.lock:
+                if self.closed:
+                    return
+                waitables = {}
+                for worker in self.workers:
+                    waitables[worker.connection] = worker
+                    waitables[worker.process.sentinel] = worker
+            for ready in wait(list(waitables.keys()), timeout=POLL_INTERVAL):
+                worker = waitables[ready]
+                if ready is worker.connection:
+                    self.receive(worker)
+                else:
+                    self.replace(worker)
+
+    def receive(self, worker):
+        try:
+            request_id, result, error = worker.connection.recv()
+        except (EOFError, OSError):
+            # the worker died part way through a response, its sentinel is handled on the next wait
+            return
+        with self.lock:
+            future = worker.future
+            worker.future = None
+            worker.request_id = None
+            if worker in self.workers:
+                self.idle.append(worker)
+            self.dispatch()
+        if future is None:
+            # the request was killed, its worker replied just before it was
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def replace(self, worker):
+        # called from the collector thread, the replacement worker is forked by the pool's own thread
+        worker.process.join()
+        with self.lock:
+            if worker not in self.workers:
+                return
+            self.workers.remove(worker)
+            if worker in self.idle:
+                self.idle.remove(worker)
+            future = worker.future
+            worker.connection.close()
+            if self.closed:
+                return
+            self.dead += 1
+        self.notify()
+        if future is not None:
+            future.set_exception(Exception("worker process exited with code {} while processing the request"
+                                           .format(worker.process.exitcode)))
+
+    def notify(self, future=None):
+        with self.events:
+            self.events.notify_all()
+
+    def respawn(self):
+        """
+        Replaces the workers that have died, from the thread that created the pool
+        """
+        if not self.dead:
+            return
+        self.before_fork()
+        with self.lock:
+            if self.closed or not self.dead:
+                return
+            for _ in range(self.dead):
+                self.idle.append(self.spawn())
+            self.respawns += self.dead
+            self.dead = 0
+            self.dispatch()
+
+    def result(self, future, timeout=None):
+        """
+        Waits for a future's result, replacing any workers that die in the meantime, so that queued requests still
+        get a worker
+        :param timeout: The longest time in seconds to wait, None waits forever
+        :raises concurrent.futures.TimeoutError: if the future didn't complete within the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        future.add_done_callback(self.notify)
+        while True:
+            self.respawn()
+            with self.events:
+                if future.done():
+                    break
+                if self.dead:
+                    continue
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.events.wait(remaining)
+        return future.result(timeout=0)
+
+    def kill(self, future):
+        """
+        Stops a request that's running, by killing the worker process running it; the worker is then replaced
+        """
+        with self.lock:
+            workers = [worker for worker in self.workers if worker.future is future]
+            for worker in workers:
+                worker.future = None
+                worker.process.kill()
+        if workers:
+            future.set_exception(Exception("the request was stopped before it completed"))
+
+    def shutdown(self, wait=True):
+        with self.lock:
+            self.closed = True
+            workers = list(self.workers)
+            for _, _, future in self.queued:
+                future.set_exception(Exception("the pool was shut down before the request was processed"))
+            self.queued.clear()
+        for worker in workers:
+            try:
+                worker.connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        if wait:
+            for worker in workers:
+                worker.process.join()
+            self.collector.join()
+            for worker in workers:
+                worker.connection.close()
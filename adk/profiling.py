@@ -0,0 +1,209 @@
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class CProfiler(object):
+    """
+    Deterministic profiling with cProfile, profiles are saved in the pstats format, eg: for `python -m pstats` or snakeviz
+    """
+    extension = ".pstats"
+
+    def start(self):
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile):
+        profile.disable()
+        return pstats.Stats(profile)
+
+    def save(self, stats, path):
+        stats.dump_stats(path)
+
+    def top(self, stats, count):
+        functions = []
+        for (file_name, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+            functions.append({"function": describe(file_name, line, function), "calls": calls,
+                              "own_seconds": own, "cumulative_seconds": cumulative})
+        functions.sort(key=lambda function: function["own_seconds"], reverse=True)
+        return functions[:count]
+
+
+class SamplingProfiler(object):
+    extension = ".collapsed"
+
+    def __init__(self, interval=0.005):
+        """
+        Samples the stack of the thread being profiled from a background thread, which costs far less than cProfile
+        for apply functions that make many small calls; profiles are saved as collapsed stacks, eg: for
+        flamegraph.pl or speedscope
+        :param interval: The number of seconds between samples
+        """
+        self.interval = interval
+
+    def start(self):
+        sampler = Sampler(threading.get_ident(), self.interval)
+        sampler.start()
+        return sampler
+
+    def stop(self, sampler):
+        sampler.stop()
+        return sampler.stacks
+
+    def save(self, stacks, path):
+        with open(path, "w") as f:
+            for stack, samples in stacks.most_common():
+                f.write("{} {}\n".format(stack, samples))
+
+    def top(self, stacks, count):
+        own = Counter()
+        for stack, samples in stacks.items():
+            own[stack.rsplit(";", 1)[-1]] += samples
+        return [{"function": function, "samples": samples, "own_seconds": samples * self.interval}
+                for function, samples in own.most_common(count)]
+
+
+class Sampler(threading.Thread):
+    def __init__(self, thread_id, interval):
+        super(Sampler, self).__init__(name="adk-profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id, None)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(describe(code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def describe(file_name, line, function):
+    return "{}:{}({})".format(os.path.basename(file_name), line, function)
+
+
+class Profiling(object):
+    def __init__(self, every=0, output_dir=None, profiler=None, top=10):
+        """
+        Profiles selected requests, writing each profile to a local directory and attaching a summary of the
+        functions that took the most time to the request's response metadata
+        :param every: Profiles one in every `every` requests, 1 for every request; with 0 only requests whose envelope
+        sets `"profile": true` are profiled, which they can whatever this is set to
+        :param output_dir: The directory each profile is written to, None to only summarize them in the response
+        :param profiler: A CProfiler (the default) or SamplingProfiler, or any object with `start()` returning a
+        session, `stop(session)` returning a profile, `save(profile, path)` and `top(profile, count)` returning a list
+        :param top: The number of functions in each summary
+        """
+        self.every = every
+        self.output_dir = output_dir
+        self.profiler = profiler or CProfiler()
+        self.top = top
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.profiled = 0
+        # only one request is profiled at a time, as a profiler sees everything running while it's active
+        self.active = False
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+    def selected(self, request):
+        """
+        :param request: The request envelope
+        """
+        if request.get("profile", False) is True:
+            return True
+        if not self.every:
+            return False
+        with self.lock:
+            self.requests += 1
+            return self.requests % self.every == 0
+
+    def start(self):
+        """
+        :return: A profiling session, or None when another request is already being profiled
+        """
+        with self.lock:
+            if self.active:
+                return None
+            self.active = True
+            self.profiled += 1
+            sequence = self.profiled
+        try:
+            return self.profiler.start(), time.perf_counter(), sequence
+        except Exception:
+            with self.lock:
+                self.active = False
+            raise
+
+    def finish(self, session):
+        """
+        :return: The summary of a profiling session, for the response metadata, or None if the profile couldn't be
+        taken or saved; that's logged, the request's response is still returned without it
+        """
+        profiler_session, started, sequence = session
+        try:
+            profile = self.profiler.stop(profiler_session)
+            report = {"seconds": time.perf_counter() - started, "top": self.profiler.top(profile, self.top)}
+            if self.output_dir:
+                path = os.path.join(self.output_dir, "adk-profile-{}-{}{}".format(os.getpid(), sequence,
+                                                                                  self.profiler.extension))
+                self.profiler.save(profile, path)
+                report["path"] = path
+            return report
+        except Exception as e:
+            sys.stderr.write("unable to profile the request: {}\n".format(e))
+            return None
+        finally:
+            with self.lock:
+                self.active = False
+
+    def profile(self, func, *args):
+        """
+        :return: A tuple of the function's result and the summary of its profile, which is None if it wasn't profiled
+        """
+        session = self.start()
+        if session is None:
+            return func(*args), None
+        try:
+            result = func(*args)
+        finally:
+            report = self.finish(session)
+        return result, report
+
+
+def from_environment(environment=os.environ):
+    """
+    Configures profiling from the `ADK_PROFILE` environment variable: profiling one in every N requests,
+    or with 0 only the requests that ask to be. `ADK_PROFILE_DIR` is where profiles are written, and
+    `ADK_PROFILER=sampling` selects the sampling profiler.
+    :return: A Profiling instance, or None when `ADK_PROFILE` isn't set
+    """
+    every = environment.get("ADK_PROFILE", "")
+    if not every:
+        return None
+    try:
+        every = int(every)
+    except ValueError:
+        raise Exception("ADK_PROFILE must be the number of requests to profile one of, or 0, got '{}'".format(every))
+    profiler = environment.get("ADK_PROFILER", "cprofile")
+    if profiler == "sampling":
+        profiler = SamplingProfiler()
+    elif profiler == "cprofile":
+        profiler = CProfiler()
+    else:
+        raise Exception("ADK_PROFILER must be either 'cprofile' or 'sampling', got '{}'".format(profiler))
+    return Profiling(every, environment.get("ADK_PROFILE_DIR", None) or None, profiler)
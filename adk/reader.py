@@ -0,0 +1,161 @@
+import codecs
+import os
+import threading
+import time
+from collections import deque
+from queue import Empty
+
+# Marks the end of stdin in the reader queue
+EOF = None
+# Takes the place of a request that was shed from a full queue, it's answered with an Overloaded error without being
+# applied, in its turn so that responses stay in request order
+SHED = object()
+
+# What happens to a request read while the queue is full
+BLOCK = "block"
+REJECT_NEWEST = "reject_newest"
+SHED_OLDEST = "shed_oldest"
+OVERLOAD_POLICIES = (BLOCK, REJECT_NEWEST, SHED_OLDEST)
+
+# How many shed requests may be waiting to be answered before reading stops, so that the queue stays bounded when
+# requests are shed rather than blocked
+MAX_SHED = 1024
+# How many bytes are read from a file descriptor at a time
+READ_SIZE = 64 * 1024
+
+
+def read_lines(stream):
+    """
+    Yields the lines of a stream. A file is read from its descriptor with os.read rather than through its buffered
+    reader, whose lock this thread would hold while blocked reading; a worker process forked meanwhile would wait on
+    its copy of that lock forever, as multiprocessing closes stdin in every child.
+    """
+    try:
+        fd = stream.fileno()
+    except (AttributeError, OSError, ValueError):
+        # not a file, eg: a list of lines
+        for line in stream:
+            yield line
+        return
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parts = []
+    while True:
+        chunk = os.read(fd, READ_SIZE)
+        if not chunk:
+            rest = "".join(parts) + decoder.decode(b"", final=True)
+            if rest:
+                yield rest
+            return
+        text = decoder.decode(chunk)
+        if "\n" not in text:
+            parts.append(text)
+            continue
+        lines = text.split("\n")
+        parts.append(lines[0])
+        yield "".join(parts) + "\n"
+        for line in lines[1:-1]:
+            yield line + "\n"
+        parts = [lines[-1]]
+
+
+class StdinReader(object):
+    def __init__(self, stream, max_queued=None, policy=BLOCK, metrics=None, max_shed=MAX_SHED):
+        """
+        Reads request lines from a stream on a background thread, ahead of the request being processed, so that
+        callers can wait for them with a timeout
+        :param stream: The stream to read newline delimited requests from, usually sys.stdin
+        :param max_queued: The most requests that may be read ahead and waiting to be processed, None for no limit
+        :param policy: What happens to a request read while the queue is full: "block" stops reading until there's
+        room, "reject_newest" sheds that request, and "shed_oldest" sheds the longest waiting request to make room
+        :param metrics: An optional Metrics instance, the queue's depth and the time requests wait in it are recorded
+        to it
+        :param max_shed: How many shed requests may be waiting for their Overloaded response, reading stops until
+        they've been answered once there are this many
+        """
+        if policy not in OVERLOAD_POLICIES:
+            raise Exception("overload policy must be one of {}, got '{}'".format(", ".join(OVERLOAD_POLICIES), policy))
+        self.stream = stream
+        self.max_queued = max_queued
+        self.policy = policy
+        self.metrics = metrics
+        # [line, received] pairs, in the order they were read
+        self.entries = deque()
+        # the number of entries waiting to be processed, leaving out shed ones
+        self.queued = 0
+        self.shed = 0
+        self.max_shed = max_shed
+        # the number of entries waiting to be answered as shed
+        self.shed_waiting = 0
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.read, daemon=True)
+        self.thread.start()
+
+    def read(self):
+        try:
+            for line in read_lines(self.stream):
+                received = time.monotonic()
+                with self.condition:
+                    while self.shed_waiting >= self.max_shed:
+                        self.condition.wait()
+                    if self.max_queued is not None and self.queued >= self.max_queued:
+                        if self.policy == BLOCK:
+                            while self.queued >= self.max_queued:
+                                self.condition.wait()
+                        elif self.policy == REJECT_NEWEST:
+                            line = SHED
+                        else:
+                            self.shed_oldest()
+                    self.entries.append([line, received])
+                    if line is SHED:
+                        self.shed += 1
+                        self.shed_waiting += 1
+                    else:
+                        self.queued += 1
+                    self.condition.notify_all()
+                if self.metrics:
+                    self.metrics.gauge("queue_depth", self.queued)
+        finally:
+            with self.condition:
+                self.entries.append([EOF, None])
+                self.condition.notify_all()
+
+    def shed_oldest(self):
+        # called with the condition held
+        for entry in self.entries:
+            if entry[0] is not SHED:
+                entry[0] = SHED
+                self.queued -= 1
+                self.shed += 1
+                self.shed_waiting += 1
+                return
+
+    def get_entry(self, timeout=None):
+        """
+        Gets the next request line, SHED in place of a shed request, or EOF once the stream has been closed
+        :param timeout: The number of seconds to wait for a line, None waits forever and 0 or less does not wait
+        :return: A tuple of the line and when it was read, from time.monotonic
+        :raises queue.Empty: if no line arrived within the timeout
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.entries, None if timeout is None else max(timeout, 0)):
+                raise Empty()
+            if self.entries[0][0] is EOF:
+                # left in place, so every later call sees the end of the stream too
+                return EOF, None
+            line, received = self.entries.popleft()
+            if line is SHED:
+                self.shed_waiting -= 1
+            else:
+                self.queued -= 1
+            self.condition.notify_all()
+            queued = self.queued
+        if self.metrics and line is not SHED:
+            self.metrics.observe("queue_wait", time.monotonic() - received)
+            self.metrics.gauge("queue_depth", queued)
+        return line, received
+
+    def get(self, timeout=None):
+        """
+        Gets the next request line, or EOF once the stream has been closed, see `get_entry`
+        """
+        return self.get_entry(timeout)[0]
@@ -0,0 +1,120 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class ModelLoader(object):
+    def __init__(self, load, size=None, unload=None):
+        self.load = load
+        self.size = size
+        self.unload = unload
+
+
+class ModelResidency(object):
+    def __init__(self, get_model, memory_budget=None):
+        """
+        Keeps loaded models in memory, evicting the least recently used ones once a memory budget is exceeded
+        :param get_model: A function returning the local path of a model manifest file by name
+        :param memory_budget: The number of bytes loaded models may use, None for no limit
+        """
+        self.get_model = get_model
+        self.memory_budget = memory_budget
+        self.loaders = {}
+        # name -> (loaded model, size in bytes), least recently used first
+        self.resident = OrderedDict()
+        self.loading = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def register(self, name, load, size=None, unload=None):
+        """
+        Registers how a model manifest file is loaded; registering a name again swaps out its loader,
+        and any resident copy is evicted so the next acquire loads it with the new loader
+        :param name: The name of a required or optional file in the model manifest
+        :param load: A function that receives the model file's local path and returns the loaded model
+        :param size: An optional function that receives the loaded model and returns its size in bytes,
+        by default the size of the model file is used
+        :param unload: An optional function called with a model when it's evicted
+        """
+        with self.lock:
+            evicted = [self.remove(name)] if name in self.resident else []
+            self.loaders[name] = ModelLoader(load, size, unload)
+        self.unload(evicted)
+
+    def acquire(self, name):
+        with self.lock:
+            if name not in self.loaders:
+                raise Exception("no loader was registered for model '{}'".format(name))
+            if name in self.resident:
+                self.resident.move_to_end(name)
+                self.hits += 1
+                return self.resident[name][0]
+            loading = self.loading.get(name, None)
+            owner = loading is None
+            if owner:
+                loading = Future()
+                self.loading[name] = loading
+                loader = self.loaders[name]
+        if not owner:
+            # another request is already loading this model, wait for it rather than loading it again
+            return loading.result()
+        try:
+            path = self.get_model(name)
+            model = loader.load(path)
+            size = loader.size(model) if loader.size else os.path.getsize(path)
+        except Exception as e:
+            with self.lock:
+                del self.loading[name]
+            loading.set_exception(e)
+            raise
+        with self.lock:
+            del self.loading[name]
+            self.resident[name] = (model, size)
+            self.loads += 1
+            evicted = self.evict_over_budget(name)
+        loading.set_result(model)
+        self.unload(evicted)
+        return model
+
+    def evict(self, name):
+        with self.lock:
+            evicted = [self.remove(name)] if name in self.resident else []
+        self.unload(evicted)
+
+    def evict_over_budget(self, keep):
+        evicted = []
+        if self.memory_budget is None:
+            return evicted
+        for name in list(self.resident.keys()):
+            if self.resident_bytes() <= self.memory_budget:
+                break
+            if name != keep:
+                evicted.append(self.remove(name))
+        return evicted
+
+    def remove(self, name):
+        model, _ = self.resident.pop(name)
+        self.evictions += 1
+        return self.loaders[name], model
+
+    def unload(self, evicted):
+        for loader, model in evicted:
+            if loader.unload:
+                loader.unload(model)
+
+    def resident_bytes(self):
+        return sum(size for _, size in self.resident.values())
+
+    def stats(self):
+        with self.lock:
+            return {
+                "resident": list(self.resident.keys()),
+                "resident_bytes": self.resident_bytes(),
+                "memory_budget": self.memory_budget,
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
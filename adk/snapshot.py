@@ -0,0 +1,134 @@
+import hashlib
+import inspect
+import json
+import mmap
+import os
+import pickle
+import struct
+import sys
+
+# Out of band buffers (eg: numpy arrays) are aligned in the snapshot file so they can be used in place
+BUFFER_ALIGNMENT = 64
+HEADER = struct.Struct("<Q")
+
+
+class PickleSerializer(object):
+    """
+    The default snapshot serializer, large buffers such as numpy arrays are stored outside of the pickle stream
+    and are memory mapped, rather than copied, when the snapshot is restored
+    """
+    def __init__(self):
+        # out of band buffers need pickle protocol 5 (python 3.8), before that they're copied into the pickle stream
+        self.supports_buffers = pickle.HIGHEST_PROTOCOL >= 5
+
+    def dumps(self, state):
+        if not self.supports_buffers:
+            return pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        buffers = []
+        data = pickle.dumps(state, protocol=5, buffer_callback=buffers.append)
+        return data, [buffer.raw() for buffer in buffers]
+
+    def loads(self, data, buffers=None):
+        if buffers is None:
+            return pickle.loads(data)
+        return pickle.loads(data, buffers=buffers)
+
+
+class Snapshot(object):
+    def __init__(self, path, serializer=None):
+        """
+        A local file holding the algorithm's loaded state, so that later starts can skip the load function and
+        model downloads. The snapshot is only used while the model manifest (and its freeze file) is unchanged.
+        :param path: The path of the snapshot file
+        :param serializer: An optional object with `dumps(state)` returning bytes and `loads(data)`, used in place
+        of pickle; for state that pickle can't handle, or that has a faster dedicated format
+        """
+        self.path = path
+        self.serializer = serializer or PickleSerializer()
+        self.mapped = None
+
+    def key(self, manifest_paths, load_func=None):
+        """
+        Identifies the state a snapshot was taken of, by the content of the manifest files, the python version,
+        and the source of the load function
+        :param load_func: The algorithm's load function, editing the file that defines it invalidates the snapshot
+        """
+        hasher = hashlib.sha256()
+        hasher.update(sys.version.encode())
+        if load_func is not None:
+            hasher.update(source_of(load_func))
+        for manifest_path in manifest_paths:
+            hasher.update(manifest_path.encode())
+            if os.path.exists(manifest_path):
+                with open(manifest_path, "rb") as f:
+                    hasher.update(f.read())
+            else:
+                hasher.update(b"\0missing")
+        return hasher.hexdigest()
+
+    def save(self, key, state):
+        if getattr(self.serializer, "supports_buffers", False):
+            data, buffers = self.serializer.dumps(state)
+        else:
+            data, buffers = self.serializer.dumps(state), []
+        header = {"key": key, "data_size": len(data), "buffers": []}
+        offset = 0
+        for buffer in buffers:
+            header["buffers"].append([offset, buffer.nbytes])
+            offset = align(offset + buffer.nbytes)
+        encoded_header = json.dumps(header).encode("utf-8")
+        temp_path = "{}.tmp{}".format(self.path, os.getpid())
+        with open(temp_path, "wb") as f:
+            f.write(HEADER.pack(len(encoded_header)))
+            f.write(encoded_header)
+            f.write(data)
+            buffers_start = align(f.tell())
+            for (buffer_offset, _), buffer in zip(header["buffers"], buffers):
+                f.seek(buffers_start + buffer_offset)
+                f.write(buffer)
+        os.replace(temp_path, self.path)
+
+    def restore(self, key):
+        """
+        :return: The snapshot's state if it was taken with the same key, otherwise None
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            header_size, = HEADER.unpack(f.read(HEADER.size))
+            header = json.loads(f.read(header_size).decode("utf-8"))
+            if header["key"] != key:
+                return None
+            data = f.read(header["data_size"])
+            if not header["buffers"]:
+                if getattr(self.serializer, "supports_buffers", False):
+                    return self.serializer.loads(data, [])
+                return self.serializer.loads(data)
+            buffers_start = align(f.tell())
+            # copy on write, restored arrays are writable without changing the snapshot, and are paged in lazily
+            self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        view = memoryview(self.mapped)
+        buffers = [view[buffers_start + offset:buffers_start + offset + size] for offset, size in header["buffers"]]
+        return self.serializer.loads(data, buffers)
+
+    def invalidate(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def source_of(func):
+    """
+    :return: The source of the file that defines a function, or its bytecode when that file isn't available
+    """
+    try:
+        with open(inspect.getsourcefile(func), "rb") as f:
+            return f.read()
+    except (TypeError, OSError):
+        code = getattr(func, "__code__", None)
+        if code is not None:
+            return code.co_code
+        return getattr(func, "__qualname__", type(func).__name__).encode()
+
+
+def align(offset):
+    return (offset + BUFFER_ALIGNMENT - 1) // BUFFER_ALIGNMENT * BUFFER_ALIGNMENT
@@ -0,0 +1,43 @@
+import os
+import time
+
+# When the ADK package started being imported, the first thing it does
+IMPORT_STARTED = time.perf_counter()
+
+
+def process_age():
+    """
+    :return: The number of seconds since this process started, or None where /proc isn't available
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # the command name may contain spaces, the fields after it don't
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / float(os.sysconf("SC_CLK_TCK"))
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+
+
+class StartupTimes(object):
+    def __init__(self, imported):
+        """
+        Records how long each phase of starting an algorithm took, up to PIPE_INIT_COMPLETE
+        :param imported: When the ADK finished being imported, from time.perf_counter
+        """
+        self.phases = {}
+        age = process_age()
+        if age is not None:
+            # the interpreter itself, and anything the algorithm imported before the ADK
+            self.phases["before_adk_import"] = max(age - (time.perf_counter() - IMPORT_STARTED), 0.0)
+        self.phases["adk_import"] = imported - IMPORT_STARTED
+
+    def record(self, phase, seconds):
+        self.phases[phase] = seconds
+
+    def finish(self):
+        age = process_age()
+        if age is not None:
+            self.phases["process_total"] = age
+        return dict(self.phases)
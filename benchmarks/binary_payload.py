@@ -0,0 +1,85 @@
+"""
+Measures peak RSS and throughput of a binary request/response round trip, from the stdin line to the output pipe,
+for the previous all-in-memory serialization and the chunked binary response path.
+
+Each measurement runs in its own process so that peak RSS isn't shared between cases.
+
+usage: python benchmarks/binary_payload.py [--sizes 1K,1M,10M,100M]
+"""
+import argparse
+import base64
+import json
+import os
+import resource
+import subprocess
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from adk.io import encode_response, format_data
+from adk.pipe import PipeWriter
+
+UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(size):
+    if size[-1] in UNITS:
+        return int(size[:-1]) * UNITS[size[-1]]
+    return int(size)
+
+
+def old_format_data(request):
+    return bytes(base64.b64decode(request["data"]))
+
+
+def old_format_response(response):
+    response = str(base64.b64encode(response), "utf-8")
+    return json.dumps({"result": response, "metadata": {"content_type": "binary"}})
+
+
+def current_rss_kb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def run_child(mode, size, repeat):
+    line = json.dumps({"content_type": "binary", "data": base64.b64encode(os.urandom(size)).decode("ascii")})
+    writer = PipeWriter(os.devnull)
+    baseline_kb = current_rss_kb()
+    start = perf_counter()
+    for _ in range(repeat):
+        request = json.loads(line)
+        if mode == "old":
+            writer.write(old_format_response(old_format_data(request)))
+        else:
+            writer.write(encode_response(format_data(request)))
+        del request
+    elapsed = perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"seconds": elapsed / repeat, "peak_over_baseline_kb": max(peak_kb - baseline_kb, 0)}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1K,1M,10M,100M")
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        mode, size, repeat = args.child
+        run_child(mode, int(size), int(repeat))
+        return
+    print("{:>8} {:>6} {:>12} {:>14} {:>16}".format("size", "path", "MB/s", "ms/request", "peak RSS over input"))
+    for size_label in args.sizes.split(","):
+        size = parse_size(size_label)
+        repeat = max(1, min(1000, (64 * 1024 ** 2) // size))
+        for mode in ("old", "new"):
+            output = subprocess.check_output([sys.executable, __file__, "--child", mode, str(size), str(repeat)])
+            result = json.loads(output)
+            print("{:>8} {:>6} {:>12.1f} {:>14.3f} {:>13.1f} MB".format(
+                size_label, mode, size / result["seconds"] / 1024 ** 2, result["seconds"] * 1000,
+                result["peak_over_baseline_kb"] / 1024.0))
+
+
+if __name__ == "__main__":
+    main()
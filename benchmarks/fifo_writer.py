@@ -0,0 +1,68 @@
+"""
+Compares the throughput of reopening the output FIFO for every response against the persistent PipeWriter.
+
+usage: python benchmarks/fifo_writer.py [--requests N] [--size BYTES]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from adk.pipe import PipeWriter
+
+
+def drain(path, expected_lines):
+    # Like langserver, keep reading (and re-attaching after writer closes) until every response has arrived.
+    seen = 0
+    while seen < expected_lines:
+        with open(path, "rb") as f:
+            for _ in f:
+                seen += 1
+
+
+def reopen_per_response(path, payload, count):
+    for _ in range(count):
+        with open(path, "w") as f:
+            f.write(payload)
+            f.write("\n")
+
+
+def persistent_writer(path, payload, count):
+    writer = PipeWriter(path)
+    for _ in range(count):
+        writer.write(payload)
+    writer.close()
+
+
+def run(name, writer_func, path, payload, count):
+    reader = threading.Thread(target=drain, args=(path, count))
+    reader.start()
+    start = perf_counter()
+    writer_func(path, payload, count)
+    reader.join()
+    elapsed = perf_counter() - start
+    print("{:<24} {:>10.0f} requests/sec".format(name, count / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--size", type=int, default=256)
+    args = parser.parse_args()
+    payload = json.dumps({"result": "x" * args.size, "metadata": {"content_type": "text"}})
+    path = os.path.join(tempfile.mkdtemp(), "algoout")
+    os.mkfifo(path)
+    try:
+        run("reopen per response", reopen_per_response, path, payload, args.requests)
+        run("persistent writer", persistent_writer, path, payload, args.requests)
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
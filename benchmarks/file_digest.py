@@ -0,0 +1,80 @@
+"""
+Compares model file integrity checking before and after hashing while downloading.
+
+The old path writes the download to disk in 1 KB blocks, then re-reads it in 4 KB chunks to compute an md5.
+The new path hashes each 1 MB block as it's written, and hashes files already on disk through a memory map.
+
+usage: python benchmarks/file_digest.py [--size-mb N]
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from adk.digest import hash_file
+
+
+def old_md5_for_file(fname):
+    hash_md5 = hashlib.md5()
+    with open(fname, "rb") as f:
+        for chunk in iter(lambda: f.read(4096), b""):
+            hash_md5.update(chunk)
+    return str(hash_md5.hexdigest())
+
+
+def blocks(data, size):
+    view = memoryview(data)
+    for i in range(0, len(view), size):
+        yield view[i:i + size]
+
+
+def download_then_hash(data, path):
+    with open(path, "wb") as f:
+        for block in blocks(data, 1024):
+            f.write(block)
+    return old_md5_for_file(path)
+
+
+def hash_while_downloading(data, path, algorithm):
+    hasher = hashlib.new(algorithm)
+    with open(path, "wb") as f:
+        for block in blocks(data, 1024 * 1024):
+            f.write(block)
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def report(name, size, func):
+    start = perf_counter()
+    func()
+    elapsed = perf_counter() - start
+    print("{:<40} {:>8.2f}s {:>10.1f} MB/s".format(name, elapsed, size / elapsed / 1024 ** 2))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=512)
+    args = parser.parse_args()
+    size = args.size_mb * 1024 ** 2
+    data = os.urandom(size)
+    path = os.path.join(tempfile.mkdtemp(), "model.bin")
+    try:
+        print("-- download and verify --")
+        report("old: 1KB writes, then md5 re-read", size, lambda: download_then_hash(data, path))
+        for algorithm in ("md5", "sha256", "blake2b"):
+            report("new: hash while downloading ({})".format(algorithm), size,
+                   lambda: hash_while_downloading(data, path, algorithm))
+        print("-- verify a file already on disk --")
+        report("old: md5 in 4KB reads", size, lambda: old_md5_for_file(path))
+        for algorithm in ("md5", "sha256", "blake2b"):
+            report("new: memory mapped ({})".format(algorithm), size, lambda: hash_file(path, algorithm))
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
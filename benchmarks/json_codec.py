@@ -0,0 +1,62 @@
+"""
+Compares the installed JSON codecs on the request parse side (a stdin line into a request) and the response side
+(format_response, then writing to the output pipe), across a few payload shapes.
+
+usage: python benchmarks/json_codec.py [--repeat N]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from adk import io
+from adk.pipe import PipeWriter
+
+
+def payloads():
+    rng = random.Random(0)
+    return {
+        "small object": {"name": "Algorithmia", "n": 3, "tags": ["a", "b"]},
+        "feature vector (100k floats)": [rng.random() for _ in range(100000)],
+        "nested records (2k)": [{"id": i, "label": "label {}".format(i), "scores": [rng.random() for _ in range(8)],
+                                 "meta": {"valid": i % 2 == 0, "source": "data://bench/{}".format(i)}}
+                                for i in range(2000)],
+        "long text (1MB)": "lorem ipsum dolor sit amet " * 40000,
+    }
+
+
+def time_per_call(func, repeat):
+    start = perf_counter()
+    for _ in range(repeat):
+        func()
+    return (perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    codecs = []
+    for codec_class in io.CODECS:
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            print("{} is not installed, skipping".format(codec_class.name))
+    writer = PipeWriter(os.devnull)
+    print("{:<30} {:<8} {:>12} {:>12}".format("payload", "codec", "parse ms", "respond ms"))
+    for label, payload in payloads().items():
+        line = json.dumps({"content_type": "json", "data": payload})
+        for codec in codecs:
+            io.codec = codec
+            parse_ms = time_per_call(lambda: io.format_data(io.loads(line)), args.repeat)
+            respond_ms = time_per_call(lambda: writer.write(io.format_response(payload)), args.repeat)
+            print("{:<30} {:<8} {:>12.3f} {:>12.3f}".format(label, codec.name, parse_ms, respond_ms))
+    writer.close()
+
+
+if __name__ == "__main__":
+    main()
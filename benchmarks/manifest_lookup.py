@@ -0,0 +1,70 @@
+"""
+Measures ModelData.get_model lookups against manifests with many optional files, compared to scanning the manifest.
+
+usage: python benchmarks/manifest_lookup.py [--lookups N]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from adk.classes import FileData
+from adk.modeldata import ModelData
+
+
+def scanning_get_model(model_data, model_name):
+    # the lookup as it was before manifest entries were indexed
+    if model_name in model_data.models:
+        return model_data.models[model_name].file_path
+    elif len([optional for optional in model_data.manifest_data['optional_files'] if
+              optional['name'] == model_name]) > 0:
+        found_models = [optional for optional in model_data.manifest_data['optional_files'] if
+                        optional['name'] == model_name]
+        return found_models[0]['source_uri']
+    raise Exception("model name " + model_name + " not found in manifest")
+
+
+def indexed_lookup(model_data, model_name):
+    if model_name in model_data.models:
+        return model_data.models[model_name].file_path
+    return model_data.optional_files[model_name]['source_uri']
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lookups", type=int, default=20000)
+    args = parser.parse_args()
+    workdir = tempfile.mkdtemp()
+    try:
+        for entries in (10, 100, 1000):
+            manifest_path = os.path.join(workdir, "model_manifest.json")
+            optional_files = [{"name": "model_{}".format(i), "source_uri": "data://bench/model_{}".format(i)}
+                              for i in range(entries)]
+            with open(manifest_path, "w") as f:
+                json.dump({"required_files": [], "optional_files": optional_files}, f)
+            model_data = ModelData(None, manifest_path)
+            # the last entry is the worst case for a scan; it's resolved but not yet loaded
+            name = "model_{}".format(entries - 1)
+            for label, lookup in (("scan", scanning_get_model), ("index", indexed_lookup)):
+                start = perf_counter()
+                for _ in range(args.lookups):
+                    lookup(model_data, name)
+                elapsed = perf_counter() - start
+                print("{:>5} entries {:<6} {:>10.2f} us/lookup".format(entries, label, elapsed / args.lookups * 1e6))
+            model_data.models[name] = FileData(None, "/tmp/" + name)
+            start = perf_counter()
+            for _ in range(args.lookups):
+                model_data.get_model(name)
+            elapsed = perf_counter() - start
+            print("{:>5} entries {:<6} {:>10.2f} us/lookup".format(entries, "loaded", elapsed / args.lookups * 1e6))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Measures how the throughput of a CPU-bound algorithm scales with the number of pre-forked worker processes,
+against the single process (thread) loop, which the GIL serializes.
+
+usage: python benchmarks/prefork_scaling.py [--requests N] [--workers 1,2,4,8] [--work N]
+"""
+import argparse
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from adk import ADK
+from adk.concurrency import create_executor
+
+
+def load():
+    # a large loaded state, shared by the forked workers rather than copied into each of them
+    return {"table": list(range(1000000))}
+
+
+def apply(input, state):
+    table = state["table"]
+    total = 0
+    for i in range(input["work"]):
+        total += table[(i * 7919) % len(table)] ^ i
+    return total
+
+
+def requests_per_second(algorithm, workers, executor, requests, work):
+    pool, apply_func, _ = create_executor(algorithm, workers, executor)
+    try:
+        start = perf_counter()
+        futures = [pool.submit(apply_func, {"work": work}) for _ in range(requests)]
+        for future in futures:
+            future.result()
+        return requests / (perf_counter() - start)
+    finally:
+        pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--workers", default=",".join(str(n) for n in (1, 2, 4, 8) if n <= (os.cpu_count() or 1)))
+    parser.add_argument("--work", type=int, default=200000)
+    args = parser.parse_args()
+    algorithm = ADK(apply, load)
+    algorithm.load()
+    print("{:>8} {:>8} {:>14} {:>10}".format("workers", "executor", "requests/s", "speedup"))
+    baseline = None
+    for workers in (int(n) for n in args.workers.split(",")):
+        for executor in ("thread", "process"):
+            throughput = requests_per_second(algorithm, workers, executor, args.requests, args.work)
+            baseline = baseline or throughput
+            print("{:>8} {:>8} {:>14.1f} {:>9.2f}x".format(workers, executor, throughput, throughput / baseline))
+
+
+if __name__ == "__main__":
+    main()
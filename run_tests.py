@@ -1,5 +1,15 @@
 from tests.test_adk_remote import RemoteTest
 from tests.test_adk_local import LocalTest
+from tests.test_modeldata import ModelDataTest
+from tests.test_io import IOTest
+from tests.test_metrics import MetricsTest
+from tests.test_snapshot import SnapshotTest
+from tests.test_memo import ResponseCacheTest
+from tests.test_bench import BenchTest
+from tests.test_startup import StartupTest
+from tests.test_profiling import ProfilingTest
+from tests.test_reader import ReaderTest
+from tests.test_mlops import MLOpsTest
 import unittest
 import os
 if __name__ == "__main__":
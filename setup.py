@@ -17,6 +17,10 @@ setup(
         'pyaml>=21.10,<21.11',
         'six',
     ],
+    extras_require={
+        'fast_json': ['orjson'],
+        'mlops': ['datarobot-mlops', 'pandas'],
+    },
     include_package_data=True,
     classifiers=[
         "Development Status :: 5 - Production/Stable",
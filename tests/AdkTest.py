@@ -1,7 +1,51 @@
+import json
+import os
+import sys
+import unittest
 from adk import ADK
 from adk.modeldata import ModelData
 
 class ADKTest(ADK):
-    def __init__(self, apply_func, load_func=None, client=None, manifest_path="model_manifest.json.freeze"):
-        super(ADKTest, self).__init__(apply_func, load_func, client)
-        self.model_data = ModelData(self.client, manifest_path)
+    def __init__(self, apply_func=None, load_func=None, client=None, manifest_path="model_manifest.json.freeze",
+                 **kwargs):
+        super(ADKTest, self).__init__(apply_func, load_func, client, **kwargs)
+        self.model_data = ModelData(self.client, manifest_path, cache=self.model_cache, metrics=self.metrics)
+
+
+class PipeTest(unittest.TestCase):
+    """Runs algorithms as they're run remotely, reading their responses from the output FIFO"""
+    if os.name == "posix":
+        fifo_pipe_path = "/tmp/algoout"
+    fifo_pipe = None
+
+    def setUp(self):
+        try:
+            os.mkfifo(self.fifo_pipe_path)
+        except Exception:
+            pass
+
+    def tearDown(self):
+        if os.name == "posix":
+            os.remove(self.fifo_pipe_path)
+
+    def read_all_from_pipe(self):
+        chunks = []
+        while True:
+            read_obj = os.read(self.fifo_pipe, 10000)
+            if not read_obj:
+                break
+            chunks.append(read_obj)
+        os.close(self.fifo_pipe)
+        lines = b"".join(chunks).decode("utf-8").splitlines()
+        return [json.loads(line) for line in lines]
+
+    def open_pipe(self):
+        if os.name == "posix":
+            self.fifo_pipe = os.open(self.fifo_pipe_path, os.O_RDONLY | os.O_NONBLOCK)
+
+    def execute_stream(self, input, apply, load=None, adk_kwargs=None, **init_kwargs):
+        self.open_pipe()
+        algo = ADKTest(apply, load, **(adk_kwargs or {}))
+        sys.stdin = input
+        algo.init(**init_kwargs)
+        return self.read_all_from_pipe()
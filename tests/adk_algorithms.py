@@ -1,6 +1,8 @@
 import Algorithmia
+import asyncio
 import base64
 import os
+import time
 
 
 # -- Apply functions --- #
@@ -14,6 +16,62 @@ def apply_binary(input):
     return bytes("hello " + input, encoding='utf8')
 
 
+def apply_sleep(input):
+    time.sleep(input["sleep"])
+    if input.get("fail"):
+        raise Exception("failed after sleeping")
+    return "hello " + input["name"]
+
+
+def apply_read_model(input, model_data):
+    with open(model_data.get_model(input), "rb") as f:
+        return f.read().decode("utf-8")
+
+
+def load_model_data(model_data):
+    model_data["loaded"] = True
+    return model_data
+
+
+def apply_crash(input):
+    if input == "crash":
+        # a hard exit, as if the process was killed for using too much memory
+        os._exit(3)
+    return "hello " + input
+
+
+async def apply_async_sleep(input):
+    await asyncio.sleep(input["sleep"])
+    if input.get("fail"):
+        raise Exception("failed after sleeping")
+    return "hello " + input["name"]
+
+
+async def apply_async_with_state(input, model_data):
+    return "hello " + input + " " + model_data['message']
+
+
+def apply_batch_basic(inputs):
+    return ["hello " + input if input != "fail" else Exception("failed in batch") for input in inputs]
+
+
+def apply_batch_wrong_size(inputs):
+    return inputs[1:]
+
+
+def apply_stream(input):
+    for word in input["words"]:
+        if word == "fail":
+            raise Exception("failed while streaming")
+        yield word
+
+
+async def apply_async_stream(input):
+    for word in input["words"]:
+        await asyncio.sleep(0)
+        yield {"word": word}
+
+
 def apply_input_or_context(input, model_data=None):
     if model_data:
         return model_data.data()
@@ -34,6 +92,12 @@ def loading_text(modelData):
     return modelData
 
 
+async def loading_async(modelData):
+    await asyncio.sleep(0)
+    modelData['message'] = 'loaded asynchronously'
+    return modelData
+
+
 def loading_exception(modelData):
     raise Exception("This exception was thrown in loading")
 
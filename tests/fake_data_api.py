@@ -0,0 +1,81 @@
+import os
+import tempfile
+import threading
+import time
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+
+class FakeDataFile(object):
+    def __init__(self, api, path):
+        self.api = api
+        self.path = path
+        self.url = path
+
+    def getFile(self, as_path=False):
+        with self.api.lock:
+            self.api.requests.append(self.path)
+        time.sleep(self.api.latency)
+        if self.path not in self.api.files:
+            raise Exception("unable to get file {} - file does not exist".format(self.path))
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(self.api.files[self.path])
+        if as_path:
+            return f.name
+        else:
+            return open(f.name)
+
+
+class FakeLocalDataFile(object):
+    """Like the Algorithmia client's LocalDataFile, it has a data API url, but is read from local disk"""
+
+    def __init__(self, api, path):
+        self.api = api
+        self.path = path.replace("file://", "")
+        self.url = "/v1/data/" + self.path
+
+    def getFile(self, as_path=False):
+        if not os.path.exists(self.path):
+            raise Exception("unable to get file {} - file does not exist".format(self.path))
+        if as_path:
+            return self.path
+        else:
+            return open(self.path)
+
+
+class FakeClient(object):
+    def __init__(self, files, latency=0):
+        """
+        A local stand-in for the Algorithmia data API
+        :param files: A dict of data API uris to the bytes that they contain
+        :param latency: How long every download takes, in seconds
+        """
+        self.files = files
+        self.latency = latency
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def file(self, path):
+        if path.startswith("file://"):
+            return FakeLocalDataFile(self, path)
+        return FakeDataFile(self, path)
+
+
+class FakeStreamingClient(FakeClient):
+    """A data API stand-in that also supports streamed downloads, like the Algorithmia client"""
+
+    def getStreamHelper(self, url):
+        with self.lock:
+            self.requests.append(url)
+        time.sleep(self.latency)
+        if url not in self.files:
+            return FakeResponse(404, b"")
+        return FakeResponse(200, self.files[url])
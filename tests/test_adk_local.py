@@ -149,6 +149,30 @@ class LocalTest(unittest.TestCase):
         actual_output['error']['stacktrace'] = ''
         self.assertEqual(expected_output, actual_output)
 
+    def test_async_apply_and_load(self):
+        input = 'Algorithmia'
+        expected_output = {"metadata":
+            {
+                "content_type": "text"
+            },
+            "result": "hello Algorithmia loaded asynchronously"
+        }
+        actual_output = json.loads(self.execute_example(input, apply_async_with_state, loading_async))
+        self.assertEqual(expected_output, actual_output)
+
+    def test_batch_apply_single_payload(self):
+        algo = ADKTest(apply_batch_func=apply_batch_basic)
+        output = []
+        algo.init('Algorithmia', pprint=lambda x: output.append(x))
+        self.assertEqual("hello Algorithmia", json.loads(output[0])["result"])
+
+    def test_streaming_apply(self):
+        algo = ADKTest(apply_stream)
+        output = []
+        algo.init({"words": ["hello", "world"]}, pprint=lambda x: output.append(x))
+        self.assertEqual(["hello", "world", None],
+                         [json.loads(record).get("chunk", json.loads(record).get("result")) for record in output])
+
 
 def run_test():
     unittest.main()
@@ -1,27 +1,28 @@
+import asyncio
+import io
 import sys
 import json
+import subprocess
+import threading
 import unittest
 import os
-from tests.AdkTest import ADKTest
+import time
+from tests.AdkTest import ADKTest, PipeTest
+from adk.metrics import Metrics, CallbackSink
+from adk.memo import ResponseCache
+from adk.profiling import Profiling
+from adk.prefork import PreforkPool
+from adk.deadline import MAX_ABANDONED_CALLS
+from adk.modeldata import md5_for_str
+from tests.fake_data_api import FakeClient
+from adk.pipe import PipeWriter
 import base64
+import shutil
+import tempfile
 from tests.adk_algorithms import *
 
 
-class RemoteTest(unittest.TestCase):
-    if os.name == "posix":
-        fifo_pipe_path = "/tmp/algoout"
-    fifo_pipe = None
-
-    def setUp(self):
-        try:
-            os.mkfifo(self.fifo_pipe_path)
-        except Exception:
-            pass
-
-    def tearDown(self):
-        if os.name == "posix":
-            os.remove(self.fifo_pipe_path)
-
+class RemoteTest(PipeTest):
     def read_in(self):
         if os.name == "posix":
             return self.read_from_pipe()
@@ -39,10 +40,6 @@ class RemoteTest(unittest.TestCase):
         os.close(self.fifo_pipe)
         return actual_output
 
-    def open_pipe(self):
-        if os.name == "posix":
-            self.fifo_pipe = os.open(self.fifo_pipe_path, os.O_RDONLY | os.O_NONBLOCK)
-
     def execute_example(self, input, apply, load=None):
         self.open_pipe()
         algo = ADKTest(apply, load)
@@ -176,6 +173,470 @@ class RemoteTest(unittest.TestCase):
                                                                     ".json")
         self.assertEqual(expected_output, actual_output)
 
+    def test_multiple_requests_single_pipe(self):
+        inputs = [{'content_type': 'json', 'data': 'Algorithmia'}, {'content_type': 'json', 'data': 'ADK'}]
+        expected_output = ["hello Algorithmia", "hello ADK"]
+        input = [str(json.dumps(request)) for request in inputs]
+        actual_output = self.execute_stream(input, apply_basic)
+        self.assertEqual(expected_output, [output["result"] for output in actual_output])
+
+    def sleeping_requests(self):
+        inputs = [{'name': 'first', 'sleep': 0.3}, {'name': 'second', 'sleep': 0.1},
+                  {'name': 'third', 'sleep': 0.2, 'fail': True}, {'name': 'fourth', 'sleep': 0}]
+        return [str(json.dumps({'content_type': 'json', 'data': request})) for request in inputs]
+
+    def test_concurrent_thread_ordering(self):
+        actual_output = self.execute_stream(self.sleeping_requests(), apply_sleep, concurrency=3, executor="thread")
+        self.assertEqual("hello first", actual_output[0]["result"])
+        self.assertEqual("hello second", actual_output[1]["result"])
+        self.assertEqual("failed after sleeping", actual_output[2]["error"]["message"])
+        self.assertEqual("AlgorithmError", actual_output[2]["error"]["error_type"])
+        self.assertEqual("hello fourth", actual_output[3]["result"])
+
+    def test_concurrent_process_ordering(self):
+        # forked workers close sys.stdin on startup, so it must be a real file object
+        input = io.StringIO("\n".join(self.sleeping_requests()))
+        actual_output = self.execute_stream(input, apply_sleep, concurrency=2, executor="process")
+        self.assertEqual("hello first", actual_output[0]["result"])
+        self.assertEqual("hello second", actual_output[1]["result"])
+        self.assertEqual("failed after sleeping", actual_output[2]["error"]["message"])
+        self.assertEqual("hello fourth", actual_output[3]["result"])
+
+    def test_concurrent_loading_error(self):
+        input = {'content_type': 'json', 'data': 'Algorithmia'}
+        input = [str(json.dumps(input))] * 2
+        actual_output = self.execute_stream(input, apply_input_or_context, loading_exception, concurrency=2)
+        self.assertEqual(["LoadingError", "LoadingError"], [output["error"]["error_type"] for output in actual_output])
+
+    def test_async_apply_ordering(self):
+        actual_output = self.execute_stream(self.sleeping_requests(), apply_async_sleep, concurrency=4)
+        self.assertEqual("hello first", actual_output[0]["result"])
+        self.assertEqual("hello second", actual_output[1]["result"])
+        self.assertEqual("failed after sleeping", actual_output[2]["error"]["message"])
+        self.assertEqual("AlgorithmError", actual_output[2]["error"]["error_type"])
+        self.assertEqual("hello fourth", actual_output[3]["result"])
+
+    def test_async_apply_from_stdin_pipe(self):
+        read_fd, write_fd = os.pipe()
+        requests = [{'content_type': 'json', 'data': {'name': str(i), 'sleep': 0.2}} for i in range(5)]
+        os.write(write_fd, "\n".join(json.dumps(request) for request in requests).encode("utf-8") + b"\n")
+        os.close(write_fd)
+        start = time.time()
+        actual_output = self.execute_stream(os.fdopen(read_fd), apply_async_sleep, concurrency=5)
+        self.assertLess(time.time() - start, 0.2 * len(requests))
+        self.assertEqual(["hello " + str(i) for i in range(5)], [output["result"] for output in actual_output])
+
+    def test_async_loading(self):
+        input = [str(json.dumps({'content_type': 'json', 'data': 'Algorithmia'}))]
+        actual_output = self.execute_stream(input, apply_async_with_state, loading_async)
+        self.assertEqual(["hello Algorithmia loaded asynchronously"], [output["result"] for output in actual_output])
+
+    def test_batch_apply(self):
+        batch_sizes = []
+
+        def apply_batch(inputs):
+            batch_sizes.append(len(inputs))
+            return apply_batch_basic(inputs)
+
+        names = ["Algorithmia", "fail", "ADK", "batch", "last"]
+        input = [str(json.dumps({'content_type': 'json', 'data': name})) for name in names]
+        actual_output = self.execute_stream(input, None, adk_kwargs={'apply_batch_func': apply_batch,
+                                                                     'max_batch_size': 2, 'max_wait_ms': 500})
+        self.assertEqual([2, 2, 1], batch_sizes)
+        self.assertEqual("hello Algorithmia", actual_output[0]["result"])
+        self.assertEqual("failed in batch", actual_output[1]["error"]["message"])
+        self.assertEqual("AlgorithmError", actual_output[1]["error"]["error_type"])
+        self.assertEqual(["hello ADK", "hello batch", "hello last"], [output["result"] for output in actual_output[2:]])
+
+    def test_batch_apply_malformed_requests(self):
+        batches = []
+
+        def apply_batch(inputs):
+            batches.append(inputs)
+            return apply_batch_basic(inputs)
+
+        input = [str(json.dumps({'content_type': 'json', 'data': 'Algorithmia'})), '{"content_type": "json", "da',
+                 str(json.dumps({'content_type': 'xml', 'data': '<a/>'})),
+                 str(json.dumps({'content_type': 'json', 'data': 'ADK'}))]
+        actual_output = self.execute_stream(input, None, adk_kwargs={'apply_batch_func': apply_batch,
+                                                                     'max_wait_ms': 500})
+        self.assertEqual([["Algorithmia", "ADK"]], batches)
+        self.assertEqual("hello Algorithmia", actual_output[0]["result"])
+        self.assertEqual("AlgorithmError", actual_output[1]["error"]["error_type"])
+        self.assertEqual("Invalid content_type: xml", actual_output[2]["error"]["message"])
+        self.assertEqual("hello ADK", actual_output[3]["result"])
+
+    def test_batch_apply_wrong_size(self):
+        input = [str(json.dumps({'content_type': 'json', 'data': name})) for name in ["Algorithmia", "ADK"]]
+        actual_output = self.execute_stream(input, None, adk_kwargs={'apply_batch_func': apply_batch_wrong_size})
+        self.assertEqual(2, len(actual_output))
+        for output in actual_output:
+            self.assertEqual("batch apply function returned 1 results for 2 requests", output["error"]["message"])
+
+    def test_streaming_apply(self):
+        input = [str(json.dumps({'content_type': 'json', 'data': {'words': words}}))
+                 for words in (["hello", "stream"], ["partial", "fail", "never"])]
+        actual_output = self.execute_stream(input, apply_stream)
+        self.assertEqual([{"chunk": "hello", "metadata": {"content_type": "text", "stream": {"sequence": 0}}},
+                          {"chunk": "stream", "metadata": {"content_type": "text", "stream": {"sequence": 1}}},
+                          {"result": None, "metadata": {"content_type": "json",
+                                                        "stream": {"chunks": 2, "complete": True}}}],
+                         actual_output[:3])
+        self.assertEqual("partial", actual_output[3]["chunk"])
+        self.assertEqual("failed while streaming", actual_output[4]["error"]["message"])
+        self.assertEqual("AlgorithmError", actual_output[4]["error"]["error_type"])
+        self.assertEqual(5, len(actual_output))
+
+    def test_process_worker_crash(self):
+        input = io.StringIO("\n".join(str(json.dumps({'content_type': 'json', 'data': name}))
+                                      for name in ("a", "crash", "b", "crash", "c", "d")))
+        actual_output = self.execute_stream(input, apply_crash, concurrency=2, executor="process")
+        self.assertEqual(["hello a", None, "hello b", None, "hello c", "hello d"],
+                         [output.get("result") for output in actual_output])
+        self.assertEqual("worker process exited with code 3 while processing the request",
+                         actual_output[1]["error"]["message"])
+        self.assertEqual("AlgorithmError", actual_output[3]["error"]["error_type"])
+
+    def test_process_worker_crash_with_queue(self):
+        # a real file, which the queue's reader thread is blocked reading while a replacement worker is forked; it's
+        # written by another process, as forked workers would otherwise keep its write end, and so stdin, open
+        script = ("import json, sys, time\n"
+                  "for names in (('a', 'crash'), ('b', 'c')):\n"
+                  "    for name in names:\n"
+                  "        print(json.dumps({'content_type': 'json', 'data': name}), flush=True)\n"
+                  "    time.sleep(0.5)\n")
+        writer = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE)
+        self.addCleanup(writer.wait)
+        actual_output = self.execute_stream(io.TextIOWrapper(writer.stdout), apply_crash, adk_kwargs={"max_queued": 4},
+                                            concurrency=2, executor="process")
+        self.assertEqual(["hello a", None, "hello b", "hello c"], [output.get("result") for output in actual_output])
+        self.assertEqual("AlgorithmError", actual_output[1]["error"]["error_type"])
+
+    def test_process_executor_single_worker(self):
+        input = io.StringIO("\n".join(str(json.dumps({'content_type': 'json', 'data': name}))
+                                      for name in ("a", "crash", "b")))
+        actual_output = self.execute_stream(input, apply_crash, concurrency=1, executor="process")
+        self.assertEqual(["hello a", None, "hello b"], [output.get("result") for output in actual_output])
+        self.assertEqual("worker process exited with code 3 while processing the request",
+                         actual_output[1]["error"]["message"])
+
+    def test_prefork_respawns_from_pool_thread(self):
+        # forked workers close sys.stdin on startup, so it must be a real file object
+        sys.stdin = io.StringIO()
+        pool = PreforkPool(1)
+        spawn = pool.spawn
+        spawning_threads = []
+
+        def recording_spawn():
+            spawning_threads.append(threading.current_thread())
+            return spawn()
+
+        pool.spawn = recording_spawn
+        try:
+            with self.assertRaises(Exception):
+                pool.result(pool.submit(os._exit, 3), timeout=5)
+            self.assertEqual(2, pool.result(pool.submit(abs, -2), timeout=5))
+            self.assertEqual(1, pool.respawns)
+            # the collector only records the dead worker, it's replaced from the thread using the pool
+            self.assertEqual([threading.main_thread()], spawning_threads)
+        finally:
+            pool.shutdown()
+
+    def test_forked_child_abandons_pipe_without_flushing(self):
+        path = os.path.join(tempfile.mkdtemp(), "out")
+        writer = PipeWriter(path)
+        writer.open().write(b"pending")
+        pid = os.fork()
+        if pid == 0:
+            writer.abandon()
+            os._exit(0)
+        os.waitpid(pid, 0)
+        writer.close()
+        with open(path, "rb") as f:
+            self.assertEqual(b"pending", f.read())
+        shutil.rmtree(os.path.dirname(path))
+
+    def test_background_prefetch_in_process_pool(self):
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir)
+        manifest_path = os.path.join(workdir, "model_manifest.json")
+        with open(manifest_path, "w") as f:
+            json.dump({"required_files": [{"name": "model", "source_uri": "data://test/model.bin",
+                                           "fail_on_tamper": True, "md5_checksum": md5_for_str("model file"),
+                                           "prefetch": "background"}],
+                       "optional_files": []}, f)
+        # still downloading when the workers are forked
+        client = FakeClient({"data://test/model.bin": b"model file"}, latency=0.3)
+        input = io.StringIO(str(json.dumps({'content_type': 'json', 'data': "model"})))
+        actual_output = self.execute_stream(input, apply_read_model, load_model_data,
+                                            adk_kwargs={"client": client, "manifest_path": manifest_path,
+                                                        "timeout": 5}, concurrency=2, executor="process")
+        self.assertEqual(["model file"], [output.get("result") for output in actual_output])
+
+    def test_streaming_apply_in_process_pool(self):
+        input = io.StringIO("\n".join(str(json.dumps({'content_type': 'json', 'data': {'words': [str(i), "end"]}}))
+                                      for i in range(3)))
+        actual_output = self.execute_stream(input, apply_stream, concurrency=2, executor="process")
+        self.assertEqual(["0", "end", None, "1", "end", None, "2", "end", None],
+                         [output.get("chunk", output.get("result")) for output in actual_output])
+
+    def test_async_streaming_apply(self):
+        input = [str(json.dumps({'content_type': 'json', 'data': {'words': words}})) for words in (["a", "b"], ["c"])]
+        actual_output = self.execute_stream(input, apply_async_stream, concurrency=2)
+        self.assertEqual([{"word": "a"}, {"word": "b"}, None, {"word": "c"}, None],
+                         [output.get("chunk", output.get("result")) for output in actual_output])
+
+    def test_metrics(self):
+        snapshots = []
+        metrics = Metrics(sinks=[CallbackSink(snapshots.append)])
+        input = [str(json.dumps({'content_type': 'json', 'data': {'sleep': 0, 'name': name, 'fail': name == "b"}}))
+                 for name in ("a", "b", "c")]
+        actual_output = self.execute_stream(input, apply_sleep, loading_text, adk_kwargs={"metrics": metrics})
+        self.assertEqual(["hello a", None, "hello c"], [output.get("result") for output in actual_output])
+        snapshot = snapshots[-1]
+        for phase in ("stdin_read", "json_loads", "format_data", "apply", "write", "request"):
+            self.assertEqual(3, snapshot["phases"][phase]["count"])
+        self.assertEqual(2, snapshot["phases"]["format_response"]["count"])
+        self.assertEqual({"AlgorithmError": 1}, snapshot["errors"])
+        self.assertEqual(3, snapshot["counters"]["requests"])
+        self.assertIn("load_func", snapshot["load"])
+        self.assertIn("total", snapshot["load"])
+
+    def test_metrics_concurrent(self):
+        snapshots = []
+        metrics = Metrics(sinks=[CallbackSink(snapshots.append)])
+        input = [str(json.dumps({'content_type': 'json', 'data': {'sleep': 0.01, 'name': str(i)}})) for i in range(4)]
+        self.execute_stream(input, apply_sleep, adk_kwargs={"metrics": metrics}, concurrency=2)
+        snapshot = snapshots[-1]
+        self.assertEqual(4, snapshot["phases"]["apply"]["count"])
+        self.assertEqual(4, snapshot["counters"]["requests"])
+
+    def test_response_cache(self):
+        calls = []
+
+        def apply(input):
+            calls.append(input)
+            if input == "fail":
+                raise Exception("not cached")
+            return "hello " + input
+
+        requests = [{'content_type': 'json', 'data': name} for name in ("a", "b", "a", "fail", "fail", "a")]
+        requests.append({'content_type': 'json', 'data': "a", 'cache': False})
+        input = [str(json.dumps(request)) for request in requests]
+        cache = ResponseCache()
+        actual_output = self.execute_stream(input, apply, adk_kwargs={"response_cache": cache})
+        self.assertEqual(["hello a", "hello b", "hello a", None, None, "hello a", "hello a"],
+                         [output.get("result") for output in actual_output])
+        self.assertEqual(["a", "b", "fail", "fail", "a"], calls)
+        self.assertEqual({"entries": 2, "hits": 2, "misses": 4}, {key: cache.stats()[key]
+                                                                  for key in ("entries", "hits", "misses")})
+
+    def test_response_cache_concurrent(self):
+        calls = []
+
+        def apply(input):
+            calls.append(input["name"])
+            time.sleep(0.05)
+            return "hello " + input["name"]
+
+        input = [str(json.dumps({'content_type': 'json', 'data': {'name': name}})) for name in ("a", "a", "b", "a")]
+        snapshots = []
+        metrics = Metrics(sinks=[CallbackSink(snapshots.append)])
+        actual_output = self.execute_stream(input, apply, adk_kwargs={"response_cache": ResponseCache(key="input"),
+                                                                      "metrics": metrics}, concurrency=2)
+        self.assertEqual(["hello a", "hello a", "hello b", "hello a"], [output["result"] for output in actual_output])
+        # the second "a" arrives while the first is still in flight
+        self.assertEqual(["a", "a", "b"], calls)
+        self.assertEqual(1, snapshots[-1]["counters"]["response_cache_hits"])
+
+    def test_request_timeout(self):
+        requests = [{'content_type': 'json', 'data': {'sleep': 2, 'name': "slow"}},
+                    {'content_type': 'json', 'data': {'sleep': 0, 'name': "fast"}},
+                    {'content_type': 'json', 'data': {'sleep': 0.3, 'name': "own timeout"}, 'timeout': 1},
+                    {'content_type': 'json', 'data': {'sleep': 0, 'name': "expired"}, 'deadline': time.time() - 1}]
+        input = [str(json.dumps(request)) for request in requests]
+        start = time.monotonic()
+        actual_output = self.execute_stream(input, apply_sleep, adk_kwargs={"timeout": 0.2})
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual([None, "hello fast", "hello own timeout", None],
+                         [output.get("result") for output in actual_output])
+        for output in (actual_output[0], actual_output[3]):
+            self.assertEqual("TimeoutError", output["error"]["error_type"])
+
+    def test_abandoned_deadline_calls_are_capped(self):
+        input = [str(json.dumps({'content_type': 'json', 'data': {'sleep': 1, 'name': "slow"}}))
+                 for _ in range(MAX_ABANDONED_CALLS + 1)]
+        start = time.monotonic()
+        actual_output = self.execute_stream(input, apply_sleep, adk_kwargs={"timeout": 0.05})
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(["TimeoutError"] * MAX_ABANDONED_CALLS + ["Overloaded"],
+                         [output["error"]["error_type"] for output in actual_output])
+
+    def test_invalid_request_deadline(self):
+        requests = [{'content_type': 'json', 'data': {'sleep': 0, 'name': "a"}, 'timeout': "soon"},
+                    {'content_type': 'json', 'data': {'sleep': 0, 'name': "b"}, 'deadline': True},
+                    {'content_type': 'json', 'data': {'sleep': 0, 'name': "c"}, 'timeout': float("nan")},
+                    {'content_type': 'json', 'data': {'sleep': 0, 'name': "d"}, 'timeout': 5}]
+        input = [str(json.dumps(request)) for request in requests]
+        modes = [(apply_sleep, {}, {}), (apply_sleep, {}, {'concurrency': 2}),
+                 (apply_async_sleep, {}, {'concurrency': 2}),
+                 (None, {'apply_batch_func': lambda inputs: [apply_sleep(input) for input in inputs]}, {})]
+        for apply, adk_kwargs, init_kwargs in modes:
+            actual_output = self.execute_stream(input, apply, adk_kwargs=adk_kwargs, **init_kwargs)
+            self.assertEqual(["the request's timeout must be a number, got \"soon\"",
+                              "the request's deadline must be a number, got true",
+                              "the request's timeout must be a number, got NaN"],
+                             [output["error"]["message"] for output in actual_output[:3]])
+            self.assertEqual("hello d", actual_output[3]["result"])
+
+    def test_slow_stream_timeout(self):
+        closed = []
+
+        def apply(input):
+            try:
+                for i in range(input):
+                    time.sleep(0.1)
+                    yield i
+            finally:
+                closed.append(input)
+
+        async def apply_async(input):
+            try:
+                for i in range(input):
+                    await asyncio.sleep(0.1)
+                    yield i
+            finally:
+                closed.append(input)
+
+        input = [str(json.dumps({'content_type': 'json', 'data': 20}))]
+        for apply_func, init_kwargs in ((apply, {}), (apply, {'concurrency': 2}), (apply_async, {'concurrency': 2})):
+            del closed[:]
+            start = time.monotonic()
+            actual_output = self.execute_stream(input, apply_func, adk_kwargs={"timeout": 0.35}, **init_kwargs)
+            self.assertLess(time.monotonic() - start, 1)
+            self.assertEqual([0, 1, 2], [output["chunk"] for output in actual_output[:3]])
+            self.assertEqual("TimeoutError", actual_output[3]["error"]["error_type"])
+            self.assertEqual(4, len(actual_output))
+            # the generator was closed rather than left to run
+            self.assertEqual([20], closed)
+
+    def test_request_timeout_async_cancels(self):
+        completed = []
+
+        async def apply(input):
+            await asyncio.sleep(input)
+            completed.append(input)
+            return "done"
+
+        input = [str(json.dumps({'content_type': 'json', 'data': sleep})) for sleep in (1, 0)]
+        actual_output = self.execute_stream(input, apply, adk_kwargs={"timeout": 0.2}, concurrency=2)
+        self.assertEqual("TimeoutError", actual_output[0]["error"]["error_type"])
+        self.assertEqual("done", actual_output[1]["result"])
+        self.assertEqual([0], completed)
+
+    def test_request_timeout_kills_process_worker(self):
+        input = io.StringIO("\n".join(str(json.dumps({'content_type': 'json', 'data': {'sleep': sleep, 'name': "x"}}))
+                                      for sleep in (5, 0, 0)))
+        start = time.monotonic()
+        actual_output = self.execute_stream(input, apply_sleep, adk_kwargs={"timeout": 0.3}, concurrency=2,
+                                            executor="process")
+        self.assertLess(time.monotonic() - start, 3)
+        self.assertEqual("TimeoutError", actual_output[0]["error"]["error_type"])
+        self.assertEqual(["hello x", "hello x"], [output["result"] for output in actual_output[1:]])
+
+    def test_batch_drops_expired_requests(self):
+        input = [str(json.dumps({'content_type': 'json', 'data': name, 'deadline': deadline}))
+                 for name, deadline in (("a", None), ("fail", time.time() - 1), ("b", time.time() + 60))]
+        actual_output = self.execute_stream(input, None, adk_kwargs={"apply_batch_func": apply_batch_basic})
+        self.assertEqual(["hello a", None, "hello b"], [output.get("result") for output in actual_output])
+        self.assertEqual("TimeoutError", actual_output[1]["error"]["error_type"])
+
+    def test_profiling(self):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        requests = [{'content_type': 'json', 'data': {'sleep': 0.05, 'name': name}, 'profile': name == "b"}
+                    for name in ("a", "b", "c")]
+        input = [str(json.dumps(request)) for request in requests]
+        actual_output = self.execute_stream(input, apply_sleep, adk_kwargs={"profiling": Profiling(0, output_dir)})
+        self.assertEqual(["hello a", "hello b", "hello c"], [output["result"] for output in actual_output])
+        self.assertNotIn("profile", actual_output[0]["metadata"])
+        self.assertNotIn("profile", actual_output[2]["metadata"])
+        profile = actual_output[1]["metadata"]["profile"]
+        self.assertEqual("text", actual_output[1]["metadata"]["content_type"])
+        self.assertGreaterEqual(profile["seconds"], 0.05)
+        self.assertIn("time.sleep", profile["top"][0]["function"])
+        self.assertEqual([os.path.basename(profile["path"])], os.listdir(output_dir))
+
+    def test_profiling_sampled_in_process_pool(self):
+        input = io.StringIO("\n".join(str(json.dumps({'content_type': 'json', 'data': {'sleep': 0, 'name': str(i)}}))
+                                      for i in range(4)))
+        actual_output = self.execute_stream(input, apply_sleep, adk_kwargs={"profiling": Profiling(every=2)},
+                                            concurrency=2, executor="process")
+        self.assertEqual([False, True, False, True], ["profile" in output["metadata"] for output in actual_output])
+        self.assertNotIn("path", actual_output[1]["metadata"]["profile"])
+
+    def test_profiling_batch(self):
+        input = [str(json.dumps({'content_type': 'json', 'data': name, 'profile': name == "b"})) for name in ("a", "b")]
+        actual_output = self.execute_stream(input, None, adk_kwargs={"apply_batch_func": apply_batch_basic,
+                                                                     "profiling": Profiling()})
+        self.assertEqual(["hello a", "hello b"], [output["result"] for output in actual_output])
+        self.assertNotIn("profile", actual_output[0]["metadata"])
+        self.assertIn("top", actual_output[1]["metadata"]["profile"])
+
+    def overloading_stdin(self, sleeps):
+        # requests arrive 50ms apart, so those behind the slow first ones find the queue full
+        for i, sleep in enumerate(sleeps):
+            if i:
+                time.sleep(0.05)
+            yield str(json.dumps({'content_type': 'json', 'data': {'sleep': sleep, 'name': str(i)}}))
+
+    def test_queue_reject_newest(self):
+        actual_output = self.execute_stream(self.overloading_stdin([0.5, 0, 0, 0]), apply_sleep,
+                                            adk_kwargs={"max_queued": 1, "overload_policy": "reject_newest"})
+        self.assertEqual(["hello 0", "hello 1", None, None], [output.get("result") for output in actual_output])
+        for output in actual_output[2:]:
+            self.assertEqual("Overloaded", output["error"]["error_type"])
+
+    def test_queue_shed_oldest(self):
+        snapshots = []
+        metrics = Metrics(sinks=[CallbackSink(snapshots.append)])
+        actual_output = self.execute_stream(self.overloading_stdin([0.5, 0, 0, 0]), apply_sleep,
+                                            adk_kwargs={"max_queued": 1, "overload_policy": "shed_oldest",
+                                                        "metrics": metrics})
+        self.assertEqual(["hello 0", None, None, "hello 3"], [output.get("result") for output in actual_output])
+        self.assertEqual("Overloaded", actual_output[1]["error"]["error_type"])
+        snapshot = snapshots[-1]
+        self.assertEqual(2, snapshot["errors"]["Overloaded"])
+        self.assertEqual(2, snapshot["phases"]["queue_wait"]["count"])
+        # the last request waited behind the first
+        self.assertGreater(snapshot["phases"]["queue_wait"]["sum"], 0.2)
+        self.assertEqual(4, snapshot["counters"]["requests"])
+
+    def test_queue_concurrent(self):
+        actual_output = self.execute_stream(self.overloading_stdin([0.5, 0.5, 0, 0, 0]), apply_sleep,
+                                            adk_kwargs={"max_queued": 1, "overload_policy": "reject_newest"},
+                                            concurrency=2)
+        # the third request waits for a worker outside of the queue, the fourth in it
+        self.assertEqual(["hello 0", "hello 1", "hello 2", "hello 3", None],
+                         [output.get("result") for output in actual_output])
+        self.assertEqual("Overloaded", actual_output[4]["error"]["error_type"])
+
+    def test_queue_async(self):
+        actual_output = self.execute_stream(self.overloading_stdin([0.5, 0, 0, 0]), apply_async_sleep,
+                                            adk_kwargs={"max_queued": 1, "overload_policy": "shed_oldest"})
+        self.assertEqual(["hello 0", "hello 1", None, "hello 3"], [output.get("result") for output in actual_output])
+        self.assertEqual("Overloaded", actual_output[2]["error"]["error_type"])
+
+    def test_queue_batch(self):
+        def apply_batch(inputs):
+            return [apply_sleep(input) for input in inputs]
+
+        actual_output = self.execute_stream(self.overloading_stdin([0.5, 0, 0]), None,
+                                            adk_kwargs={"apply_batch_func": apply_batch, "max_queued": 1,
+                                                        "overload_policy": "reject_newest"})
+        self.assertEqual(["hello 0", "hello 1", None], [output.get("result") for output in actual_output])
+        self.assertEqual("Overloaded", actual_output[2]["error"]["error_type"])
+
 
 def run_test():
     unittest.main()
@@ -0,0 +1,54 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from adk.bench import Bench
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HELLO_WORLD = os.path.join(ROOT, "examples", "hello_world", "src", "Algorithm.py")
+
+
+class BenchTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.python_path = os.environ.get("PYTHONPATH", None)
+        # the algorithm subprocess imports the adk from this checkout
+        os.environ["PYTHONPATH"] = ROOT
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+        if self.python_path is None:
+            del os.environ["PYTHONPATH"]
+        else:
+            os.environ["PYTHONPATH"] = self.python_path
+
+    def test_closed_loop(self):
+        requests = [json.dumps({"content_type": "json", "data": name}) for name in ("a", "b", "c")]
+        report = Bench(HELLO_WORLD, requests, count=50, in_flight=4, warmup=5).run()
+        self.assertEqual(50, report["requests"])
+        self.assertEqual(0, report["errors"])
+        self.assertEqual(0, report["exit_code"])
+        self.assertGreater(report["cold_start_seconds"], 0)
+        self.assertGreater(report["throughput_rps"], 0)
+        self.assertLessEqual(report["latency_ms"]["p50"], report["latency_ms"]["p99"])
+        if sys.platform.startswith("linux"):
+            self.assertGreater(report["rss_mb"]["peak"], 0)
+
+    def test_open_loop(self):
+        fifo_path = os.path.join(self.workdir, "algoout")
+        requests = [json.dumps({"content_type": "json", "data": "a"})]
+        report = Bench(HELLO_WORLD, requests, count=20, rate=200, fifo_path=fifo_path).run()
+        self.assertEqual(20, report["requests"])
+        self.assertGreaterEqual(report["duration_seconds"], 19 / 200.0)
+        self.assertTrue(os.path.exists(fifo_path))
+
+    def test_algorithm_crash_is_reported(self):
+        requests = [json.dumps({"content_type": "unknown", "data": "a"})] * 1000
+        with self.assertRaises(Exception) as context:
+            Bench(HELLO_WORLD, requests, count=1000).run()
+        self.assertIn("Invalid content_type", str(context.exception))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import base64
+import json
+import os
+import unittest
+from adk import io
+from adk.io import BINARY_CHUNK_SIZE, BinaryResponse, encode_response, format_data, format_response, select_codec
+
+
+def available_codecs():
+    codecs = []
+    for codec_class in io.CODECS:
+        try:
+            codecs.append(codec_class())
+        except ImportError:
+            pass
+    return codecs
+
+
+class IOTest(unittest.TestCase):
+    def test_binary_response_matches_format_response(self):
+        for size in (0, 1, 2, 3, BINARY_CHUNK_SIZE - 1, BINARY_CHUNK_SIZE, BINARY_CHUNK_SIZE * 2 + 1):
+            data = os.urandom(size)
+            response = encode_response(data)
+            self.assertIsInstance(response, BinaryResponse)
+            self.assertEqual(json.loads(format_response(data)), json.loads(str(response)))
+
+    def test_binary_response_from_memoryview(self):
+        data = bytearray(os.urandom(BINARY_CHUNK_SIZE + 10))
+        response = json.loads(str(encode_response(memoryview(data))))
+        self.assertEqual(bytes(data), base64.b64decode(response["result"]))
+
+    def test_encode_response_non_binary(self):
+        self.assertEqual(format_response("hello"), encode_response("hello"))
+        self.assertEqual(format_response({"hello": [1, 2]}), encode_response({"hello": [1, 2]}))
+
+    def test_format_binary_data(self):
+        data = os.urandom(1000)
+        request = {"content_type": "binary", "data": base64.b64encode(data).decode("ascii")}
+        self.assertEqual(data, format_data(request))
+
+    def test_codecs_round_trip(self):
+        payload = {"text": "h\u00e9llo / world", "values": [1, 2.5, None, True], 3: "int key", "big": 2 ** 70}
+        expected = {"text": "h\u00e9llo / world", "values": [1, 2.5, None, True], "3": "int key", "big": 2 ** 70}
+        for codec in available_codecs():
+            self.assertEqual(expected, json.loads(codec.dumps(payload)), codec.name)
+            self.assertEqual(expected, codec.loads(json.dumps(expected)), codec.name)
+
+    def test_codecs_serialize_numpy(self):
+        try:
+            import numpy as np
+        except ImportError:
+            self.skipTest("numpy is not installed")
+        payload = {"array": np.arange(6, dtype=np.float32).reshape(2, 3), "scalar": np.int64(7), "flag": np.bool_(True)}
+        for codec in available_codecs():
+            self.assertEqual({"array": [[0, 1, 2], [3, 4, 5]], "scalar": 7, "flag": True},
+                             json.loads(codec.dumps(payload)), codec.name)
+
+    def test_default_codec(self):
+        previous = io.codec
+        environment = os.environ.pop("ADK_JSON_CODEC", None)
+        try:
+            self.assertEqual("json", select_codec().name)
+        finally:
+            io.codec = previous
+            if environment is not None:
+                os.environ["ADK_JSON_CODEC"] = environment
+
+    def test_codecs_match_json(self):
+        # values the standard library handles that faster codecs may not, every codec must decode and encode alike
+        big = 123456789012345678901234567890
+        requests = ['{"data": %d}' % big, '{"data": -9999999999999999999}', '{"data": NaN}', '{"data": 1e400}',
+                    '{"data": [Infinity, -Infinity]}', b'{"data": 12345678901234567890123}']
+        for codec in available_codecs():
+            for request in requests:
+                self.assertEqual(repr(json.loads(request)), repr(codec.loads(request)), codec.name)
+            for result in ({"big": big}, {"values": [float("nan"), float("inf"), None]}, float("-inf")):
+                self.assertEqual(json.dumps(result), json.dumps(json.loads(codec.dumps(result))), codec.name)
+            self.assertRaises(ValueError, codec.loads, '{"data": }')
+
+    def test_codecs_encode_non_finite_numpy(self):
+        try:
+            import numpy as np
+        except ImportError:
+            self.skipTest("numpy is not installed")
+        payload = {"array": np.array([1.0, np.nan], dtype=np.float32), "none": None}
+        for codec in available_codecs():
+            self.assertEqual("[1.0, NaN]", json.dumps(json.loads(codec.dumps(payload))["array"]), codec.name)
+
+    def test_select_codec(self):
+        previous = io.codec
+        try:
+            self.assertEqual("json", select_codec("json").name)
+            self.assertEqual("json", io.codec.name)
+            self.assertEqual(json.loads(format_response([1, 2])), {"result": [1, 2], "metadata": {"content_type": "json"}})
+            self.assertRaises(Exception, select_codec, "not_a_codec")
+        finally:
+            io.codec = previous
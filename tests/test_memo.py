@@ -0,0 +1,51 @@
+import time
+import unittest
+from adk.io import create_exception, encode_response
+from adk.memo import ResponseCache
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def test_keys(self):
+        cache = ResponseCache(key="input")
+        self.assertEqual(cache.key('{"data": {"a": 1, "b": 2}}', {"a": 1, "b": 2}),
+                         cache.key('{"data": {"b": 2, "a": 1}, "x": 1}', {"b": 2, "a": 1}))
+        self.assertNotEqual(cache.key("", b"1"), cache.key("", "1"))
+        cache = ResponseCache(key="line")
+        self.assertNotEqual(cache.key('{"data": 1}', 1), cache.key('{"data": 1, "x": 1}', 1))
+
+    def test_errors_are_not_cached(self):
+        cache = ResponseCache()
+        cache.put(b"key", create_exception(Exception("failed")))
+        self.assertIsNone(cache.get(b"key"))
+
+    def test_binary_responses_are_serialized_once(self):
+        cache = ResponseCache(max_entry_bytes=10)
+        response = cache.put(b"small", encode_response(b"12345"))
+        self.assertEqual(response, cache.get(b"small"))
+        large = encode_response(b"x" * 11)
+        self.assertIs(large, cache.put(b"large", large))
+        self.assertIsNone(cache.get(b"large"))
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_entries=2, max_bytes=10)
+        cache.put(b"a", "aaaa")
+        cache.put(b"b", "bbbb")
+        cache.get(b"a")
+        cache.put(b"c", "cccc")
+        self.assertIsNone(cache.get(b"b"))
+        self.assertEqual("aaaa", cache.get(b"a"))
+        cache.put(b"d", "dddddddd")
+        self.assertEqual({"entries": 1, "bytes": 8}, {key: cache.stats()[key] for key in ("entries", "bytes")})
+        self.assertEqual(3, cache.stats()["evictions"])
+
+    def test_ttl(self):
+        cache = ResponseCache(ttl=0.05)
+        cache.put(b"a", "aaaa")
+        self.assertEqual("aaaa", cache.get(b"a"))
+        time.sleep(0.1)
+        self.assertIsNone(cache.get(b"a"))
+        self.assertEqual(0, cache.stats()["bytes"])
+
+
+if __name__ == '__main__':
+    unittest.main()
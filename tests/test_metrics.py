@@ -0,0 +1,57 @@
+import json
+import os
+import tempfile
+import unittest
+from adk.metrics import Metrics, FileSink, PrometheusSink, CallbackSink
+
+
+class MetricsTest(unittest.TestCase):
+    def test_percentiles(self):
+        metrics = Metrics(window=100)
+        for i in range(1, 101):
+            metrics.observe("apply", i / 1000.0)
+        summary = metrics.snapshot()["phases"]["apply"]
+        self.assertEqual(100, summary["count"])
+        self.assertAlmostEqual(0.051, summary["p50"])
+        self.assertAlmostEqual(0.096, summary["p95"])
+        self.assertAlmostEqual(0.1, summary["p99"])
+
+    def test_window_keeps_recent_samples_and_totals(self):
+        metrics = Metrics(window=2)
+        for value in (10.0, 1.0, 1.0):
+            metrics.observe("apply", value)
+        summary = metrics.snapshot()["phases"]["apply"]
+        self.assertEqual(3, summary["count"])
+        self.assertEqual(12.0, summary["sum"])
+        self.assertEqual(1.0, summary["p99"])
+
+    def test_flush_interval(self):
+        snapshots = []
+        metrics = Metrics(sinks=[CallbackSink(snapshots.append)], flush_interval=3600)
+        metrics.increment("requests")
+        metrics.maybe_flush()
+        self.assertEqual([], snapshots)
+        metrics.flush()
+        self.assertEqual(1, snapshots[0]["counters"]["requests"])
+
+    def test_sinks(self):
+        directory = tempfile.mkdtemp()
+        json_path = os.path.join(directory, "metrics.json")
+        prometheus_path = os.path.join(directory, "metrics.prom")
+        metrics = Metrics(sinks=[FileSink(json_path), PrometheusSink(prometheus_path)])
+        metrics.observe("apply", 0.5)
+        metrics.count_error("AlgorithmError")
+        metrics.record_load("file:model.pkl", 1.5)
+        metrics.flush()
+        with open(json_path) as f:
+            self.assertEqual({"AlgorithmError": 1}, json.load(f)["errors"])
+        with open(prometheus_path) as f:
+            text = f.read()
+        self.assertIn('adk_phase_seconds{phase="apply",quantile="0.5"} 0.5', text)
+        self.assertIn('adk_phase_seconds_count{phase="apply"} 1', text)
+        self.assertIn('adk_errors_total{error_type="AlgorithmError"} 1', text)
+        self.assertIn('adk_load_seconds{phase="file:model.pkl"} 1.5', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
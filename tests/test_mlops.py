@@ -0,0 +1,203 @@
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from concurrent.futures import Future
+from adk.mlops import MLOps, MLOpsReporter
+from tests.AdkTest import ADKTest, PipeTest
+
+
+def apply_length(input):
+    if input == "fail":
+        raise Exception("not reported")
+    return float(len(input))
+
+
+class MLOpsTest(PipeTest):
+    def create_fake_mlops_agent(self, checks_until_running=1):
+        agent_dir = tempfile.mkdtemp()
+        package_dir = os.path.join(agent_dir, "datarobot_mlops_package-8.1.2")
+        os.makedirs(os.path.join(package_dir, "conf"))
+        os.makedirs(os.path.join(package_dir, "bin"))
+        with open(os.path.join(package_dir, "conf", "mlops.agent.conf.yaml"), "w") as f:
+            f.write("mlopsUrl: null\napiToken: null\n")
+        # the status script only reports the agent as running once it has been checked enough times
+        checks_path = os.path.join(agent_dir, "checks")
+        scripts = {
+            "start-agent.sh": "sleep 0.2\n",
+            "status-agent.sh": "echo x >> {0}\nif [ $(wc -l < {0}) -ge {1} ]; then\n"
+                               "echo 'DataRobot MLOps-Agent is running as a service.'\nelse\necho 'starting'\nfi\n"
+                               .format(checks_path, checks_until_running),
+        }
+        for script, content in scripts.items():
+            path = os.path.join(package_dir, "bin", script)
+            with open(path, "w") as f:
+                f.write("#!/bin/sh\n" + content)
+            os.chmod(path, 0o755)
+        self.addCleanup(shutil.rmtree, agent_dir)
+        return agent_dir
+
+    def set_mlops_environment(self):
+        environment = {"DATAROBOT_MLOPS_API_TOKEN": "token", "MLOPS_SERVICE_URL": "https://mlops.example.com",
+                       "MODEL_ID": "model", "DEPLOYMENT_ID": "deployment"}
+        previous = dict(os.environ)
+        os.environ.update(environment)
+        self.addCleanup(lambda: (os.environ.clear(), os.environ.update(previous)))
+
+    def read_mlops_spool(self, spool_dir):
+        # the datarobot-mlops filesystem spooler's records, by their data type
+        records = {}
+        for file_name in sorted(os.listdir(spool_dir)):
+            with open(os.path.join(spool_dir, file_name), "rb") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        records.setdefault(record["header"]["dataType"], []).append(json.loads(record["data"]))
+        return records
+
+    def execute_with_mlops(self, input, apply, adk_kwargs=None, **init_kwargs):
+        """
+        :return: A tuple of the responses, and the records spooled to MLOps by their data type
+        """
+        agent_dir = self.create_fake_mlops_agent()
+        spool_dir = os.path.join(agent_dir, "spool")
+        self.set_mlops_environment()
+        self.open_pipe()
+        algo = ADKTest(apply, **(adk_kwargs or {}))
+        algo.mlops_agent_dir = agent_dir
+        algo.mlops_spool_dir = spool_dir
+        sys.stdin = input
+        algo.init(mlops=True, **init_kwargs)
+        return self.read_all_from_pipe(), self.read_mlops_spool(spool_dir)
+
+    def reported_predictions(self, records):
+        return [prediction for data in records.get("PREDICTIONS_DATA", []) for prediction in data["predictions"]]
+
+    def reported_count(self, records):
+        return sum(stats["numPredictions"] for stats in records.get("DEPLOYMENT_STATS", []))
+
+    def test_mlops_reporting(self):
+        def apply(input):
+            if input == "fail":
+                raise Exception("not reported")
+            if input == "text":
+                # counted, but only numbers and class probabilities are reported as predictions
+                return "text"
+            return float(len(input))
+
+        # the agent is only up after loading has finished and requests have been served
+        agent_dir = self.create_fake_mlops_agent(checks_until_running=3)
+        spool_dir = os.path.join(agent_dir, "spool")
+        self.set_mlops_environment()
+        self.open_pipe()
+        algo = ADKTest(apply)
+        algo.mlops_agent_dir = agent_dir
+        algo.mlops_spool_dir = spool_dir
+        sys.stdin = [str(json.dumps({'content_type': 'json', 'data': name})) for name in ("a", "fail", "bb", "text")]
+        algo.init(mlops=True)
+        actual_output = self.read_all_from_pipe()
+        self.assertEqual([1.0, None, 2.0, "text"], [output.get("result") for output in actual_output])
+        records = self.read_mlops_spool(spool_dir)
+        self.assertEqual(3, sum(stats["numPredictions"] for stats in records["DEPLOYMENT_STATS"]))
+        self.assertEqual("model", records["DEPLOYMENT_STATS"][0]["modelId"])
+        self.assertEqual([1.0, 2.0], [prediction for data in records["PREDICTIONS_DATA"]
+                                      for prediction in data["predictions"]])
+        with open(os.path.join(agent_dir, "datarobot_mlops_package-8.1.2", "conf", "mlops.agent.conf.yaml")) as f:
+            self.assertIn("https://mlops.example.com", f.read())
+
+    def test_mlops_agent_startup(self):
+        agent_dir = self.create_fake_mlops_agent(checks_until_running=2)
+        self.set_mlops_environment()
+        mlops = MLOps("token", "mlops.json", agent_dir, os.path.join(agent_dir, "spool"))
+        ready = mlops.start_in_background(timeout=5)
+        self.assertFalse(ready.done())
+        self.assertTrue(ready.result())
+        config_path = os.path.join(agent_dir, "datarobot_mlops_package-8.1.2", "conf", "mlops.agent.conf.yaml")
+        os.utime(config_path, (0, 0))
+        mlops.configure()
+        self.assertEqual(0, os.stat(config_path).st_mtime)
+        with self.assertRaises(Exception):
+            MLOps("token", "mlops.json", self.create_fake_mlops_agent(checks_until_running=100)).wait_until_ready(
+                timeout=0.3, initial_delay=0.05)
+
+    def test_mlops_reporter_class_probabilities(self):
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir)
+        reporter = MLOpsReporter(spool_dir, "deployment", "model")
+        reporter.record({"x": 1.0}, [0.25, 0.75], 0.01)
+        reporter.record({"x": 2.0}, [0.5, 0.5], 0.01)
+        reporter.close()
+        records = self.read_mlops_spool(spool_dir)
+        self.assertEqual([[0.25, 0.75], [0.5, 0.5]], records["PREDICTIONS_DATA"][0]["predictions"])
+
+    def test_mlops_agent_failed_to_start(self):
+        spooled = []
+
+        class Reporter(MLOpsReporter):
+            def spool(self, batch):
+                spooled.append(batch)
+
+        ready = Future()
+        ready.set_exception(Exception("the agent did not start"))
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir)
+        stderr = io.StringIO()
+        self.addCleanup(setattr, sys, "stderr", sys.stderr)
+        sys.stderr = stderr
+        reporter = Reporter(spool_dir, "deployment", "model", batch_size=1, flush_interval=0.01, ready=ready)
+        for name in ("a", "b", "c"):
+            reporter.record(name, "hello " + name, 0.01)
+            time.sleep(0.02)
+        # the predictions are dropped, and the reporter keeps draining its queue
+        self.assertTrue(reporter.thread.is_alive())
+        reporter.close()
+        self.assertFalse(reporter.thread.is_alive())
+        self.assertEqual([], spooled)
+        self.assertEqual(1, stderr.getvalue().count("MLOps agent failed to start"))
+
+    def test_mlops_batch_reporting(self):
+        def apply_batch(inputs):
+            results = []
+            for input in inputs:
+                try:
+                    results.append(apply_length(input))
+                except Exception as e:
+                    results.append(e)
+            return results
+
+        input = [str(json.dumps({'content_type': 'json', 'data': name})) for name in ("a", "fail", "bb")]
+        actual_output, records = self.execute_with_mlops(input, None, adk_kwargs={"apply_batch_func": apply_batch})
+        self.assertEqual([1.0, None, 2.0], [output.get("result") for output in actual_output])
+        self.assertEqual(2, self.reported_count(records))
+        self.assertEqual([1.0, 2.0], self.reported_predictions(records))
+
+    def test_mlops_process_pool_reporting(self):
+        # forked workers close sys.stdin on startup, so it must be a real file object
+        input = io.StringIO("\n".join(str(json.dumps({'content_type': 'json', 'data': name}))
+                                      for name in ("a", "fail", "bb", "ccc")))
+        actual_output, records = self.execute_with_mlops(input, apply_length, concurrency=2, executor="process")
+        self.assertEqual([1.0, None, 2.0, 3.0], [output.get("result") for output in actual_output])
+        self.assertEqual(3, self.reported_count(records))
+        self.assertEqual([1.0, 2.0, 3.0], sorted(self.reported_predictions(records)))
+
+    def test_mlops_streaming_reporting(self):
+        def apply(input):
+            for word in input:
+                if word == "fail":
+                    raise Exception("failed while streaming")
+                yield word
+
+        input = [str(json.dumps({'content_type': 'json', 'data': words})) for words in (["a", "b"], ["fail"], ["c"])]
+        actual_output, records = self.execute_with_mlops(input, apply)
+        self.assertEqual(6, len(actual_output))
+        # completed streams are counted, their chunks aren't reported as predictions
+        self.assertEqual(2, self.reported_count(records))
+        self.assertEqual([], self.reported_predictions(records))
+
+
+if __name__ == '__main__':
+    unittest.main()
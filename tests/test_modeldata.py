@@ -0,0 +1,352 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+import numpy as np
+from adk.digest import hash_file
+from adk.modelcache import ModelCache
+from adk.modeldata import ModelData, md5_for_str
+from tests.fake_data_api import FakeClient, FakeStreamingClient
+
+
+class ModelDataTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.files = {"data://test/model_{}.bin".format(i): "model file {}".format(i).encode() for i in range(4)}
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def write_manifest(self, required_files, optional_files=(), **manifest_fields):
+        manifest_path = os.path.join(self.workdir, "model_manifest.json")
+        manifest = {"required_files": list(required_files), "optional_files": list(optional_files)}
+        manifest.update(manifest_fields)
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f)
+        return manifest_path
+
+    def file_entry(self, index, **kwargs):
+        source_uri = "data://test/model_{}.bin".format(index)
+        entry = {"name": "model_{}".format(index), "source_uri": source_uri, "fail_on_tamper": True,
+                 "md5_checksum": md5_for_str(self.files[source_uri].decode())}
+        entry.update(kwargs)
+        return entry
+
+    def test_parallel_download(self):
+        latency = 0.2
+        client = FakeClient(self.files, latency=latency)
+        manifest_path = self.write_manifest([self.file_entry(i) for i in range(4)])
+        model_data = ModelData(client, manifest_path)
+        start = time.time()
+        model_data.initialize()
+        elapsed = time.time() - start
+        self.assertLess(elapsed, latency * 2)
+        for i in range(4):
+            with open(model_data.get_model("model_{}".format(i)), "rb") as f:
+                self.assertEqual(self.files["data://test/model_{}.bin".format(i)], f.read())
+
+    def test_failures_reported_together(self):
+        client = FakeClient(self.files)
+        manifest_path = self.write_manifest([self.file_entry(0), self.file_entry(1, md5_checksum="0" * 32),
+                                             self.file_entry(2, source_uri="data://test/missing.bin")])
+        model_data = ModelData(client, manifest_path, download_retries=0)
+        with self.assertRaises(Exception) as context:
+            model_data.initialize()
+        message = str(context.exception)
+        self.assertIn("2 model files failed to initialize", message)
+        self.assertIn("Model File Mismatch for model_1", message)
+        self.assertIn("data://test/missing.bin", message)
+        # a second attempt only fetches the files which haven't been fetched yet
+        client.requests = []
+        self.assertRaises(Exception, model_data.initialize)
+        self.assertNotIn("data://test/model_0.bin", client.requests)
+
+    def test_optional_model(self):
+        client = FakeClient(self.files)
+        manifest_path = self.write_manifest([self.file_entry(0)], [self.file_entry(1)])
+        model_data = ModelData(client, manifest_path)
+        model_data.initialize()
+        with open(model_data.get_model("model_1"), "rb") as f:
+            self.assertEqual(self.files["data://test/model_1.bin"], f.read())
+
+    def test_tampered_optional_model(self):
+        # optional files are checked against their digest whether or not the manifest is frozen
+        manifest_path = self.write_manifest([self.file_entry(0)], [self.file_entry(1, md5_checksum=md5_for_str("x"))])
+        self.assertFalse(os.path.exists(manifest_path + ".freeze"))
+        model_data = ModelData(FakeClient(self.files), manifest_path)
+        model_data.initialize()
+        with self.assertRaises(Exception) as context:
+            model_data.get_model("model_1")
+        self.assertIn("Model File Mismatch for model_1", str(context.exception))
+
+    def test_cache_hit_skips_download(self):
+        cache_dir = os.path.join(self.workdir, "cache")
+        manifest_path = self.write_manifest([self.file_entry(i) for i in range(2)])
+        first_client = FakeClient(self.files)
+        ModelData(first_client, manifest_path, cache=ModelCache(cache_dir)).initialize()
+        self.assertEqual(2, len(first_client.requests))
+
+        second_client = FakeClient(self.files)
+        cache = ModelCache(cache_dir)
+        model_data = ModelData(second_client, manifest_path, cache=cache)
+        model_data.initialize()
+        self.assertEqual([], second_client.requests)
+        self.assertEqual({"hits": 2, "misses": 0, "evictions": 0}, cache.stats())
+        with open(model_data.get_model("model_0"), "rb") as f:
+            self.assertEqual(self.files["data://test/model_0.bin"], f.read())
+
+    def test_cache_full_verify(self):
+        cache_dir = os.path.join(self.workdir, "cache")
+        manifest_path = self.write_manifest([self.file_entry(0)])
+        model_data = ModelData(FakeClient(self.files), manifest_path, cache=ModelCache(cache_dir))
+        model_data.initialize()
+        # same size, different content; only a full re-hash notices
+        with open(model_data.get_model("model_0"), "wb") as f:
+            f.write(b"model file X")
+
+        client = FakeClient(self.files)
+        ModelData(client, manifest_path, cache=ModelCache(cache_dir)).initialize()
+        self.assertEqual([], client.requests)
+        cache = ModelCache(cache_dir, full_verify=True)
+        ModelData(client, manifest_path, cache=cache).initialize()
+        self.assertEqual(["data://test/model_0.bin"], client.requests)
+        self.assertEqual(1, cache.stats()["misses"])
+
+    def test_cache_entry_evicted_during_hit(self):
+        cache_dir = os.path.join(self.workdir, "cache")
+        manifest_path = self.write_manifest([self.file_entry(0)])
+        ModelData(FakeClient(self.files), manifest_path, cache=ModelCache(cache_dir)).initialize()
+
+        utime = os.utime
+
+        def evicted_utime(path, *args, **kwargs):
+            # another process evicts the file between reading its entry and touching it
+            os.remove(path)
+            return utime(path, *args, **kwargs)
+
+        client = FakeClient(self.files)
+        cache = ModelCache(cache_dir)
+        model_data = ModelData(client, manifest_path, cache=cache)
+        with mock.patch("adk.modelcache.os.utime", side_effect=evicted_utime):
+            model_data.initialize()
+        self.assertEqual(["data://test/model_0.bin"], client.requests)
+        self.assertEqual({"hits": 0, "misses": 1, "evictions": 0}, cache.stats())
+        with open(model_data.get_model("model_0"), "rb") as f:
+            self.assertEqual(self.files["data://test/model_0.bin"], f.read())
+
+    def test_cache_lru_eviction(self):
+        cache_dir = os.path.join(self.workdir, "cache")
+        size = len(self.files["data://test/model_0.bin"])
+        for i in range(3):
+            manifest_path = self.write_manifest([self.file_entry(i)])
+            cache = ModelCache(cache_dir, max_bytes=size * 2)
+            ModelData(FakeClient(self.files), manifest_path, cache=cache).initialize()
+            time.sleep(0.01)
+        self.assertEqual(1, cache.stats()["evictions"])
+        self.assertFalse(os.path.exists(os.path.join(cache_dir, self.file_entry(0)["md5_checksum"])))
+        self.assertTrue(os.path.exists(os.path.join(cache_dir, self.file_entry(2)["md5_checksum"])))
+
+    def test_streamed_download_with_declared_digest(self):
+        source_uri = "data://test/model_0.bin"
+        blake2b = hashlib.blake2b(self.files[source_uri]).hexdigest()
+        manifest_path = self.write_manifest([self.file_entry(0, md5_checksum=None, blake2b_checksum=blake2b),
+                                             self.file_entry(1, sha256_checksum="0" * 64)])
+        model_data = ModelData(FakeStreamingClient(self.files), manifest_path, download_retries=0)
+        with self.assertRaises(Exception) as context:
+            model_data.initialize()
+        self.assertIn("Model File Mismatch for model_1", str(context.exception))
+        self.assertEqual(blake2b, model_data.models["model_0"].md5_checksum)
+        self.assertEqual("blake2b", model_data.models["model_0"].algorithm)
+        with open(model_data.get_model("model_0"), "rb") as f:
+            self.assertEqual(self.files[source_uri], f.read())
+
+    def test_local_file_is_not_streamed(self):
+        local_path = os.path.join(self.workdir, "local_model.bin")
+        with open(local_path, "wb") as f:
+            f.write(b"local model")
+        manifest_path = self.write_manifest([{"name": "local", "source_uri": "file://" + local_path,
+                                              "fail_on_tamper": True, "md5_checksum": md5_for_str("local model")}],
+                                            [{"name": "missing", "source_uri": "file://" + local_path + ".missing"}])
+        client = FakeStreamingClient(self.files)
+        model_data = ModelData(client, manifest_path, download_retries=0)
+        model_data.initialize()
+        self.assertEqual([], client.requests)
+        self.assertEqual(local_path, model_data.get_model("local"))
+        with self.assertRaises(Exception) as context:
+            model_data.get_model("missing")
+        self.assertIn("does not exist", str(context.exception))
+
+    def test_cache_copies_local_file(self):
+        local_path = os.path.join(self.workdir, "local_model.bin")
+        with open(local_path, "wb") as f:
+            f.write(b"local model")
+        manifest_path = self.write_manifest([{"name": "local", "source_uri": "file://" + local_path,
+                                              "fail_on_tamper": True, "md5_checksum": md5_for_str("local model")}])
+        cache_dir = os.path.join(self.workdir, "cache")
+        model_data = ModelData(FakeClient(self.files), manifest_path, cache=ModelCache(cache_dir))
+        model_data.initialize()
+        self.assertEqual(os.path.join(cache_dir, md5_for_str("local model")), model_data.get_model("local"))
+        with open(local_path, "rb") as f:
+            self.assertEqual(b"local model", f.read())
+
+    def test_hash_file(self):
+        for content in (b"", b"model file" * 100000):
+            path = os.path.join(self.workdir, "hashed")
+            with open(path, "wb") as f:
+                f.write(content)
+            self.assertEqual(hashlib.md5(content).hexdigest(), hash_file(path))
+            self.assertEqual(hashlib.sha256(content).hexdigest(), hash_file(path, "sha256"))
+
+    def test_background_prefetch(self):
+        latency = 0.3
+        client = FakeClient(self.files, latency=latency)
+        manifest_path = self.write_manifest([self.file_entry(0), self.file_entry(1, prefetch="background")],
+                                            [self.file_entry(2, prefetch="background"), self.file_entry(3)])
+        model_data = ModelData(client, manifest_path)
+        start = time.time()
+        model_data.initialize()
+        # only the eager required file is waited for
+        self.assertLess(time.time() - start, latency * 2)
+        self.assertIn("model_0", model_data.models)
+        self.assertEqual({"model_1", "model_2"}, set(model_data.pending.keys()))
+        with open(model_data.get_model("model_2"), "rb") as f:
+            self.assertEqual(self.files["data://test/model_2.bin"], f.read())
+        model_data.wait()
+        self.assertEqual({}, model_data.pending)
+        self.assertNotIn("data://test/model_3.bin", client.requests)
+
+    def test_background_prefetch_failure(self):
+        manifest_path = self.write_manifest([self.file_entry(0, md5_checksum="0" * 32)], prefetch="background")
+        model_data = ModelData(FakeClient(self.files), manifest_path)
+        model_data.initialize()
+        with self.assertRaises(Exception) as context:
+            model_data.get_model("model_0")
+        self.assertIn("Model File Mismatch for model_0", str(context.exception))
+
+    def test_user_state(self):
+        model_data = ModelData(FakeClient(self.files), os.path.join(self.workdir, "missing_manifest.json"))
+        model_data["message"] = "loaded"
+        self.assertEqual("loaded", model_data["message"])
+        self.assertEqual({"message": "loaded"}, model_data.data())
+        self.assertEqual({"message": "loaded"}, model_data.user_data)
+        self.assertRaises(KeyError, lambda: model_data["missing"])
+
+    def test_manifest_index(self):
+        manifest_path = self.write_manifest([self.file_entry(0)], [self.file_entry(i) for i in range(1, 4)])
+        model_data = ModelData(FakeClient(self.files), manifest_path)
+        self.assertEqual(["model_0"], list(model_data.required_files.keys()))
+        self.assertEqual(["model_1", "model_2", "model_3"], list(model_data.optional_files.keys()))
+        self.assertRaises(Exception, model_data.get_model, "missing")
+
+    def test_acquire_loads_once(self):
+        client = FakeClient(self.files)
+        manifest_path = self.write_manifest([self.file_entry(0)], [self.file_entry(1)])
+        model_data = ModelData(client, manifest_path)
+        model_data.initialize()
+        loads = []
+
+        def load(path):
+            loads.append(path)
+            time.sleep(0.2)
+            with open(path, "rb") as f:
+                return f.read()
+
+        model_data.register_loader("model_1", load)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(model_data.acquire("model_1"))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, len(loads))
+        self.assertEqual([self.files["data://test/model_1.bin"]] * 4, results)
+        stats = model_data.residency_stats()
+        self.assertEqual(["model_1"], stats["resident"])
+        self.assertEqual(1, stats["loads"])
+        self.assertRaises(Exception, model_data.register_loader, "missing", load)
+
+    def test_acquire_lru_eviction(self):
+        manifest_path = self.write_manifest([], [self.file_entry(i) for i in range(3)])
+        model_data = ModelData(FakeClient(self.files), manifest_path, memory_budget=2)
+        unloaded = []
+        for i in range(3):
+            model_data.register_loader("model_{}".format(i), lambda path: path, size=lambda model: 1,
+                                       unload=unloaded.append)
+        model_data.acquire("model_0")
+        model_data.acquire("model_1")
+        model_data.acquire("model_0")
+        model_data.acquire("model_2")
+        stats = model_data.residency_stats()
+        self.assertEqual(["model_0", "model_2"], stats["resident"])
+        self.assertEqual(1, stats["evictions"])
+        self.assertEqual(1, stats["hits"])
+        self.assertEqual([model_data.get_model("model_1")], unloaded)
+
+    def test_acquire_failure_is_not_cached(self):
+        manifest_path = self.write_manifest([], [self.file_entry(0)])
+        model_data = ModelData(FakeClient(self.files), manifest_path)
+        attempts = []
+
+        def load(path):
+            attempts.append(path)
+            if len(attempts) == 1:
+                raise Exception("failed to load")
+            return path
+
+        model_data.register_loader("model_0", load)
+        self.assertRaises(Exception, model_data.acquire, "model_0")
+        self.assertEqual(model_data.get_model("model_0"), model_data.acquire("model_0"))
+        self.assertEqual(2, len(attempts))
+
+    def test_memory_mapped_model(self):
+        weights = np.arange(12, dtype=np.float32)
+        self.files["data://test/weights.bin"] = weights.tobytes()
+        manifest_path = self.write_manifest([{"name": "weights", "source_uri": "data://test/weights.bin",
+                                              "fail_on_tamper": True,
+                                              "md5_checksum": hashlib.md5(weights.tobytes()).hexdigest()}])
+        model_data = ModelData(FakeClient(self.files), manifest_path)
+        model_data.initialize()
+        buffer = model_data.get_model_buffer("weights")
+        self.assertTrue(buffer.readonly)
+        self.assertEqual(weights.tobytes(), bytes(buffer))
+        # every caller shares the one mapping
+        self.assertIs(model_data.get_model_mmap("weights"), model_data.get_model_mmap("weights"))
+        array = model_data.get_model_array("weights", dtype=np.float32, shape=(3, 4))
+        np.testing.assert_array_equal(weights.reshape(3, 4), array)
+        self.assertFalse(array.flags.writeable)
+        np.testing.assert_array_equal(weights[4:], model_data.get_model_array("weights", np.float32, offset=16))
+        memmap = model_data.get_model_memmap("weights", np.float32)
+        self.assertIsInstance(memmap, np.memmap)
+        np.testing.assert_array_equal(weights, memmap)
+
+    def test_memory_mapped_model_verify(self):
+        cache_dir = os.path.join(self.workdir, "cache")
+        manifest_path = self.write_manifest([self.file_entry(0), self.file_entry(1)])
+        model_data = ModelData(FakeClient(self.files), manifest_path, cache=ModelCache(cache_dir))
+        model_data.initialize()
+        self.assertEqual({"model_0", "model_1"}, model_data.verified)
+        # same size, different content; a cache hit without full_verify doesn't notice
+        with open(model_data.get_model("model_0"), "wb") as f:
+            f.write(b"model file X")
+
+        model_data = ModelData(FakeClient(self.files), manifest_path, cache=ModelCache(cache_dir))
+        model_data.initialize()
+        self.assertEqual(set(), model_data.verified)
+        self.assertEqual(b"model file X", bytes(model_data.get_model_buffer("model_0")))
+        with self.assertRaises(Exception) as context:
+            model_data.get_model_buffer("model_0", verify=True)
+        self.assertIn("Model File Mismatch for model_0", str(context.exception))
+        self.assertEqual(b"model file 1", bytes(model_data.get_model_buffer("model_1", verify=True)))
+        self.assertEqual({"model_1"}, model_data.verified)
+
+    def test_memory_mapped_empty_model(self):
+        self.files["data://test/empty.bin"] = b""
+        manifest_path = self.write_manifest([{"name": "empty", "source_uri": "data://test/empty.bin"}])
+        model_data = ModelData(FakeClient(self.files), manifest_path)
+        model_data.initialize()
+        self.assertRaises(Exception, model_data.get_model_mmap, "empty")
@@ -0,0 +1,103 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from adk.io import BinaryResponse, ErrorResponse, add_metadata, create_exception, format_response
+from adk.profiling import CProfiler, Profiling, SamplingProfiler, from_environment
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+    return "done"
+
+
+class ProfilingTest(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_selection(self):
+        profiling = Profiling(every=3)
+        selected = [profiling.selected({"data": i}) for i in range(6)]
+        self.assertEqual([False, False, True, False, False, True], selected)
+        self.assertTrue(profiling.selected({"data": 0, "profile": True}))
+        self.assertFalse(Profiling().selected({"data": 0}))
+        self.assertTrue(Profiling().selected({"data": 0, "profile": True}))
+
+    def test_cprofile(self):
+        profiling = Profiling(output_dir=self.output_dir, top=3)
+        result, report = profiling.profile(busy, 0.05)
+        self.assertEqual("done", result)
+        self.assertEqual(3, len(report["top"]))
+        self.assertIn("(busy)", report["top"][0]["function"])
+        self.assertTrue(report["path"].endswith(".pstats"))
+        self.assertTrue(os.path.exists(report["path"]))
+
+    def test_sampling_profiler(self):
+        profiling = Profiling(output_dir=self.output_dir, profiler=SamplingProfiler(interval=0.001))
+        _, report = profiling.profile(busy, 0.1)
+        self.assertIn("(busy)", report["top"][0]["function"])
+        self.assertGreater(report["top"][0]["samples"], 0)
+        with open(report["path"]) as f:
+            stack, samples = f.readline().rsplit(" ", 1)
+        self.assertIn("(test_sampling_profiler);", stack)
+        self.assertTrue(stack.endswith("(busy)"))
+        self.assertGreater(int(samples), 0)
+
+    def test_one_profile_at_a_time(self):
+        profiling = Profiling()
+
+        def nested():
+            return profiling.profile(busy, 0)
+
+        (result, inner_report), outer_report = profiling.profile(nested)
+        self.assertEqual("done", result)
+        self.assertIsNone(inner_report)
+        self.assertIsNotNone(outer_report)
+        self.assertFalse(profiling.active)
+
+    def test_failure_ends_profile(self):
+        profiling = Profiling()
+        self.assertRaises(ZeroDivisionError, profiling.profile, lambda: 1 / 0)
+        self.assertIsNotNone(profiling.profile(busy, 0)[1])
+
+    def test_profiler_failure_keeps_result(self):
+        class UnsavableProfiler(CProfiler):
+            def save(self, stats, path):
+                raise OSError("no space left on device")
+
+        profiling = Profiling(output_dir=self.output_dir, profiler=UnsavableProfiler())
+        self.assertEqual(("done", None), profiling.profile(busy, 0))
+        self.assertFalse(profiling.active)
+        self.assertRaises(ZeroDivisionError, profiling.profile, lambda: 1 / 0)
+        self.assertFalse(profiling.active)
+
+    def test_from_environment(self):
+        self.assertIsNone(from_environment({}))
+        profiling = from_environment({"ADK_PROFILE": "10", "ADK_PROFILER": "sampling",
+                                      "ADK_PROFILE_DIR": self.output_dir})
+        self.assertEqual(10, profiling.every)
+        self.assertIsInstance(profiling.profiler, SamplingProfiler)
+        self.assertEqual(self.output_dir, profiling.output_dir)
+        self.assertIsInstance(from_environment({"ADK_PROFILE": "0"}).profiler, CProfiler)
+        self.assertRaises(Exception, from_environment, {"ADK_PROFILE": "often"})
+        self.assertRaises(Exception, from_environment, {"ADK_PROFILE": "1", "ADK_PROFILER": "perf"})
+
+    def test_add_metadata(self):
+        response = json.loads(add_metadata(format_response({"a": 1}), {"profile": {"seconds": 1}}))
+        self.assertEqual({"content_type": "json", "profile": {"seconds": 1}}, response["metadata"])
+        binary = add_metadata(BinaryResponse(b"data"), {"profile": {"seconds": 1}})
+        self.assertEqual({"content_type": "binary", "profile": {"seconds": 1}}, json.loads(str(binary))["metadata"])
+        error = add_metadata(create_exception(Exception("failed")), {"profile": {"seconds": 1}})
+        self.assertIsInstance(error, ErrorResponse)
+        self.assertEqual({"profile": {"seconds": 1}}, json.loads(error)["metadata"])
+
+
+if __name__ == '__main__':
+    unittest.main()
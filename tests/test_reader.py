@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+from queue import Empty
+from adk.metrics import Metrics
+from adk.reader import StdinReader, EOF, SHED
+
+
+class ReaderTest(unittest.TestCase):
+    def read_all(self, reader):
+        lines = []
+        while True:
+            line = reader.get()
+            if line is EOF:
+                return lines
+            lines.append(line)
+
+    def test_unbounded(self):
+        reader = StdinReader(["a", "b", "c"])
+        self.assertEqual(["a", "b", "c"], self.read_all(reader))
+        # the end of the stream is seen by every later call too
+        self.assertIs(EOF, reader.get(timeout=0))
+
+    def test_reject_newest(self):
+        reader = StdinReader(["a", "b", "c", "d", "e"], max_queued=2, policy="reject_newest")
+        reader.thread.join()
+        self.assertEqual(["a", "b", SHED, SHED, SHED], self.read_all(reader))
+        self.assertEqual(3, reader.shed)
+
+    def test_shed_oldest(self):
+        reader = StdinReader(["a", "b", "c", "d", "e"], max_queued=2, policy="shed_oldest")
+        reader.thread.join()
+        self.assertEqual([SHED, SHED, SHED, "d", "e"], self.read_all(reader))
+
+    def test_block(self):
+        depths = []
+        started = threading.Event()
+
+        def stream():
+            # the reader starts reading as it's constructed
+            started.wait()
+            for line in ("a", "b", "c", "d", "e"):
+                depths.append(reader.queued)
+                yield line
+
+        reader = StdinReader(stream(), max_queued=2, policy="block")
+        started.set()
+        time.sleep(0.05)
+        # reading stops once the queue is full
+        self.assertEqual(2, reader.queued)
+        self.assertEqual(["a", "b", "c", "d", "e"], self.read_all(reader))
+        self.assertLessEqual(max(depths), 2)
+
+    def test_timeout(self):
+        release = threading.Event()
+
+        def stream():
+            release.wait()
+            yield "a"
+
+        reader = StdinReader(stream())
+        self.assertRaises(Empty, reader.get, 0)
+        self.assertRaises(Empty, reader.get, 0.01)
+        release.set()
+        line, received = reader.get_entry(timeout=1)
+        self.assertEqual("a", line)
+        self.assertLessEqual(received, time.monotonic())
+
+    def test_metrics(self):
+        metrics = Metrics()
+        reader = StdinReader(["a", "b", "c"], max_queued=1, policy="reject_newest", metrics=metrics)
+        reader.thread.join()
+        self.assertEqual(1, metrics.snapshot()["gauges"]["queue_depth"])
+        self.read_all(reader)
+        snapshot = metrics.snapshot()
+        self.assertEqual(1, snapshot["phases"]["queue_wait"]["count"])
+        self.assertEqual(0, snapshot["gauges"]["queue_depth"])
+
+    def test_file_descriptor(self):
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, "a\n\nnaïve\nlast".encode("utf-8"))
+        os.close(write_fd)
+        # a byte at a time, so the two byte character is split across reads
+        with mock.patch("adk.reader.READ_SIZE", 1), os.fdopen(read_fd) as stream:
+            reader = StdinReader(stream)
+            reader.thread.join()
+        self.assertEqual(["a\n", "\n", "naïve\n", "last"], self.read_all(reader))
+
+    def test_shed_requests_are_bounded(self):
+        for policy in ("reject_newest", "shed_oldest"):
+            reader = StdinReader((str(i) for i in range(1000)), max_queued=2, policy=policy, max_shed=4)
+            time.sleep(0.05)
+            # reading stops while the shed requests wait for their responses
+            self.assertTrue(reader.thread.is_alive())
+            self.assertEqual(6, len(reader.entries))
+            lines = self.read_all(reader)
+            self.assertEqual(1000, len(lines))
+            self.assertEqual(reader.shed, lines.count(SHED))
+
+    def test_invalid_policy(self):
+        self.assertRaises(Exception, StdinReader, [], 1, "drop")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import json
+import mmap
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from importlib.util import spec_from_file_location, module_from_spec
+from unittest import mock
+import numpy as np
+from adk.modeldata import md5_for_str
+from adk.snapshot import Snapshot
+from tests.AdkTest import ADKTest
+from tests.fake_data_api import FakeClient
+
+
+def apply_weights(input, state):
+    return float(state["weights"].sum())
+
+
+class JsonSerializer(object):
+    def dumps(self, state):
+        return json.dumps(state).encode("utf-8")
+
+    def loads(self, data):
+        return json.loads(data.decode("utf-8"))
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.files = {"data://test/model.bin": b"model file"}
+        self.client = FakeClient(self.files)
+        self.manifest_path = os.path.join(self.workdir, "model_manifest.json")
+        self.write_manifest()
+        self.snapshot_path = os.path.join(self.workdir, "state.snapshot")
+        self.load_calls = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def write_manifest(self, **manifest_fields):
+        manifest = {"required_files": [{"name": "model", "source_uri": "data://test/model.bin", "fail_on_tamper": True,
+                                        "md5_checksum": md5_for_str("model file")}],
+                    "optional_files": []}
+        manifest.update(manifest_fields)
+        with open(self.manifest_path, "w") as f:
+            json.dump(manifest, f)
+
+    def load_model(self, model_data):
+        self.load_calls += 1
+        with open(model_data.get_model("model"), "rb") as f:
+            model_data["model"] = f.read()
+        model_data["weights"] = np.arange(100000, dtype=np.float64)
+        return model_data
+
+    def start(self, serializer=None, load=None):
+        if load is None:
+            def load(model_data):
+                return self.load_model(model_data)
+        algo = ADKTest(apply_weights, load, client=self.client, manifest_path=self.manifest_path,
+                       snapshot=Snapshot(self.snapshot_path, serializer))
+        algo.load()
+        self.assertIsNone(algo.loading_exception)
+        return algo
+
+    def test_restore_skips_loading(self):
+        self.start()
+        self.assertEqual(1, len(self.client.requests))
+        algo = self.start()
+        self.assertEqual(1, self.load_calls)
+        self.assertEqual(1, len(self.client.requests))
+        self.assertIs(algo.model_data, algo.load_result)
+        self.assertEqual(b"model file", algo.load_result["model"])
+        self.assertEqual(float(np.arange(100000).sum()), json.loads(str(algo.apply(None)))["result"])
+
+    def test_restored_arrays_are_memory_mapped(self):
+        self.start()
+        weights = self.start().load_result["weights"]
+        base = weights
+        while isinstance(base, np.ndarray):
+            base = base.base
+        self.assertIsInstance(base.obj, mmap.mmap)
+        self.assertTrue(weights.flags.writeable)
+        # copy on write, changes don't reach the snapshot
+        weights[0] = 42
+        self.assertEqual(0, self.start().load_result["weights"][0])
+
+    def test_manifest_change_invalidates(self):
+        self.start()
+        self.write_manifest(prefetch="eager")
+        self.start()
+        self.assertEqual(2, self.load_calls)
+        self.start()
+        self.assertEqual(2, self.load_calls)
+
+    def test_load_source_change_invalidates(self):
+        source_path = os.path.join(self.workdir, "algorithm_source.py")
+
+        def import_load(body):
+            with open(source_path, "w") as f:
+                f.write("def load():\n    return {}\n".format(body))
+            spec = spec_from_file_location("algorithm_source", source_path)
+            module = module_from_spec(spec)
+            spec.loader.exec_module(module)
+            return module.load
+
+        self.start(load=import_load('{"version": 1}'))
+        self.assertEqual({"version": 1}, self.start(load=import_load('{"version": 1}')).load_result)
+        self.assertEqual({"version": 2}, self.start(load=import_load('{"version": 2}')).load_result)
+
+    def test_pickle_without_out_of_band_buffers(self):
+        # pythons before 3.8 have no pickle protocol 5
+        with mock.patch.object(pickle, "HIGHEST_PROTOCOL", 4):
+            self.start()
+            algo = self.start()
+        self.assertEqual(1, self.load_calls)
+        self.assertIsNone(algo.snapshot.mapped)
+        self.assertEqual(float(np.arange(100000).sum()), json.loads(str(algo.apply(None)))["result"])
+
+    def test_missing_model_file_is_fetched_again(self):
+        algo = self.start()
+        os.remove(algo.model_data.get_model("model"))
+        algo = self.start()
+        self.assertEqual(1, self.load_calls)
+        with open(algo.model_data.get_model("model"), "rb") as f:
+            self.assertEqual(b"model file", f.read())
+        self.assertEqual(2, len(self.client.requests))
+
+    def test_custom_serializer(self):
+        def load():
+            self.load_calls += 1
+            return {"labels": ["cat", "dog"]}
+
+        self.start(JsonSerializer(), load)
+        algo = self.start(JsonSerializer(), load)
+        self.assertEqual(1, self.load_calls)
+        self.assertEqual({"labels": ["cat", "dog"]}, algo.load_result)
+
+    def test_unserializable_state_still_loads(self):
+        def load():
+            self.load_calls += 1
+            return lambda x: x
+
+        self.start(load=load)
+        self.assertFalse(os.path.exists(self.snapshot_path))
+        self.start(load=load)
+        self.assertEqual(2, self.load_calls)
+
+    def test_corrupt_snapshot_falls_back_to_loading(self):
+        self.start()
+        with open(self.snapshot_path, "wb") as f:
+            f.write(pickle.dumps("not a snapshot"))
+        self.start()
+        self.assertEqual(2, self.load_calls)
+
+
+if __name__ == '__main__':
+    unittest.main()
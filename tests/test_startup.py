@@ -0,0 +1,55 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules that take longer to import than the ADK itself, and are only needed by some algorithms
+DEFERRED_MODULES = ["Algorithmia", "yaml", "asyncio", "multiprocessing"]
+# Generous, so that the test isn't flaky on a loaded machine, the ADK alone imports in well under a tenth of that
+MAX_IMPORT_SECONDS = 0.5
+
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import adk
+import_seconds = time.perf_counter() - start
+from adk import ADK
+algorithm = ADK(lambda input: input)
+algorithm.load()
+print(json.dumps({
+    "import_seconds": import_seconds,
+    "imported": [name for name in %r if name in sys.modules],
+    "phases": algorithm.startup_times.finish(),
+}))
+"""
+
+
+class StartupTest(unittest.TestCase):
+    def start(self, environment=None):
+        # a fresh interpreter, as the rest of the test suite imports everything the ADK defers
+        process = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT % (DEFERRED_MODULES,)], cwd=ROOT,
+                                 env=dict(os.environ, PYTHONPATH=ROOT, **(environment or {})),
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        return json.loads(process.stdout.decode("utf-8").splitlines()[-1]), process.stderr.decode("utf-8")
+
+    def test_heavy_modules_are_deferred(self):
+        result, _ = self.start()
+        self.assertEqual([], result["imported"])
+
+    def test_import_time(self):
+        # the fastest of a few, to leave out one off disk cache misses
+        import_seconds = min(self.start()[0]["import_seconds"] for _ in range(3))
+        self.assertLess(import_seconds, MAX_IMPORT_SECONDS)
+
+    def test_startup_breakdown(self):
+        result, stderr = self.start({"ADK_STARTUP_PROFILE": "1"})
+        for phase in ("adk_import", "construct", "load"):
+            self.assertIn(phase, result["phases"])
+            self.assertGreaterEqual(result["phases"][phase], 0)
+        self.assertIn("adk startup seconds: ", stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()